@@ -0,0 +1,35 @@
+#!/bin/bash
+# Time-to-first-200 for a fresh Ghost container: from `docker start` until the
+# home page first answers 200, over RUNS runs against an already running MySQL.
+# Also prints the boot phase line server-hooks.js logs for each run.
+#
+#   RUNS=5 ./boot-time.sh
+#   GHOST_FAST_BOOT=false ./boot-time.sh    # always seed the content directory
+set -euo pipefail
+cd "$(dirname "$0")"
+. ./lib.sh
+
+RUNS=${RUNS:-5}
+FAST_BOOT=${GHOST_FAST_BOOT:-true}
+URL=${URL:-$BASE_URL/}
+
+export GHOST_FAST_BOOT=$FAST_BOOT
+compose up -d --build
+wait_for_url "$URL"
+
+echo "run time_to_first_200_ms"
+for run in $(seq 1 "$RUNS"); do
+    # a new container with a new content volume each time, against the migrated DB
+    compose rm -sfv ghost > /dev/null
+    compose create ghost > /dev/null 2>&1
+    container=$(compose ps -q ghost)
+    start=$(date +%s%3N)
+    docker start "$container" > /dev/null
+    until [ "$(curl -s -o /dev/null -w '%{http_code}' "$URL")" = 200 ]; do
+        sleep 0.1
+    done
+    echo "$run $(( $(date +%s%3N) - start ))"
+    docker logs "$container" 2>&1 | grep '"msg":"boot"' >&2 || true
+done
+
+compose down -v > /dev/null
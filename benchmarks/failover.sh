@@ -0,0 +1,65 @@
+#!/bin/bash
+# Simulates an RDS Multi-AZ failover against the local stack in docker-compose.yml:
+# requests the home page in a loop, takes MySQL away mid-run and reports how many
+# requests failed and how long Ghost took to recover once MySQL was back.
+#
+#   MODE=kill ./failover.sh      # MySQL is killed and restarted (connections reset)
+#   MODE=pause ./failover.sh     # MySQL stops answering for OUTAGE seconds (connections hang)
+set -euo pipefail
+cd "$(dirname "$0")"
+. ./lib.sh
+
+URL=${URL:-$BASE_URL/}
+MODE=${MODE:-kill}
+DURATION=${DURATION:-60}
+FAILOVER_AT=${FAILOVER_AT:-15}
+OUTAGE=${OUTAGE:-10}
+COMPOSE="docker-compose -f docker-compose.yml"
+LOG=$(mktemp)
+
+$COMPOSE up -d --build
+echo "Waiting for Ghost at $URL"
+wait_for_url "$URL"
+
+# Draw traffic for the whole run, one line per request: <epoch ms> <status>
+(
+    end=$(( $(date +%s) + DURATION ))
+    while [ "$(date +%s)" -lt "$end" ]; do
+        code=$(curl -s -o /dev/null -w '%{http_code}' --max-time 10 "$URL" || true)
+        echo "$(date +%s%3N) $code" >> "$LOG"
+    done
+) &
+load=$!
+
+sleep "$FAILOVER_AT"
+outage_start=$(date +%s%3N)
+if [ "$MODE" = 'pause' ]; then
+    $COMPOSE pause mysql
+    sleep "$OUTAGE"
+    $COMPOSE unpause mysql
+else
+    $COMPOSE kill mysql
+    sleep "$OUTAGE"
+    $COMPOSE start mysql
+fi
+outage_end=$(date +%s%3N)
+echo "MySQL was unavailable for $(( outage_end - outage_start ))ms"
+
+wait "$load"
+
+awk -v start="$outage_start" -v end="$outage_end" '
+    { total++ }
+    $2 != 200 { errors++ }
+    $1 > end && $2 != 200 { after++; last_error = $1 }
+    $1 > end && $2 == 200 && !first_ok { first_ok = $1 }
+    END {
+        printf "requests=%d errors=%d errors_after_recovery=%d\n", total, errors, after
+        if (first_ok) printf "first_success_after_recovery=%dms\n", first_ok - end
+        if (last_error) printf "last_error_after_recovery=%dms\n", last_error - end
+    }' "$LOG"
+
+echo "Pool flushes logged by Ghost:"
+$COMPOSE logs ghost | grep -c 'Flushing the MySQL connection pool' || true
+
+rm -f "$LOG"
+[ "${KEEP:-false}" = 'true' ] || $COMPOSE down -v
@@ -0,0 +1,27 @@
+# Shared helpers for the benchmark scripts in this folder
+
+BASE_URL=${BASE_URL:-http://localhost:2368}
+
+# compose <compose args...>
+compose() {
+    docker-compose "$@"
+}
+
+# wait_for_url <url> - waits up to 4 minutes for a 200
+wait_for_url() {
+    for i in $(seq 1 120); do
+        curl -sf -o /dev/null "$1" && return 0
+        sleep 2
+    done
+    echo "Timed out waiting for $1" >&2
+    return 1
+}
+
+# ab_rps <url> <requests> <concurrency> - prints requests per second
+ab_rps() {
+    if command -v ab > /dev/null; then
+        ab -q -k -n "$2" -c "$3" "$1"
+    else
+        docker run --rm --network host httpd:2.4-alpine ab -q -k -n "$2" -c "$3" "$1"
+    fi | awk '/^Requests per second/ { print $4 }'
+}
@@ -0,0 +1,45 @@
+#!/bin/bash
+# Builds the Ghost image, starts it against MySQL with docker-compose.yml and
+# runs loadgen.py's mix of home, post, tag, RSS and asset requests. The JSON
+# report is written to results/<timestamp>.json and compared against
+# baseline.json, failing if the total throughput or latency, or a request
+# kind's p95/p99 latency, regressed by more than TOLERANCE. A kind needs
+# MIN_SAMPLES requests in both runs to be gated. If there is no baseline.json
+# yet the report becomes it (commit it to keep it).
+#
+#   ./load-test.sh
+#   DURATION=60 CONCURRENCY=50 ./load-test.sh
+#   UPDATE_BASELINE=true ./load-test.sh    # replace the baseline with this run
+set -euo pipefail
+cd "$(dirname "$0")"
+. ./lib.sh
+
+DURATION=${DURATION:-30}
+WARMUP=${WARMUP:-10}
+CONCURRENCY=${CONCURRENCY:-20}
+MIX=${MIX:-home=40,post=30,tag=10,rss=10,asset=10}
+TOLERANCE=${TOLERANCE:-0.1}
+MIN_SAMPLES=${MIN_SAMPLES:-200}
+UPDATE_BASELINE=${UPDATE_BASELINE:-false}
+REPORT=results/$(date +%Y%m%d-%H%M%S).json
+
+BASELINE_ARGS=""
+if [ -f baseline.json ] && [ "$UPDATE_BASELINE" != 'true' ]; then
+    BASELINE_ARGS="--baseline baseline.json --tolerance $TOLERANCE --min-samples $MIN_SAMPLES"
+fi
+
+mkdir -p results
+compose up -d --build
+wait_for_url "$BASE_URL/"
+
+status=0
+./loadgen.py --url "$BASE_URL" --duration "$DURATION" --warmup "$WARMUP" \
+    --concurrency "$CONCURRENCY" --mix "$MIX" --output "$REPORT" $BASELINE_ARGS || status=$?
+compose down -v > /dev/null
+echo "Report written to $REPORT"
+
+if [ -z "$BASELINE_ARGS" ]; then
+    cp "$REPORT" baseline.json
+    echo "Saved as the baseline"
+fi
+exit $status
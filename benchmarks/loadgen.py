@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# Async HTTP load driver for the local Ghost stack in docker-compose.yml
+#
+# Replays a weighted mix of home, post, tag, RSS and asset requests from
+# --concurrency keep-alive connections for --duration seconds and writes
+# throughput, p50/p95/p99 latency and error rate, overall and per request
+# kind, as JSON. With --baseline it compares the run against a stored report
+# and exits 1 if the total throughput, latency or error rate, or a request
+# kind's p95/p99 latency or error rate, got worse by more than --tolerance.
+# A kind is only gated when both runs have --min-samples requests of it; its
+# throughput is shown but never gated, since over a short run it is mostly noise.
+#
+# Only uses the standard library (Python 3.6+).
+#
+#   ./loadgen.py --url http://localhost:2368 --duration 30 --output report.json
+#   ./loadgen.py --baseline baseline.json
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import time
+from urllib.parse import urljoin, urlsplit
+
+DEFAULT_MIX = "home=40,post=30,tag=10,rss=10,asset=10"
+
+# Used when the home page doesn't link to one (a fresh Ghost 1.x install has these)
+FALLBACK_PATHS = {
+    "home": ["/"],
+    "post": ["/welcome/"],
+    "tag": ["/tag/getting-started/"],
+    "rss": ["/rss/"],
+    "asset": ["/favicon.ico"],
+}
+
+# (metric, whether higher is better) compared against the baseline
+COMPARED_METRICS = [
+    ("requests_per_second", True),
+    ("p50_ms", False),
+    ("p95_ms", False),
+    ("p99_ms", False),
+    ("error_rate", False),
+]
+
+# The metrics that can fail the run for a single request kind
+GATED_BY_KIND = ("p95_ms", "p99_ms", "error_rate")
+
+
+class IdleConnectionClosed(ConnectionError):
+    """The server closed the connection before sending a status line."""
+
+
+class Connection(object):
+    """A keep-alive HTTP/1.1 connection that reconnects when the server closes it."""
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def get(self, path):
+        """Requests a path and reads the whole response. Returns the status code.
+
+        A server may close an idle keep-alive connection just as the request is
+        sent on it, so a reused connection that is closed before the status line
+        is retried once on a new one rather than counted as an error.
+        """
+        reused = self.writer is not None
+        try:
+            return await self.request(path)
+        except IdleConnectionClosed:
+            if not reused:
+                raise
+        return await self.request(path)
+
+    async def request(self, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout)
+
+        request = "GET {} HTTP/1.1\r\nHost: {}:{}\r\nUser-Agent: ghost-loadgen\r\n" \
+                  "Accept-Encoding: identity\r\n\r\n".format(path, self.host, self.port)
+        try:
+            self.writer.write(request.encode("ascii"))
+            return await asyncio.wait_for(self.read_response(), self.timeout)
+        except Exception:
+            await self.close()
+            raise
+
+    async def read_response(self):
+        try:
+            status_line = await self.reader.readline()
+        except ConnectionResetError:
+            status_line = b""
+        if not status_line:
+            raise IdleConnectionClosed("connection closed by server")
+        version, status = status_line.split()[:2]
+        status = int(status)
+
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        # HTTP/1.0 connections close after the response unless the server says otherwise
+        connection = headers.get("connection", "").lower()
+        if version == b"HTTP/1.0" and connection != "keep-alive":
+            connection = "close"
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif "content-length" in headers:
+            await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            await self.reader.read()
+            connection = "close"
+
+        if connection == "close":
+            await self.close()
+        return status
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    """samples are (latency ms, ok) pairs."""
+    latencies = sorted(latency for latency, _ in samples)
+    errors = sum(1 for _, ok in samples if not ok)
+
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / float(len(samples)), 4) if samples else 0.0,
+        "requests_per_second": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+    }
+
+
+def parse_mix(mix):
+    weights = {}
+    for item in mix.split(","):
+        kind, _, weight = item.partition("=")
+        if kind not in FALLBACK_PATHS:
+            raise ValueError("Unknown request kind {} (expected one of {})".format(kind, ", ".join(FALLBACK_PATHS)))
+        weights[kind] = float(weight)
+    return weights
+
+
+async def discover(base_url, timeout):
+    """Finds post, tag and asset paths to request from the links on the home page."""
+    split = urlsplit(base_url)
+    paths = {kind: list(fallback) for kind, fallback in FALLBACK_PATHS.items()}
+
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(split.hostname, split.port or 80), timeout)
+        writer.write("GET / HTTP/1.0\r\nHost: {}\r\n\r\n".format(split.netloc).encode("ascii"))
+        html = (await asyncio.wait_for(reader.read(), timeout)).decode("utf-8", "replace")
+        writer.close()
+    except Exception as err:
+        print("Could not read the home page ({}), using the default paths".format(err), file=sys.stderr)
+        return paths
+
+    links = set()
+    for href in re.findall(r'(?:href|src)="([^"]+)"', html):
+        url = urlsplit(urljoin(base_url + "/", href))
+        if url.netloc == split.netloc:
+            links.add(url.path + ("?" + url.query if url.query else ""))
+
+    posts = sorted(link for link in links if re.match(r"^/[\w-]+/$", link) and link not in ("/rss/", "/ghost/"))
+    tags = sorted(link for link in links if link.startswith("/tag/"))
+    assets = sorted(link for link in links if link.startswith(("/assets/", "/public/", "/content/images/")))
+
+    for kind, found in (("post", posts), ("tag", tags), ("asset", assets)):
+        if found:
+            paths[kind] = found
+    return paths
+
+
+async def worker(connection, plan, deadline, samples, warmup_until):
+    while time.time() < deadline:
+        kind, path = plan()
+        start = time.perf_counter()
+        try:
+            ok = (await connection.get(path)) < 400
+        except Exception:
+            ok = False
+        latency = (time.perf_counter() - start) * 1000.0
+        if time.time() >= warmup_until:
+            samples.setdefault(kind, []).append((latency, ok))
+    await connection.close()
+
+
+async def run(args):
+    split = urlsplit(args.url)
+    weights = parse_mix(args.mix)
+    paths = await discover(args.url.rstrip("/"), args.timeout)
+    rng = random.Random(args.seed)
+    kinds = [kind for kind in weights if weights[kind] > 0]
+
+    def plan():
+        kind = rng.choices(kinds, [weights[k] for k in kinds])[0]
+        return kind, rng.choice(paths[kind])
+
+    samples = {}
+    start = time.time()
+    warmup_until = start + args.warmup
+    deadline = warmup_until + args.duration
+    await asyncio.gather(*[
+        worker(Connection(split.hostname, split.port or 80, args.timeout), plan, deadline, samples, warmup_until)
+        for _ in range(args.concurrency)
+    ])
+    elapsed = time.time() - warmup_until
+
+    return {
+        "url": args.url,
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "mix": weights,
+        "paths": {kind: paths[kind] for kind in kinds},
+        "total": summarize([sample for kind in samples for sample in samples[kind]], elapsed),
+        "by_kind": {kind: summarize(samples[kind], elapsed) for kind in sorted(samples)},
+    }
+
+
+def compare(report, baseline, tolerance, min_samples):
+    """Prints the change from the baseline. Returns the metrics that regressed."""
+    regressions = []
+    rows = [("scope", "metric", "baseline", "current", "change")]
+
+    for setting in ("url", "concurrency", "duration_s", "mix"):
+        if baseline.get(setting) != report[setting]:
+            print("Note: {} differs from the baseline ({} vs {})".format(setting, report[setting], baseline.get(setting)),
+                  file=sys.stderr)
+
+    scopes = [("total", report["total"], baseline.get("total", {}))]
+    scopes += [(kind, report["by_kind"][kind], baseline.get("by_kind", {}).get(kind, {})) for kind in report["by_kind"]]
+    for scope, current, previous in scopes:
+        for metric, higher_is_better in COMPARED_METRICS:
+            if metric not in previous:
+                continue
+            before, after = previous[metric], current[metric]
+            change = (after - before) / before if before else (0.0 if after == before else float("inf"))
+            worse = -change if higher_is_better else change
+            # error rates are compared absolutely, a relative change from ~0 means nothing
+            if metric == "error_rate":
+                worse = after - before
+            gated = scope == "total" or (metric in GATED_BY_KIND and
+                                         min(current["requests"], previous.get("requests", 0)) >= min_samples)
+            flag = ""
+            if worse > tolerance and gated:
+                regressions.append("{} {}".format(scope, metric))
+                flag = " REGRESSION"
+            elif worse > tolerance:
+                flag = " (not gated)"
+            rows.append((scope, metric, str(before), str(after), "{:+.1%}{}".format(change, flag)))
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays a mix of Ghost page requests and reports throughput and latency")
+    parser.add_argument("--url", default="http://localhost:2368", help="Ghost's URL")
+    parser.add_argument("--duration", type=int, default=30, help="seconds to measure for, after the warm-up")
+    parser.add_argument("--warmup", type=int, default=5, help="seconds of load before measuring")
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent keep-alive connections")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds before a request counts as an error")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weights of each request kind (default %(default)s)")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the request order")
+    parser.add_argument("--output", help="write the JSON report here (default stdout)")
+    parser.add_argument("--baseline", help="a previous report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="how much worse (fraction) a metric can get before it is a regression")
+    parser.add_argument("--min-samples", type=int, default=200,
+                        help="requests of a kind both runs need before its latency and errors are gated")
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    report = loop.run_until_complete(run(args))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.min_samples)
+        if regressions:
+            print("Regressed against {}: {}".format(args.baseline, ", ".join(regressions)), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
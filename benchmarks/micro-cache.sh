@@ -0,0 +1,32 @@
+#!/bin/bash
+# Compares requests per second for anonymous page views with and without the
+# nginx micro-cache sidecar, using the local stack in docker-compose.yml.
+#
+#   REQUESTS=5000 CONCURRENCY=50 ./micro-cache.sh
+set -euo pipefail
+cd "$(dirname "$0")"
+. ./lib.sh
+
+REQUESTS=${REQUESTS:-5000}
+CONCURRENCY=${CONCURRENCY:-50}
+# the home page and the post Ghost creates on a fresh install
+PAGES=${PAGES:-"/ /welcome/"}
+
+bench() {
+    local label=$1
+    shift
+    compose "$@" up -d --build
+    wait_for_url "$BASE_URL/"
+    for page in $PAGES; do
+        # one request to fill the cache (or warm Ghost's templates) before measuring
+        curl -s -o /dev/null "$BASE_URL$page"
+        echo "$label $page $(ab_rps "$BASE_URL$page" "$REQUESTS" "$CONCURRENCY")"
+    done
+    compose "$@" down -v > /dev/null
+}
+
+{
+    echo "setup page requests_per_second"
+    bench baseline -f docker-compose.yml
+    bench micro-cache -f docker-compose.yml -f docker-compose.micro-cache.yml
+} | column -t
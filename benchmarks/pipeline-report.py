@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# Stage timing percentiles of the Ghost CodePipeline from exported events
+#
+# Reads CodePipeline execution state change events (EventBridge JSON) and pairs
+# each pipeline, stage and action's STARTED event with the event that finished
+# it. Prints the count and p50/p90/p95/max duration of each, for the executions
+# that ended in --state (default SUCCEEDED).
+#
+# The pipeline's metrics Lambda logs every event it gets as one JSON line, so
+# its log group is the easiest export:
+#
+#   aws logs filter-log-events --log-group-name /aws/lambda/<PipelineMetricsFunction> \
+#       --filter-pattern '"execution-id"' > events.json
+#   ./pipeline-report.py events.json
+#
+# Files can also hold a JSON array of events or one event per line. Only uses
+# the standard library (Python 3.6+).
+
+import argparse
+import json
+import sys
+from datetime import datetime
+
+FINISHED = ("SUCCEEDED", "FAILED", "CANCELED", "STOPPED", "SUPERSEDED", "ABANDONED")
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def parse_events(text):
+    """Returns the CodePipeline events in an export, whichever form it is in."""
+    text = text.strip()
+    if not text:
+        return []
+    try:
+        documents = [json.loads(text)]
+    except ValueError:
+        documents = [json.loads(line) for line in text.splitlines() if line.strip().startswith("{")]
+
+    found = []
+    for document in documents:
+        if isinstance(document, dict) and "events" in document:
+            # aws logs filter-log-events output, one Lambda log line per message
+            for log_event in document["events"]:
+                message = log_event["message"].strip()
+                if message.startswith("{"):
+                    found.extend(parse_events(message))
+        elif isinstance(document, list):
+            found.extend(document)
+        else:
+            found.append(document)
+    return [event for event in found
+            if isinstance(event, dict) and event.get("source") == "aws.codepipeline" and "detail" in event]
+
+
+def durations(events):
+    """Returns {(scope, final state): [seconds, ...]} for each finished execution of a scope.
+
+    The scope is "pipeline", "<stage>" or "<stage>/<action>".
+    """
+    started = {}
+    finished = {}
+    for event in events:
+        detail = event["detail"]
+        key = (detail["execution-id"], detail.get("stage"), detail.get("action"))
+        when = datetime.strptime(event["time"], "%Y-%m-%dT%H:%M:%SZ")
+        if detail["state"] in ("STARTED", "RESUMED"):
+            # a retried stage keeps the time of its first start
+            started[key] = min(when, started.get(key, when))
+        elif detail["state"] in FINISHED:
+            finished[key] = (when, detail["state"])
+
+    by_scope = {}
+    for key, (when, state) in finished.items():
+        if key not in started:
+            continue
+        _, stage, action = key
+        scope = "pipeline" if stage is None else stage if action is None else stage + "/" + action
+        by_scope.setdefault((scope, state), []).append((when - started[key]).total_seconds())
+    return by_scope
+
+
+def report(by_scope, state):
+    rows = []
+    for (scope, final_state), seconds in by_scope.items():
+        if final_state != state:
+            continue
+        seconds = sorted(seconds)
+        rows.append({
+            "scope": scope,
+            "count": len(seconds),
+            "p50_s": percentile(seconds, 50),
+            "p90_s": percentile(seconds, 90),
+            "p95_s": percentile(seconds, 95),
+            "max_s": seconds[-1],
+        })
+    # the whole pipeline first, then the stages, each followed by its actions
+    return sorted(rows, key=lambda row: (row["scope"] != "pipeline", row["scope"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prints CodePipeline stage timing percentiles from exported events")
+    parser.add_argument("files", nargs="*", help="event exports (default stdin)")
+    parser.add_argument("--state", default="SUCCEEDED", help="only count executions that ended in this state")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    events = []
+    for name in args.files or ["-"]:
+        with (sys.stdin if name == "-" else open(name)) as f:
+            events.extend(parse_events(f.read()))
+
+    rows = report(durations(events), args.state)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    if not rows:
+        print("No {} executions in {} events".format(args.state, len(events)), file=sys.stderr)
+        sys.exit(1)
+
+    table = [("scope", "count", "p50", "p90", "p95", "max")]
+    table += [(row["scope"], str(row["count"])) + tuple("{:.0f}s".format(row[k]) for k in ("p50_s", "p90_s", "p95_s", "max_s"))
+              for row in rows]
+    widths = [max(len(row[i]) for row in table) for i in range(len(table[0]))]
+    for row in table:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+if __name__ == "__main__":
+    main()
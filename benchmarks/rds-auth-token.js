@@ -0,0 +1,99 @@
+'use strict';
+
+/**
+ * Compares the time to produce an RDS IAM auth token with the in-process
+ * aws-auth signer against shelling out to the AWS CLI (if it is installed).
+ *
+ * A stub ECS credentials endpoint is started on localhost so no AWS account is needed.
+ * Run it inside the Ghost image so aws-auth and its dependencies resolve:
+ *
+ *   docker run --rm -v "$PWD/benchmarks:/benchmarks" \
+ *     -e NODE_PATH=/var/lib/ghost/current/node_modules ghost node /benchmarks/rds-auth-token.js
+ */
+const http = require('http'),
+    childProcess = require('child_process');
+
+const HOST = 'ghost.abcdefghijkl.us-east-1.rds.amazonaws.com',
+    REGION = 'us-east-1',
+    ITERATIONS = parseInt(process.env.ITERATIONS, 10) || 5;
+
+let credentialRequests = 0;
+
+function elapsed(start) {
+    const diff = process.hrtime(start);
+    return Math.round((diff[0] * 1e3 + diff[1] / 1e6) * 100) / 100;
+}
+
+function timeCli() {
+    const samples = [],
+        env = Object.assign({}, process.env, {
+            AWS_ACCESS_KEY_ID: 'AKIDEXAMPLE',
+            AWS_SECRET_ACCESS_KEY: 'wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY'
+        });
+
+    for (let i = 0; i < ITERATIONS; i += 1) {
+        const start = process.hrtime(),
+            result = childProcess.spawnSync('aws', ['rds', 'generate-db-auth-token', '--hostname', HOST,
+                '--port', '3306', '--username', 'ghost', '--region', REGION], {env: env});
+
+        if (result.error) {
+            return null;
+        }
+
+        samples.push(elapsed(start));
+    }
+
+    return samples;
+}
+
+const stub = http.createServer(function (req, res) {
+    credentialRequests += 1;
+    res.setHeader('Content-Type', 'application/json');
+    res.end(JSON.stringify({
+        AccessKeyId: 'ASIAEXAMPLE',
+        SecretAccessKey: 'wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY',
+        Token: 'session-token',
+        Expiration: new Date(Date.now() + 6 * 3600 * 1000).toISOString()
+    }));
+});
+
+stub.listen(0, '127.0.0.1', function () {
+    process.env.AWS_CONTAINER_CREDENTIALS_FULL_URI = 'http://127.0.0.1:' + stub.address().port + '/v2/credentials';
+    delete process.env.AWS_CONTAINER_CREDENTIALS_RELATIVE_URI;
+    delete process.env.AWS_ACCESS_KEY_ID;
+    delete process.env.AWS_SECRET_ACCESS_KEY;
+
+    const start = process.hrtime(),
+        rdsToken = require('aws-auth').rdsToken,
+        provider = rdsToken.forConnection({iamAuth: true, host: HOST, user: 'ghost', region: REGION});
+
+    provider.getToken().then(function (token) {
+        const cold = elapsed(start),
+            warmStart = process.hrtime();
+
+        if (token.indexOf(HOST + ':3306/?Action=connect&DBUser=ghost&') !== 0 ||
+            token.indexOf('X-Amz-Security-Token=session-token') === -1 ||
+            !/X-Amz-Signature=[0-9a-f]{64}$/.test(token)) {
+            throw new Error('Unexpected token format: ' + token);
+        }
+
+        return provider.getToken().then(function () {
+            const warm = elapsed(warmStart);
+
+            provider.stop();
+            stub.close();
+
+            console.log(JSON.stringify({
+                inProcess: {
+                    coldMs: cold,
+                    cachedMs: warm,
+                    credentialRequests: credentialRequests
+                },
+                awsCliMs: timeCli()
+            }, null, 2));
+        });
+    }).catch(function (err) {
+        console.error(err);
+        process.exit(1);
+    });
+});
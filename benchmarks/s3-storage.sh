@@ -0,0 +1,73 @@
+#!/bin/bash
+# Checks the s3 storage adapter against a local MinIO (docker-compose.s3.yml):
+# saves the same image twice and checks both saves return the same content-hash
+# URL, that the URL is served by MinIO with an immutable Cache-Control, that
+# read returns the image and that delete removes it. Prints the save timings.
+#
+#   ./s3-storage.sh
+set -euo pipefail
+cd "$(dirname "$0")"
+. ./lib.sh
+
+FILES="-f docker-compose.yml -f docker-compose.s3.yml"
+
+compose $FILES up -d --build
+wait_for_url "$BASE_URL/"
+
+# Runs in the Ghost container, with the adapter configured like Ghost configures it
+url=$(compose $FILES exec -T ghost node - <<'JS'
+const fs = require('fs'),
+    S3Storage = require('/var/lib/ghost/content/adapters/storage/s3');
+
+const store = new S3Storage({
+        bucket: process.env.storage__s3__bucket,
+        endpoint: process.env.storage__s3__endpoint,
+        assetHost: process.env.storage__s3__assetHost
+    }),
+    image = {name: 'benchmark image.png', path: '/tmp/benchmark.png', type: 'image/png'};
+
+fs.writeFileSync(image.path, Buffer.from('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==', 'base64'));
+
+function timed(label, promise) {
+    const start = Date.now();
+    return promise.then(function (result) {
+        console.error(label + ' ' + (Date.now() - start) + 'ms');
+        return result;
+    });
+}
+
+timed('first_save', store.save(image)).then(function (first) {
+    return timed('repeat_save', store.save(image)).then(function (second) {
+        if (first !== second) {
+            throw new Error('The same image was saved as ' + first + ' and ' + second);
+        }
+        return store.read({path: first});
+    }).then(function (data) {
+        if (!data.equals(fs.readFileSync(image.path))) {
+            throw new Error('read returned different content');
+        }
+        console.log(first);
+    });
+}).catch(function (err) {
+    console.error(err.message);
+    process.exit(1);
+});
+JS
+)
+echo "Saved as $url"
+
+headers=$(curl -sfI "$url")
+echo "$headers" | grep -i '^cache-control: .*immutable' || { echo "FAIL: no immutable Cache-Control on $url"; exit 1; }
+
+compose $FILES exec -T ghost node -e "
+    const S3Storage = require('/var/lib/ghost/content/adapters/storage/s3'),
+        store = new S3Storage({
+            bucket: process.env.storage__s3__bucket,
+            endpoint: process.env.storage__s3__endpoint,
+            assetHost: process.env.storage__s3__assetHost
+        });
+    store.delete('$url').then(() => store.exists('$url')).then((exists) => process.exit(exists ? 1 : 0));
+" || { echo "FAIL: $url was not deleted"; exit 1; }
+
+echo "PASS"
+compose $FILES down -v > /dev/null
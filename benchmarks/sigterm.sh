@@ -0,0 +1,60 @@
+#!/bin/bash
+# Sends Ghost SIGTERM while it is under load (as ECS does when a task is stopped
+# by a deploy or scale-in) and counts the requests that failed.
+#
+# Refused connections are expected once Ghost stops listening - behind the ALB
+# those requests go to another task. Anything else (a reset or empty reply for a
+# request Ghost had already accepted, or a 5xx) is a failed request.
+# Requests go straight to the container's IP (so Linux only) because Docker's
+# port proxy would turn refused connections into empty replies.
+#
+#   ./sigterm.sh                # with the graceful shutdown in server-hooks.js
+#   HOOKS=false ./sigterm.sh    # plain `node current/index.js` for comparison
+set -euo pipefail
+cd "$(dirname "$0")"
+. ./lib.sh
+
+CONCURRENCY=${CONCURRENCY:-10}
+SIGTERM_AFTER=${SIGTERM_AFTER:-10}
+HOOKS=${HOOKS:-true}
+LOG=$(mktemp)
+FILES="-f docker-compose.yml"
+
+if [ "$HOOKS" = 'false' ]; then
+    OVERRIDE=$(mktemp --suffix .yml)
+    printf "version: '2.1'\nservices:\n  ghost:\n    command: [\"node\", \"current/index.js\"]\n" > "$OVERRIDE"
+    FILES="$FILES -f $OVERRIDE"
+fi
+
+compose $FILES up -d --build
+wait_for_url "$BASE_URL/"
+ip=$(docker inspect -f '{{range .NetworkSettings.Networks}}{{.IPAddress}}{{end}}' "$(compose $FILES ps -q ghost)")
+URL="http://$ip:2368/"
+
+# Each worker requests the page until Ghost has gone, logging <curl exit code> <status>
+for i in $(seq 1 "$CONCURRENCY"); do
+    (
+        while true; do
+            code=$(curl -s -o /dev/null -w '%{http_code}' --max-time 30 "$URL") && status=0 || status=$?
+            echo "$status $code" >> "$LOG"
+            [ "$status" = 7 ] && break
+        done
+    ) &
+done
+
+sleep "$SIGTERM_AFTER"
+echo "Sending SIGTERM to Ghost"
+start=$(date +%s%3N)
+compose $FILES kill -s SIGTERM ghost
+wait
+compose $FILES logs ghost | grep -E 'server-hooks|shut' || true
+echo "Ghost stopped serving $(( $(date +%s%3N) - start ))ms after SIGTERM"
+
+awk '
+    $1 == 0 && $2 < 500 { ok++; next }
+    $1 == 7 { refused++; next }
+    { failed++ }
+    END { printf "ok=%d refused=%d failed=%d\n", ok, refused, failed }' "$LOG"
+
+rm -f "$LOG" ${OVERRIDE:-}
+compose $FILES down -v > /dev/null
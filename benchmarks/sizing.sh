@@ -0,0 +1,80 @@
+#!/bin/bash
+# Runs the same load against Ghost at several Fargate task sizes (emulated by
+# limiting the container's CPUs and memory) and reports the requests per
+# second and the requests per dollar on regular Fargate and Fargate Spot.
+# Each size runs one Ghost worker per whole vCPU, as ghost-cluster.js does.
+#
+#   ./sizing.sh
+#   SIZES="512:1024 1024:2048" REQUESTS=10000 ./sizing.sh
+#
+# SIZES are TaskCpu:TaskMemory pairs as in ghost-deploy-fargate.template. The
+# prices default to us-east-1 Linux on-demand Fargate, x86 (VCPU_HOUR, GB_HOUR)
+# and ARM (ARM_VCPU_HOUR, ARM_GB_HOUR); Spot is usually about 70% cheaper but
+# varies, so set SPOT_DISCOUNT to what you see.
+#
+# ARCHES (amd64 and/or arm64, default this host's) picks the image
+# architectures to run (via DOCKER_DEFAULT_PLATFORM), i.e. the
+# CpuArchitecture to compare. An architecture
+# other than the host's runs under emulation, which says nothing about how
+# fast it is on Fargate, so compare them by running this on an x86 and a
+# Graviton host (e.g. an m6i and an m6g EC2 instance) and putting the
+# requests_per_usd columns side by side.
+set -euo pipefail
+cd "$(dirname "$0")"
+. ./lib.sh
+
+SIZES=${SIZES:-"256:512 512:1024 1024:2048 2048:4096"}
+REQUESTS=${REQUESTS:-5000}
+CONCURRENCY=${CONCURRENCY:-50}
+PAGE=${PAGE:-/}
+VCPU_HOUR=${VCPU_HOUR:-0.04048}
+GB_HOUR=${GB_HOUR:-0.004445}
+ARM_VCPU_HOUR=${ARM_VCPU_HOUR:-0.03238}
+ARM_GB_HOUR=${ARM_GB_HOUR:-0.00356}
+SPOT_DISCOUNT=${SPOT_DISCOUNT:-0.7}
+FILES="-f docker-compose.yml -f docker-compose.workers.yml -f docker-compose.arch.yml"
+
+case $(uname -m) in
+    aarch64|arm64) HOST_ARCH=arm64 ;;
+    *) HOST_ARCH=amd64 ;;
+esac
+ARCHES=${ARCHES:-$HOST_ARCH}
+for arch in $ARCHES; do
+    if [ "$arch" != "$HOST_ARCH" ]; then
+        echo "Warning: $arch runs emulated on this $HOST_ARCH host, its numbers aren't comparable" >&2
+    fi
+done
+
+{
+    echo "arch cpu memory workers requests_per_second usd_per_hour requests_per_usd spot_requests_per_usd"
+    for arch in $ARCHES; do
+        if [ "$arch" = arm64 ]; then
+            # see docker-compose.arch.yml
+            export MYSQL_IMAGE=${ARM_MYSQL_IMAGE:-mariadb:10.3}
+            vcpu_hour=$ARM_VCPU_HOUR gb_hour=$ARM_GB_HOUR
+        else
+            unset MYSQL_IMAGE
+            vcpu_hour=$VCPU_HOUR gb_hour=$GB_HOUR
+        fi
+        for size in $SIZES; do
+            cpu=${size%:*}
+            memory=${size#*:}
+            export GHOST_CPUS=$(awk "BEGIN { print $cpu / 1024 }")
+            export GHOST_MEMORY=${memory}m
+            export GHOST_WORKERS=$(( cpu >= 1024 ? cpu / 1024 : 1 ))
+
+            DOCKER_DEFAULT_PLATFORM=linux/$arch compose $FILES up -d --build > /dev/null 2>&1
+            wait_for_url "$BASE_URL$PAGE"
+            # warm every worker's template cache before measuring
+            ab_rps "$BASE_URL$PAGE" $(( GHOST_WORKERS * 20 )) "$GHOST_WORKERS" > /dev/null
+            rps=$(ab_rps "$BASE_URL$PAGE" "$REQUESTS" "$CONCURRENCY")
+            compose $FILES down -v > /dev/null 2>&1
+
+            awk -v arch="$arch" -v cpu="$cpu" -v memory="$memory" -v workers="$GHOST_WORKERS" -v rps="$rps" \
+                -v vcpu_hour="$vcpu_hour" -v gb_hour="$gb_hour" -v spot="$SPOT_DISCOUNT" 'BEGIN {
+                cost = cpu / 1024 * vcpu_hour + memory / 1024 * gb_hour
+                printf "%s %s %s %s %s %.5f %.0f %.0f\n", arch, cpu, memory, workers, rps, cost, rps * 3600 / cost, rps * 3600 / (cost * (1 - spot))
+            }'
+        done
+    done
+} | column -t
@@ -0,0 +1,91 @@
+#!/bin/bash
+# Checks real knex transactions against the patched mysql2 dialect (the image's
+# knex, against the MySQL in docker-compose.yml). A transaction's client is
+# built by knex rather than the dialect, so this runs inserts and reads inside
+# a committed and a rolled back transaction, with a read replica configured
+# (MySQL's IP, so the replica routing is active) and query stats on. Fails if
+# any of them throws or the rows don't match.
+#
+#   ./transactions.sh
+set -euo pipefail
+cd "$(dirname "$0")"
+. ./lib.sh
+
+compose up -d --build
+wait_for_url "$BASE_URL/"
+
+# Runs in the Ghost container, connecting the way Ghost does
+status=0
+compose exec -T ghost node - <<'JS' || status=$?
+const dns = require('dns'),
+    knex = require('/var/lib/ghost/current/node_modules/knex');
+
+function check(condition, message) {
+    if (!condition) {
+        throw new Error(message);
+    }
+}
+
+dns.lookup(process.env.database__connection__host, function (err, replicaHost) {
+    if (err) {
+        console.error(err.message);
+        process.exit(1);
+    }
+
+    const db = knex({
+        client: 'mysql2',
+        connection: {
+            host: process.env.database__connection__host,
+            user: process.env.database__connection__user,
+            password: process.env.database__connection__password,
+            database: process.env.database__connection__database,
+            ssl: 'false'
+        },
+        pool: {min: '1', max: '2'},
+        replicas: {hosts: replicaHost},
+        queryStats: {intervalMillis: 60000}
+    });
+
+    db.schema.dropTableIfExists('transaction_check').then(function () {
+        return db.schema.createTable('transaction_check', function (table) {
+            table.increments('id');
+            table.string('name');
+        });
+    }).then(function () {
+        return db.transaction(function (trx) {
+            return trx('transaction_check').insert({name: 'committed'}).then(function () {
+                return trx('transaction_check').select('name');
+            }).then(function (rows) {
+                check(rows.length === 1, 'a read in the transaction missed its own insert');
+                return trx('transaction_check').first('name').forUpdate();
+            });
+        });
+    }).then(function () {
+        return db.transaction(function (trx) {
+            return trx('transaction_check').insert({name: 'rolled back'}).then(function () {
+                throw new Error('roll back');
+            });
+        }).catch(function (err) {
+            check(err.message === 'roll back', 'the rolled back transaction failed with ' + err.message);
+        });
+    }).then(function () {
+        return db('transaction_check').pluck('name');
+    }).then(function (names) {
+        check(names.length === 1 && names[0] === 'committed', 'expected only the committed row, got ' + JSON.stringify(names));
+        return db.schema.dropTable('transaction_check');
+    }).then(function () {
+        console.log('transactions ok');
+        return db.destroy();
+    }).catch(function (err) {
+        console.error(err.stack);
+        process.exit(1);
+    });
+});
+JS
+compose down -v > /dev/null
+
+if [ "$status" -ne 0 ]; then
+    echo "FAIL"
+    exit 1
+fi
+echo "PASS"
@@ -0,0 +1,36 @@
+#!/bin/bash
+# Compares requests per second for anonymous page views with one Ghost process
+# and with GHOST_WORKERS clustered workers (ghost-cluster.js), with the container
+# limited to GHOST_CPUS CPUs like a 2 vCPU Fargate task.
+#
+#   REQUESTS=5000 CONCURRENCY=50 ./workers.sh
+#   GHOST_CPUS=4 WORKERS=4 ./workers.sh
+set -euo pipefail
+cd "$(dirname "$0")"
+. ./lib.sh
+
+REQUESTS=${REQUESTS:-5000}
+CONCURRENCY=${CONCURRENCY:-50}
+WORKERS=${WORKERS:-2}
+export GHOST_CPUS=${GHOST_CPUS:-2}
+# the home page and the post Ghost creates on a fresh install
+PAGES=${PAGES:-"/ /welcome/"}
+FILES="-f docker-compose.yml -f docker-compose.workers.yml"
+
+bench() {
+    export GHOST_WORKERS=$1
+    compose $FILES up -d --build
+    wait_for_url "$BASE_URL/"
+    for page in $PAGES; do
+        # warm every worker's template cache before measuring
+        ab_rps "$BASE_URL$page" $(( GHOST_WORKERS * 20 )) "$GHOST_WORKERS" > /dev/null
+        echo "$GHOST_WORKERS $page $(ab_rps "$BASE_URL$page" "$REQUESTS" "$CONCURRENCY")"
+    done
+    compose $FILES down -v > /dev/null
+}
+
+{
+    echo "workers page requests_per_second"
+    bench 1
+    bench "$WORKERS"
+} | column -t
@@ -2,8 +2,8 @@
 # By Jason Umiker (jason.umiker@gmail.com)
 
 from troposphere import Template, Ref, Output, GetAtt, Export, Sub, \
-    Parameter, Join, iam, logs, ec2, rds, elasticloadbalancingv2, \
-    awslambda, cloudformation, kms
+    Parameter, Join, Equals, Not, If, iam, logs, ec2, rds, elasticloadbalancingv2, \
+    awslambda, cloudformation, kms, cloudfront, s3
 
 
 class CustomDBInit(cloudformation.AWSCustomObject):
@@ -88,6 +88,90 @@ dbmultiaz = t.add_parameter(Parameter(
     Type="String"
 ))
 
+dbreadreplicas = t.add_parameter(Parameter(
+    "DBReadReplicas",
+    Default="0",
+    Description="The number of RDS read replicas to route Ghost's reads to (0-2)",
+    Type="String",
+    AllowedValues=["0", "1", "2"]
+))
+
+use_cloudfront = t.add_parameter(Parameter(
+    "CloudFront",
+    Default="false",
+    Description="Put a CloudFront distribution in front of the ALB and use it as the site URL (true/false)",
+    Type="String",
+    AllowedValues=["true", "false"]
+))
+
+cloudfront_html_ttl = t.add_parameter(Parameter(
+    "CloudFrontHTMLTTL",
+    Default="60",
+    Description="How long (seconds) CloudFront caches pages (assets and images are cached for a day or more)",
+    Type="Number",
+    MinValue="0"
+))
+
+deregistration_delay = t.add_parameter(Parameter(
+    "DeregistrationDelay",
+    Default="30",
+    Description="How long (seconds) the ALB lets in-flight requests to a stopping Ghost task finish",
+    Type="Number",
+    MinValue="0",
+    MaxValue="3600"
+))
+
+alb_idle_timeout = t.add_parameter(Parameter(
+    "ALBIdleTimeout",
+    Default="60",
+    Description="How long (seconds) the ALB keeps an idle connection open. Ghost keeps its keep-alive connections open 5 seconds longer",
+    Type="Number",
+    MinValue="1",
+    MaxValue="4000"
+))
+
+slow_start = t.add_parameter(Parameter(
+    "SlowStart",
+    Default="0",
+    Description="How long (seconds) a new Ghost task's share of the requests ramps up for (0 to disable, otherwise 30-900). "
+                "Needs RoutingAlgorithm round_robin",
+    Type="Number",
+    MinValue="0",
+    MaxValue="900"
+))
+
+routing_algorithm = t.add_parameter(Parameter(
+    "RoutingAlgorithm",
+    Default="least_outstanding_requests",
+    Description="How the ALB picks a Ghost task for each request. least_outstanding_requests can't be used with SlowStart",
+    Type="String",
+    AllowedValues=["least_outstanding_requests", "round_robin"]
+))
+
+blue_green = t.add_parameter(Parameter(
+    "BlueGreen",
+    Default="false",
+    Description="Create the second target group, test listener and CodeDeploy role for blue/green deploys of Ghost (true/false)",
+    Type="String",
+    AllowedValues=["true", "false"]
+))
+
+test_listener_port = t.add_parameter(Parameter(
+    "TestListenerPort",
+    Default="8080",
+    Description="The ALB port a blue/green deploy sends test traffic to the new tasks on",
+    Type="Number",
+    MinValue="1",
+    MaxValue="65535"
+))
+
+test_listener_cidr = t.add_parameter(Parameter(
+    "TestListenerCIDR",
+    Default="10.0.0.0/16",
+    Description="The addresses allowed to reach the test listener",
+    Type="String"
+))
+
 key_admin_arn = t.add_parameter(Parameter(
     "KeyAdminARN",
     Description="The ARN for the User/Role that can manage the RDS KMS key (e.g. arn:aws:iam::111122223333:root)",
@@ -101,6 +185,25 @@ cr_s3_bucket = t.add_parameter(Parameter(
     Type="String"
 ))
 
+# Reject target group settings the ELB API would only refuse once the stack is updating
+t.add_rule('SlowStartDuration', {
+    'RuleCondition': Not(Equals(Ref(slow_start), "0")),
+    'Assertions': [{
+        'Assert': Not({'Fn::Contains': [[str(seconds) for seconds in range(1, 30)], Ref(slow_start)]}),
+        'AssertDescription': 'SlowStart must be 0 or 30-900'
+    }, {
+        'Assert': Equals(Ref(routing_algorithm), "round_robin"),
+        'AssertDescription': 'SlowStart needs RoutingAlgorithm round_robin'
+    }]
+})
+
+# Create the Conditions
+
+t.add_condition("HasReadReplica1", Not(Equals(Ref(dbreadreplicas), "0")))
+t.add_condition("HasReadReplica2", Equals(Ref(dbreadreplicas), "2"))
+t.add_condition("UseCloudFront", Equals(Ref(use_cloudfront), "true"))
+t.add_condition("UseBlueGreen", Equals(Ref(blue_green), "true"))
+
 # Create the Resources
 
 # Create the Task Role
@@ -179,6 +282,17 @@ alb_security_group = ec2.SecurityGroup(
 )
 t.add_resource(alb_security_group)
 
+# Let test traffic reach the test listener during blue/green deploys
+t.add_resource(ec2.SecurityGroupIngress(
+    "ALBTestListenerIngress",
+    Condition="UseBlueGreen",
+    GroupId=GetAtt(alb_security_group, 'GroupId'),
+    IpProtocol="tcp",
+    FromPort=Ref(test_listener_port),
+    ToPort=Ref(test_listener_port),
+    CidrIp=Ref(test_listener_cidr)
+))
+
 # Create Security group for the host/ENI/Fargate that allows 2368
 ghost_host_security_group = ec2.SecurityGroup(
     "GhostHostSecurityGroup",
@@ -348,29 +462,244 @@ DBInitFunction = t.add_resource(awslambda.Function(
     DependsOn=LambdaExecutionPolicy
 ))
 
+# Create the Lambda Execution Role for the DB migration Custom Resource
+MigrationLambdaExecutionRole = t.add_resource(iam.Role(
+    "MigrationLambdaExecutionRole",
+    AssumeRolePolicyDocument={
+        'Statement': [{
+            'Effect': 'Allow',
+            'Principal': {'Service': ['lambda.amazonaws.com']},
+            'Action': ["sts:AssumeRole"]
+        }]},
+))
+
+# Allow it (and the blue/green migration hook) to run the one-shot migration task and pass it the task roles
+MigrationLambdaExecutionPolicy = t.add_resource(iam.PolicyType(
+    "MigrationLambdaExecutionPolicy",
+    PolicyName="migration-lambda-execution",
+    PolicyDocument={'Version': '2012-10-17',
+                    'Statement': [{'Action': ['logs:CreateLogGroup',
+                                              'logs:CreateLogStream',
+                                              'logs:PutLogEvents',
+                                              'ecs:RunTask',
+                                              'ecs:DescribeTasks',
+                                              'ecs:DescribeServices',
+                                              'codedeploy:GetDeployment',
+                                              'codedeploy:GetDeploymentGroup',
+                                              'codedeploy:PutLifecycleEventHookExecutionStatus'
+                                              ],
+                                   'Resource': ['*'],
+                                   'Effect': 'Allow'},
+                                  {'Action': ['iam:PassRole'],
+                                   'Resource': [GetAtt(TaskRole, "Arn"), GetAtt(TaskExecutionRole, "Arn")],
+                                   'Effect': 'Allow'},
+                                  ]},
+    Roles=[Ref(MigrationLambdaExecutionRole)],
+))
+
+# Create the Lambda Function for the Custom Resource that runs the DB migrations once per deploy
+# It starts the migration task definition on Fargate and waits for it to exit successfully
+migration_code = [
+    "import time",
+    "import boto3",
+    "import cfnresponse",
+    "",
+    "ecs = boto3.client('ecs')",
+    "",
+    "def handler(event, context):",
+    "    print(event)",
+    "    if event['RequestType'] == 'Delete':",
+    "        return cfnresponse.send(event, context, cfnresponse.SUCCESS, {})",
+    "",
+    "    props = event['ResourceProperties']",
+    "    try:",
+    "        response = ecs.run_task(",
+    "            cluster=props['Cluster'],",
+    "            taskDefinition=props['TaskDefinition'],",
+    "            launchType='FARGATE',",
+    "            startedBy='ghost-migration',",
+    "            networkConfiguration={'awsvpcConfiguration': {",
+    "                'subnets': props['Subnets'],",
+    "                'securityGroups': props['SecurityGroups']}})",
+    "        if response['failures']:",
+    "            raise Exception(str(response['failures']))",
+    "        task = response['tasks'][0]",
+    "",
+    "        while task['lastStatus'] != 'STOPPED':",
+    "            if context.get_remaining_time_in_millis() < 20000:",
+    "                raise Exception('Timed out waiting for ' + task['taskArn'])",
+    "            time.sleep(10)",
+    "            task = ecs.describe_tasks(cluster=props['Cluster'], tasks=[task['taskArn']])['tasks'][0]",
+    "",
+    "        exit_codes = [c.get('exitCode') for c in task['containers']]",
+    "        print('Migration task ' + task['taskArn'] + ' exited with ' + str(exit_codes))",
+    "        if exit_codes != [0]:",
+    "            raise Exception('Migration failed: ' + str(task.get('stoppedReason')))",
+    "        cfnresponse.send(event, context, cfnresponse.SUCCESS, {'TaskArn': task['taskArn']}, task['taskArn'])",
+    "",
+    "    except Exception as error:",
+    "        print('Migration Exception: ' + str(error))",
+    "        cfnresponse.send(event, context, cfnresponse.FAILED, {})",
+]
+
+MigrationFunction = t.add_resource(awslambda.Function(
+    "MigrationFunction",
+    Code=awslambda.Code(
+        ZipFile=Join("\n", migration_code)
+    ),
+    Handler="index.handler",
+    Role=GetAtt("MigrationLambdaExecutionRole", "Arn"),
+    Runtime="python3.6",
+    MemorySize="128",
+    Timeout="900",
+    DependsOn=MigrationLambdaExecutionPolicy
+))
+
+# The BeforeInstall hook of blue/green deploys (see ghost-container/blue-green-artifacts.py)
+# It runs the migration with the new task definition before CodeDeploy starts its tasks.
+# CodeDeploy's AWSCodeDeployRoleForECS policy may only invoke functions named CodeDeployHook_*
+migration_hook_code = [
+    "import re",
+    "import time",
+    "import boto3",
+    "",
+    "codedeploy = boto3.client('codedeploy')",
+    "ecs = boto3.client('ecs')",
+    "",
+    "MIGRATE = ['knex-migrator-migrate', '--init', '--mgpath', '/var/lib/ghost/current']",
+    "",
+    "def handler(event, context):",
+    "    print(event)",
+    "    status = 'Failed'",
+    "    try:",
+    "        deployment = codedeploy.get_deployment(deploymentId=event['DeploymentId'])['deploymentInfo']",
+    "        appspec = deployment['revision']['appSpecContent']['content']",
+    "        task_definition = re.search(r'arn:aws:ecs:[^\\s\\'\"]+:task-definition/[^\\s\\'\"]+', appspec).group(0)",
+    "        group = codedeploy.get_deployment_group(",
+    "            applicationName=deployment['applicationName'],",
+    "            deploymentGroupName=deployment['deploymentGroupName'])['deploymentGroupInfo']",
+    "        cluster = group['ecsServices'][0]['clusterName']",
+    "        service = ecs.describe_services(cluster=cluster, services=[group['ecsServices'][0]['serviceName']])['services'][0]",
+    "",
+    "        response = ecs.run_task(",
+    "            cluster=cluster,",
+    "            taskDefinition=task_definition,",
+    "            launchType='FARGATE',",
+    "            startedBy='ghost-migration',",
+    "            networkConfiguration=service['networkConfiguration'],",
+    "            overrides={'containerOverrides': [{'name': 'ghost', 'command': MIGRATE}]})",
+    "        if response['failures']:",
+    "            raise Exception(str(response['failures']))",
+    "        task = response['tasks'][0]",
+    "",
+    "        while task['lastStatus'] != 'STOPPED':",
+    "            if context.get_remaining_time_in_millis() < 20000:",
+    "                raise Exception('Timed out waiting for ' + task['taskArn'])",
+    "            time.sleep(10)",
+    "            task = ecs.describe_tasks(cluster=cluster, tasks=[task['taskArn']])['tasks'][0]",
+    "",
+    "        exit_codes = [c.get('exitCode') for c in task['containers'] if c['name'] == 'ghost']",
+    "        print('Migration task ' + task['taskArn'] + ' of ' + task_definition + ' exited with ' + str(exit_codes))",
+    "        if exit_codes != [0]:",
+    "            raise Exception('Migration failed: ' + str(task.get('stoppedReason')))",
+    "        status = 'Succeeded'",
+    "",
+    "    except Exception as error:",
+    "        print('Migration Exception: ' + str(error))",
+    "",
+    "    codedeploy.put_lifecycle_event_hook_execution_status(",
+    "        deploymentId=event['DeploymentId'],",
+    "        lifecycleEventHookExecutionId=event['LifecycleEventHookExecutionId'],",
+    "        status=status)",
+]
+
+MigrationHookFunction = t.add_resource(awslambda.Function(
+    "MigrationHookFunction",
+    Condition="UseBlueGreen",
+    FunctionName="CodeDeployHook_GhostMigration",
+    Code=awslambda.Code(
+        ZipFile=Join("\n", migration_hook_code)
+    ),
+    Handler="index.handler",
+    Role=GetAtt("MigrationLambdaExecutionRole", "Arn"),
+    Runtime="python3.6",
+    MemorySize="128",
+    Timeout="900",
+    DependsOn=MigrationLambdaExecutionPolicy
+))
+
+# Create the CodeDeploy Role for blue/green deploys of the Ghost service
+CodeDeployRole = t.add_resource(iam.Role(
+    "CodeDeployRole",
+    Condition="UseBlueGreen",
+    AssumeRolePolicyDocument={
+        'Statement': [{
+            'Effect': 'Allow',
+            'Principal': {'Service': ['codedeploy.amazonaws.com']},
+            'Action': ["sts:AssumeRole"]
+        }]},
+    ManagedPolicyArns=["arn:aws:iam::aws:policy/AWSCodeDeployRoleForECS"]
+))
+
 # Add the application ELB
 GhostALB = t.add_resource(elasticloadbalancingv2.LoadBalancer(
     "GhostALB",
     Scheme="internet-facing",
     Subnets=[Ref(alb_subnet), Ref(alb_subnet2)],
-    SecurityGroups=[Ref(alb_security_group)]
-))
-
-GhostTargetGroup = t.add_resource(elasticloadbalancingv2.TargetGroup(
-    "GhostTargetGroup",
-    HealthCheckIntervalSeconds="30",
-    HealthCheckProtocol="HTTP",
-    HealthCheckTimeoutSeconds="10",
-    HealthyThresholdCount="4",
-    Matcher=elasticloadbalancingv2.Matcher(
-        HttpCode="200,301"),
-    Port=2368,
-    Protocol="HTTP",
-    UnhealthyThresholdCount="3",
-    TargetType="ip",
-    VpcId=Ref(db_vpc)
+    SecurityGroups=[Ref(alb_security_group)],
+    LoadBalancerAttributes=[
+        elasticloadbalancingv2.LoadBalancerAttributes(
+            Key="idle_timeout.timeout_seconds",
+            Value=Ref(alb_idle_timeout)
+        ),
+        elasticloadbalancingv2.LoadBalancerAttributes(
+            Key="routing.http2.enabled",
+            Value="true"
+        )
+    ]
 ))
 
+# The service's target group. Blue/green deploys also get a second one for the
+# new tasks, and CodeDeploy swaps the listeners between the two
+def ghost_target_group(title, **kwargs):
+    return elasticloadbalancingv2.TargetGroup(
+        title,
+        HealthCheckIntervalSeconds="30",
+        # Answered by server-hooks.js without rendering a page (see ghost-container/README.md)
+        HealthCheckPath="/healthz",
+        HealthCheckProtocol="HTTP",
+        HealthCheckTimeoutSeconds="5",
+        HealthyThresholdCount="4",
+        Matcher=elasticloadbalancingv2.Matcher(
+            HttpCode="200"),
+        Port=2368,
+        Protocol="HTTP",
+        UnhealthyThresholdCount="3",
+        TargetType="ip",
+        TargetGroupAttributes=[
+            elasticloadbalancingv2.TargetGroupAttribute(
+                Key="deregistration_delay.timeout_seconds",
+                Value=Ref(deregistration_delay)
+            ),
+            # Ramp new tasks up while their caches and DB pool warm (round_robin only)
+            elasticloadbalancingv2.TargetGroupAttribute(
+                Key="slow_start.duration_seconds",
+                Value=Ref(slow_start)
+            ),
+            # Send requests to the task with the fewest in flight rather than to one still rendering
+            elasticloadbalancingv2.TargetGroupAttribute(
+                Key="load_balancing.algorithm.type",
+                Value=Ref(routing_algorithm)
+            )
+        ],
+        VpcId=Ref(db_vpc),
+        **kwargs
+    )
+
+
+GhostTargetGroup = t.add_resource(ghost_target_group("GhostTargetGroup"))
+GhostTargetGroupGreen = t.add_resource(ghost_target_group("GhostTargetGroupGreen", Condition="UseBlueGreen"))
+
 Listener = t.add_resource(elasticloadbalancingv2.Listener(
     "Listener",
     Port="80",
@@ -382,6 +711,201 @@ Listener = t.add_resource(elasticloadbalancingv2.Listener(
     )]
 ))
 
+# Where a blue/green deploy tests the new tasks before the Listener is switched to them
+TestListener = t.add_resource(elasticloadbalancingv2.Listener(
+    "TestListener",
+    Condition="UseBlueGreen",
+    Port=Ref(test_listener_port),
+    Protocol="HTTP",
+    LoadBalancerArn=Ref(GhostALB),
+    DefaultActions=[elasticloadbalancingv2.Action(
+        Type="forward",
+        TargetGroupArn=Ref(GhostTargetGroup)
+    )]
+))
+
+# Create the bucket for uploaded images (the s3 storage adapter in the Ghost image)
+# Keys are content hashes so objects never change and can be cached forever.
+# With CloudFront only the distribution can read them, otherwise they are public
+ImagesBucket = t.add_resource(s3.Bucket(
+    "ImagesBucket",
+    DeletionPolicy="Retain",
+    BucketEncryption=s3.BucketEncryption(
+        ServerSideEncryptionConfiguration=[s3.ServerSideEncryptionRule(
+            ServerSideEncryptionByDefault=s3.ServerSideEncryptionByDefault(
+                SSEAlgorithm="AES256"
+            )
+        )]
+    ),
+    OwnershipControls=s3.OwnershipControls(
+        Rules=[s3.OwnershipControlsRule(ObjectOwnership="BucketOwnerEnforced")]
+    ),
+    # No ACLs, but allow the public read policy below when there is no CloudFront
+    PublicAccessBlockConfiguration=s3.PublicAccessBlockConfiguration(
+        BlockPublicAcls=True,
+        IgnorePublicAcls=True,
+        BlockPublicPolicy=If("UseCloudFront", True, False),
+        RestrictPublicBuckets=If("UseCloudFront", True, False)
+    )
+))
+
+# The identity the distribution reads the images bucket as
+ImagesOriginAccessIdentity = t.add_resource(cloudfront.CloudFrontOriginAccessIdentity(
+    "ImagesOriginAccessIdentity",
+    Condition="UseCloudFront",
+    CloudFrontOriginAccessIdentityConfig=cloudfront.CloudFrontOriginAccessIdentityConfig(
+        Comment=Sub("${AWS::StackName} Ghost images")
+    )
+))
+
+ImagesBucketPolicy = t.add_resource(s3.BucketPolicy(
+    "ImagesBucketPolicy",
+    Bucket=Ref(ImagesBucket),
+    PolicyDocument={
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Effect": "Allow",
+                "Principal": If("UseCloudFront",
+                                {"CanonicalUser": GetAtt(ImagesOriginAccessIdentity, "S3CanonicalUserId")},
+                                "*"),
+                "Action": [
+                    "s3:GetObject"
+                ],
+                "Resource": [
+                    Join("", [GetAtt(ImagesBucket, "Arn"), "/images/*"])
+                ]
+            }
+        ]
+    }
+))
+
+# Add image upload access to the Task Role
+ImagesAccessPolicy = t.add_resource(iam.PolicyType(
+    "ImagesAccessPolicy",
+    PolicyName="ImagesAccessPolicy",
+    PolicyDocument={
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "s3:GetObject",
+                    "s3:PutObject",
+                    "s3:DeleteObject"
+                ],
+                "Resource": [
+                    Join("", [GetAtt(ImagesBucket, "Arn"), "/images/*"])
+                ]
+            },
+            # Without it a HEAD for a missing key is a 403 rather than a 404
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "s3:ListBucket"
+                ],
+                "Resource": [
+                    GetAtt(ImagesBucket, "Arn")
+                ]
+            }
+        ]
+    },
+    Roles=[Ref(TaskRole)],
+))
+
+# Create the CloudFront distribution in front of the ALB
+# Static files are versioned (?v=) or content addressed so can be cached for long
+static_cache_behaviors = [
+    cloudfront.CacheBehavior(
+        PathPattern=path,
+        TargetOriginId="GhostALB",
+        ViewerProtocolPolicy="redirect-to-https",
+        AllowedMethods=["GET", "HEAD"],
+        Compress=True,
+        ForwardedValues=cloudfront.ForwardedValues(
+            QueryString=True,
+            Cookies=cloudfront.Cookies(Forward="none"),
+            Headers=["CloudFront-Forwarded-Proto"]
+        ),
+        MinTTL=86400,
+        DefaultTTL=604800,
+        MaxTTL=31536000
+    ) for path in ["/assets/*", "/content/images/*", "/public/*"]
+]
+
+GhostDistribution = t.add_resource(cloudfront.Distribution(
+    "GhostDistribution",
+    Condition="UseCloudFront",
+    DistributionConfig=cloudfront.DistributionConfig(
+        Comment=Sub("${AWS::StackName} Ghost"),
+        Enabled=True,
+        HttpVersion="http2",
+        IPV6Enabled=True,
+        Origins=[cloudfront.Origin(
+            Id="GhostALB",
+            DomainName=GetAtt(GhostALB, "DNSName"),
+            CustomOriginConfig=cloudfront.CustomOriginConfig(
+                OriginProtocolPolicy="http-only"
+            ),
+            OriginShield=cloudfront.OriginShield(
+                Enabled=True,
+                OriginShieldRegion=Ref('AWS::Region')
+            )
+        ), cloudfront.Origin(
+            Id="GhostImages",
+            DomainName=GetAtt(ImagesBucket, "RegionalDomainName"),
+            S3OriginConfig=cloudfront.S3OriginConfig(
+                OriginAccessIdentity=Join("", ["origin-access-identity/cloudfront/",
+                                               Ref(ImagesOriginAccessIdentity)])
+            )
+        )],
+        # Pages - Ghost sends max-age=0 so the short TTL is a minimum, not just a default
+        DefaultCacheBehavior=cloudfront.DefaultCacheBehavior(
+            TargetOriginId="GhostALB",
+            ViewerProtocolPolicy="redirect-to-https",
+            AllowedMethods=["GET", "HEAD", "OPTIONS", "PUT", "PATCH", "POST", "DELETE"],
+            Compress=True,
+            ForwardedValues=cloudfront.ForwardedValues(
+                QueryString=True,
+                Cookies=cloudfront.Cookies(Forward="none"),
+                Headers=["CloudFront-Forwarded-Proto"]
+            ),
+            MinTTL=Ref(cloudfront_html_ttl),
+            DefaultTTL=Ref(cloudfront_html_ttl),
+            MaxTTL=Ref(cloudfront_html_ttl)
+        ),
+        CacheBehaviors=static_cache_behaviors + [
+            # Uploaded images in S3 - immutable, so cached for as long as they are asked for
+            cloudfront.CacheBehavior(
+                PathPattern="/images/*",
+                TargetOriginId="GhostImages",
+                ViewerProtocolPolicy="redirect-to-https",
+                AllowedMethods=["GET", "HEAD"],
+                Compress=True,
+                ForwardedValues=cloudfront.ForwardedValues(
+                    QueryString=False,
+                    Cookies=cloudfront.Cookies(Forward="none")
+                ),
+                MinTTL=86400,
+                DefaultTTL=31536000,
+                MaxTTL=31536000
+            ),
+            # The admin and its API are never cached and get everything the browser sends,
+            # plus CloudFront-Forwarded-Proto (the managed CachingDisabled and
+            # AllViewerAndCloudFrontHeaders-2022-06 policies)
+            cloudfront.CacheBehavior(
+                PathPattern="/ghost/*",
+                TargetOriginId="GhostALB",
+                ViewerProtocolPolicy="redirect-to-https",
+                AllowedMethods=["GET", "HEAD", "OPTIONS", "PUT", "PATCH", "POST", "DELETE"],
+                Compress=True,
+                CachePolicyId="4135ea2d-6df8-44a3-9df3-4b5a84be39ad",
+                OriginRequestPolicyId="33f36d7e-f396-46d9-90e0-52428a34d9dc"
+            )
+        ]
+    )
+))
+
 dbinit = t.add_resource(CustomDBInit(
     "DBInit",
     ServiceToken=GetAtt(DBInitFunction, 'Arn'),
@@ -390,6 +914,48 @@ dbinit = t.add_resource(CustomDBInit(
     DependsOn=ghost_db
 ))
 
+# Create the read replicas once DBInit has enabled IAM auth and created the ghost user on the primary
+ghost_db_replicas = []
+for n in ["1", "2"]:
+    ghost_db_replicas.append(t.add_resource(rds.DBInstance(
+        "GhostDBReplica" + n,
+        Condition="HasReadReplica" + n,
+        SourceDBInstanceIdentifier=Ref(ghost_db),
+        Engine='MySQL',
+        DBInstanceClass=Ref(dbclass),
+        StorageType='gp2',
+        EnableIAMDatabaseAuthentication=True,
+        DependsOn=dbinit
+    )))
+
+# Allow the ghost user on each replica, by its own resource ID
+def replica_dbuser_arn(replica):
+    return Join("", ["arn:aws:rds-db:", Ref('AWS::Region'), ":", Ref('AWS::AccountId'), ":dbuser:",
+                     GetAtt(replica, "DbiResourceId"), "/ghost"])
+
+
+DBReplicaAccessPolicy = t.add_resource(iam.PolicyType(
+    "DBReplicaAccessPolicy",
+    Condition="HasReadReplica1",
+    PolicyName="DBReplicaAccessPolicy",
+    PolicyDocument={
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "rds-db:connect"
+                ],
+                "Resource": [
+                    replica_dbuser_arn(ghost_db_replicas[0]),
+                    If("HasReadReplica2", replica_dbuser_arn(ghost_db_replicas[1]), Ref('AWS::NoValue'))
+                ]
+            }
+        ]
+    },
+    Roles=[Ref(TaskRole)],
+))
+
 # Create the required Outputs
 
 # Output the Task Role Arn
@@ -432,6 +998,18 @@ t.add_output(Output(
     Export=Export(Sub("${AWS::StackName}-GhostDBHost"))
 ))
 
+# Output the read replica hostnames (the primary when there are none)
+t.add_output(Output(
+    "GhostDBReadHosts",
+    Value=If("HasReadReplica2",
+             Join(",", [GetAtt(replica, 'Endpoint.Address') for replica in ghost_db_replicas]),
+             If("HasReadReplica1",
+                GetAtt(ghost_db_replicas[0], 'Endpoint.Address'),
+                GetAtt(ghost_db, 'Endpoint.Address'))),
+    Description="Comma separated FQDNs of the Ghost DB read replicas.",
+    Export=Export(Sub("${AWS::StackName}-GhostDBReadHosts"))
+))
+
 # Output the Target Group ARN
 t.add_output(Output(
     "GhostTG",
@@ -448,6 +1026,51 @@ t.add_output(Output(
     Export=Export(Sub("${AWS::StackName}-ALBURL"))
 ))
 
+# Output the URL Ghost should be served at
+# CloudFront only serves https and tells Ghost so with CloudFront-Forwarded-Proto
+# (see server-hooks.js), so Ghost doesn't redirect its own https requests
+t.add_output(Output(
+    "SiteURL",
+    Description="URL of the site (the CloudFront distribution if there is one)",
+    Value=If("UseCloudFront",
+             Join("", ["https://", GetAtt("GhostDistribution", "DomainName")]),
+             Join("", ["http://", GetAtt(GhostALB, "DNSName")])),
+    Export=Export(Sub("${AWS::StackName}-SiteURL"))
+))
+
+# Output the images bucket and where its images are served from
+t.add_output(Output(
+    "ImagesBucket",
+    Description="The bucket Ghost stores uploaded images in",
+    Value=Ref(ImagesBucket),
+    Export=Export(Sub("${AWS::StackName}-ImagesBucket"))
+))
+
+t.add_output(Output(
+    "ImagesURL",
+    Description="The URL uploaded images are served from (the CloudFront distribution if there is one)",
+    Value=If("UseCloudFront",
+             Join("", ["https://", GetAtt("GhostDistribution", "DomainName")]),
+             Join("", ["https://", GetAtt(ImagesBucket, "RegionalDomainName")])),
+    Export=Export(Sub("${AWS::StackName}-ImagesURL"))
+))
+
+# Output the ALB idle timeout for Ghost's keep-alive timeout
+t.add_output(Output(
+    "ALBIdleTimeout",
+    Description="The ALB idle timeout (seconds)",
+    Value=Ref(alb_idle_timeout),
+    Export=Export(Sub("${AWS::StackName}-ALBIdleTimeout"))
+))
+
+# Output the ALB/Target Group label for ALBRequestCountPerTarget scaling
+t.add_output(Output(
+    "GhostTGResourceLabel",
+    Description="The resource label of the Ghost Target Group for request count scaling",
+    Value=Join("/", [GetAtt(GhostALB, "LoadBalancerFullName"), GetAtt(GhostTargetGroup, "TargetGroupFullName")]),
+    Export=Export(Sub("${AWS::StackName}-GhostTGResourceLabel"))
+))
+
 # Output the Target Group Name
 t.add_output(Output(
     "ALBTGNAME",
@@ -456,6 +1079,38 @@ t.add_output(Output(
     Export=Export(Sub("${AWS::StackName}-ALBTGNAME"))
 ))
 
+# Output what a blue/green deploy of the service needs
+t.add_output(Output(
+    "ListenerArn",
+    Description="ARN of the ALB Listener",
+    Value=Ref(Listener),
+    Export=Export(Sub("${AWS::StackName}-ListenerArn"))
+))
+
+t.add_output(Output(
+    "TestListenerArn",
+    Condition="UseBlueGreen",
+    Description="ARN of the ALB Listener for blue/green test traffic",
+    Value=Ref(TestListener),
+    Export=Export(Sub("${AWS::StackName}-TestListenerArn"))
+))
+
+t.add_output(Output(
+    "ALBTGGREENNAME",
+    Condition="UseBlueGreen",
+    Description="Name of the second ALB Target Group for blue/green deploys",
+    Value=GetAtt(GhostTargetGroupGreen, 'TargetGroupName'),
+    Export=Export(Sub("${AWS::StackName}-ALBTGGREENNAME"))
+))
+
+t.add_output(Output(
+    "CodeDeployRoleArn",
+    Condition="UseBlueGreen",
+    Description="Arn of the CodeDeploy Role for blue/green deploys",
+    Value=GetAtt(CodeDeployRole, "Arn"),
+    Export=Export(Sub("${AWS::StackName}-CodeDeployRoleArn"))
+))
+
 # Output Subnet 1
 t.add_output(Output(
     "Subnet1",
@@ -472,6 +1127,14 @@ t.add_output(Output(
     Export=Export(Sub("${AWS::StackName}-Subnet2"))
 ))
 
+# Output the DB migration Custom Resource Function Arn
+t.add_output(Output(
+    "MigrationFunctionArn",
+    Description="Arn of the Lambda that runs the Ghost DB migrations",
+    Value=GetAtt(MigrationFunction, "Arn"),
+    Export=Export(Sub("${AWS::StackName}-MigrationFunctionArn"))
+))
+
 # Output Stack Name
 t.add_output(Output(
     "StackName",
@@ -0,0 +1,130 @@
+'use strict';
+
+const http = require('http'),
+    url = require('url'),
+    Promise = require('bluebird'),
+    debug = require('debug')('aws-auth:credentials');
+
+// link-local address of the ECS task credentials endpoint (Fargate and EC2 tasks with a task role)
+const ECS_CREDENTIALS_HOST = 'http://169.254.170.2',
+    REQUEST_TIMEOUT = 2000,
+    // refresh cached credentials this long before they expire, so anything
+    // signed with them (e.g. a 15 minute RDS auth token) stays valid for its full lifetime
+    EXPIRY_MARGIN = 15 * 60 * 1000;
+
+let cached = null,
+    pending = null;
+
+function fromEnvironment() {
+    if (!process.env.AWS_ACCESS_KEY_ID || !process.env.AWS_SECRET_ACCESS_KEY) {
+        return null;
+    }
+
+    return {
+        accessKeyId: process.env.AWS_ACCESS_KEY_ID,
+        secretAccessKey: process.env.AWS_SECRET_ACCESS_KEY,
+        sessionToken: process.env.AWS_SESSION_TOKEN,
+        expiration: null
+    };
+}
+
+function containerCredentialsUrl() {
+    if (process.env.AWS_CONTAINER_CREDENTIALS_RELATIVE_URI) {
+        return ECS_CREDENTIALS_HOST + process.env.AWS_CONTAINER_CREDENTIALS_RELATIVE_URI;
+    }
+
+    return process.env.AWS_CONTAINER_CREDENTIALS_FULL_URI;
+}
+
+function fromContainerEndpoint(endpoint) {
+    const options = url.parse(endpoint);
+
+    options.headers = {};
+
+    if (process.env.AWS_CONTAINER_AUTHORIZATION_TOKEN) {
+        options.headers.Authorization = process.env.AWS_CONTAINER_AUTHORIZATION_TOKEN;
+    }
+
+    return new Promise(function (resolve, reject) {
+        const req = http.get(options, function (res) {
+            let body = '';
+
+            res.setEncoding('utf8');
+            res.on('data', function (chunk) {
+                body += chunk;
+            });
+            res.on('end', function () {
+                if (res.statusCode !== 200) {
+                    return reject(new Error('Credentials endpoint returned ' + res.statusCode + ': ' + body));
+                }
+
+                try {
+                    const data = JSON.parse(body);
+
+                    resolve({
+                        accessKeyId: data.AccessKeyId,
+                        secretAccessKey: data.SecretAccessKey,
+                        sessionToken: data.Token,
+                        expiration: data.Expiration ? new Date(data.Expiration).getTime() : null
+                    });
+                } catch (err) {
+                    reject(err);
+                }
+            });
+        });
+
+        req.on('error', reject);
+        req.setTimeout(REQUEST_TIMEOUT, function () {
+            req.abort();
+            reject(new Error('Timed out fetching credentials from ' + endpoint));
+        });
+    });
+}
+
+function isFresh(credentials) {
+    return !!credentials &&
+        (credentials.expiration === null || Date.now() < credentials.expiration - EXPIRY_MARGIN);
+}
+
+/**
+ * Resolves the task role credentials, preferring static environment credentials,
+ * then the ECS container credentials endpoint.
+ * Credentials are cached until shortly before they expire.
+ */
+exports.getCredentials = function getCredentials() {
+    const endpoint = containerCredentialsUrl();
+
+    if (isFresh(cached)) {
+        return Promise.resolve(cached);
+    }
+
+    cached = fromEnvironment();
+
+    if (cached) {
+        return Promise.resolve(cached);
+    }
+
+    if (!endpoint) {
+        return Promise.reject(new Error('No AWS credentials found in the environment or the ECS credentials endpoint'));
+    }
+
+    if (!pending) {
+        debug('Fetching credentials from ' + endpoint);
+
+        pending = fromContainerEndpoint(endpoint)
+            .then(function (credentials) {
+                cached = credentials;
+                return credentials;
+            })
+            .finally(function () {
+                pending = null;
+            });
+    }
+
+    return pending;
+};
+
+exports.reset = function reset() {
+    cached = null;
+    pending = null;
+};
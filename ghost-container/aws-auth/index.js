@@ -0,0 +1,13 @@
+'use strict';
+
+/**
+ * AWS authentication helpers shared by Ghost, knex and knex-migrator.
+ * Copied into Ghost's node_modules by the Dockerfile.
+ */
+const credentials = require('./credentials'),
+    sigv4 = require('./sigv4'),
+    rdsToken = require('./rds-token');
+
+exports.credentials = credentials;
+exports.sigv4 = sigv4;
+exports.rdsToken = rdsToken;
@@ -0,0 +1,190 @@
+'use strict';
+
+const Promise = require('bluebird'),
+    debug = require('debug')('aws-auth:rds-token'),
+    credentials = require('./credentials'),
+    sigv4 = require('./sigv4');
+
+// RDS IAM authentication tokens are valid for 15 minutes after they are generated
+const TOKEN_LIFETIME = 15 * 60 * 1000,
+    DEFAULT_REFRESH_MARGIN = 5 * 60 * 1000,
+    // the smallest amount of validity left on a token before we refuse to hand it out
+    MINIMUM_VALIDITY = 30 * 1000;
+
+const providers = {};
+
+/**
+ * Hands out cached RDS IAM auth tokens for a single host/port/user/region.
+ *
+ * A token is only handed out while it has more than `refreshMargin` of its
+ * lifetime left. A background timer refreshes it ahead of that point so new
+ * pool connections never wait on token generation.
+ */
+function TokenProvider(options) {
+    this.host = options.host;
+    this.port = options.port;
+    this.user = options.user;
+    this.region = options.region;
+    this.refreshMargin = options.refreshMargin || DEFAULT_REFRESH_MARGIN;
+
+    this.token = null;
+    this.expiresAt = 0;
+    this.pending = null;
+    this.timer = null;
+}
+
+/**
+ * Signs an `rds-db:connect` token in-process with the task role credentials.
+ * Resolves with the token and the time it stops being valid, which is
+ * earlier than the token lifetime when the signing credentials expire first.
+ */
+TokenProvider.prototype.generate = function generate() {
+    const self = this,
+        issuedAt = Date.now();
+
+    return credentials.getCredentials().then(function (creds) {
+        const token = sigv4.presign({
+            host: self.host + ':' + self.port,
+            query: {
+                Action: 'connect',
+                DBUser: self.user
+            },
+            service: 'rds-db',
+            region: self.region,
+            credentials: creds,
+            expires: TOKEN_LIFETIME / 1000,
+            date: new Date(issuedAt)
+        });
+
+        return {
+            token: token,
+            expiresAt: Math.min(issuedAt + TOKEN_LIFETIME, creds.expiration || Infinity)
+        };
+    });
+};
+
+TokenProvider.prototype.refresh = function refresh() {
+    const self = this;
+
+    // CASE: share a single in-flight refresh between all waiting connections
+    if (this.pending) {
+        return this.pending;
+    }
+
+    debug('Refreshing token for ' + this.user + '@' + this.host);
+
+    this.pending = this.generate()
+        .then(function (result) {
+            self.token = result.token;
+            self.expiresAt = result.expiresAt;
+            return result.token;
+        })
+        .finally(function () {
+            self.pending = null;
+        });
+
+    return this.pending;
+};
+
+TokenProvider.prototype.isFresh = function isFresh() {
+    return !!this.token && Date.now() < this.expiresAt - this.refreshMargin;
+};
+
+TokenProvider.prototype.isValid = function isValid() {
+    return !!this.token && Date.now() < this.expiresAt - MINIMUM_VALIDITY;
+};
+
+TokenProvider.prototype.startRefreshing = function startRefreshing() {
+    const self = this;
+
+    if (this.timer) {
+        return;
+    }
+
+    this.timer = setInterval(function () {
+        self.refresh().catch(function (err) {
+            // CASE: the next getToken() retries once the cached token goes stale
+            debug('Background refresh failed: ' + err.message);
+        });
+    }, TOKEN_LIFETIME - this.refreshMargin);
+
+    // never keep the process alive just to refresh tokens
+    this.timer.unref();
+};
+
+TokenProvider.prototype.getToken = function getToken() {
+    const self = this;
+
+    this.startRefreshing();
+
+    if (this.isFresh()) {
+        return Promise.resolve(this.token);
+    }
+
+    return this.refresh().catch(function (err) {
+        // CASE: a token that is inside the refresh margin is still good enough to connect with
+        if (self.isValid()) {
+            debug('Refresh failed, reusing cached token: ' + err.message);
+            return self.token;
+        }
+
+        throw err;
+    });
+};
+
+TokenProvider.prototype.stop = function stop() {
+    clearInterval(this.timer);
+    this.timer = null;
+};
+
+/**
+ * IAM auth is opt-in per connection via `database.connection.iamAuth`.
+ * Values coming from environment variables are strings.
+ */
+exports.isEnabled = function isEnabled(connectionSettings) {
+    return !!connectionSettings &&
+        (connectionSettings.iamAuth === true || connectionSettings.iamAuth === 'true');
+};
+
+/**
+ * Returns the shared provider for a set of knex connection settings,
+ * or null when the connection does not use IAM auth.
+ */
+exports.forConnection = function forConnection(connectionSettings) {
+    if (!exports.isEnabled(connectionSettings)) {
+        return null;
+    }
+
+    const options = {
+            host: connectionSettings.host,
+            port: connectionSettings.port || 3306,
+            user: connectionSettings.user,
+            region: connectionSettings.region || process.env.AWSREGION || process.env.AWS_REGION
+        },
+        key = [options.user, options.host, options.port, options.region].join(':');
+
+    if (!providers[key]) {
+        providers[key] = new TokenProvider(options);
+    }
+
+    return providers[key];
+};
+
+/**
+ * mysql2 authSwitchHandler for RDS: the token is sent in clear text
+ * (mysql_clear_password) but the connection itself is SSL encrypted.
+ */
+exports.authSwitchHandler = function authSwitchHandler(connectionSettings) {
+    return function (data, cb) {
+        if (data.pluginName !== 'mysql_clear_password') {
+            return cb(new Error('Unsupported auth plugin: ' + data.pluginName));
+        }
+
+        exports.forConnection(connectionSettings).getToken()
+            .then(function (token) {
+                cb(null, Buffer.from(token + '\0'));
+            }, cb);
+    };
+};
+
+exports.TokenProvider = TokenProvider;
@@ -0,0 +1,138 @@
+'use strict';
+
+const crypto = require('crypto');
+
+function hmac(key, data, encoding) {
+    return crypto.createHmac('sha256', key).update(data, 'utf8').digest(encoding);
+}
+
+function hash(data) {
+    return crypto.createHash('sha256').update(data, 'utf8').digest('hex');
+}
+
+// RFC 3986 encoding as required by SigV4 (encodeURIComponent leaves !'()* alone)
+function uriEncode(value) {
+    return encodeURIComponent(value).replace(/[!'()*]/g, function (c) {
+        return '%' + c.charCodeAt(0).toString(16).toUpperCase();
+    });
+}
+
+function canonicalQuery(query) {
+    return Object.keys(query).sort().map(function (key) {
+        return uriEncode(key) + '=' + uriEncode(query[key]);
+    }).join('&');
+}
+
+function amzDate(date) {
+    return date.toISOString().replace(/[:-]|\.\d{3}/g, '');
+}
+
+function signingKey(secretAccessKey, dateStamp, region, service) {
+    const kDate = hmac('AWS4' + secretAccessKey, dateStamp),
+        kRegion = hmac(kDate, region),
+        kService = hmac(kRegion, service);
+
+    return hmac(kService, 'aws4_request');
+}
+
+/**
+ * Builds a SigV4 query-string presigned URL (without the scheme).
+ *
+ * options: host, path, query, service, region, credentials, expires (seconds), date
+ */
+exports.presign = function presign(options) {
+    const date = options.date || new Date(),
+        timestamp = amzDate(date),
+        dateStamp = timestamp.substr(0, 8),
+        credentials = options.credentials,
+        scope = [dateStamp, options.region, options.service, 'aws4_request'].join('/'),
+        path = options.path || '/',
+        query = Object.assign({}, options.query, {
+            'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
+            'X-Amz-Credential': credentials.accessKeyId + '/' + scope,
+            'X-Amz-Date': timestamp,
+            'X-Amz-Expires': String(options.expires || 900),
+            'X-Amz-SignedHeaders': 'host'
+        });
+
+    if (credentials.sessionToken) {
+        query['X-Amz-Security-Token'] = credentials.sessionToken;
+    }
+
+    const canonicalRequest = [
+            options.method || 'GET',
+            path,
+            canonicalQuery(query),
+            'host:' + options.host + '\n',
+            'host',
+            hash('')
+        ].join('\n'),
+        stringToSign = [
+            'AWS4-HMAC-SHA256',
+            timestamp,
+            scope,
+            hash(canonicalRequest)
+        ].join('\n'),
+        signature = hmac(signingKey(credentials.secretAccessKey, dateStamp, options.region, options.service), stringToSign, 'hex');
+
+    return options.host + path + '?' + canonicalQuery(query) + '&X-Amz-Signature=' + signature;
+};
+
+/**
+ * Signs a request with a SigV4 Authorization header. Returns the request's
+ * headers with the signing headers added.
+ *
+ * options: method, host, path (already URI encoded), query, headers, payloadHash
+ * (hex SHA256 of the body, defaults to that of an empty body), service, region,
+ * credentials, date
+ */
+exports.sign = function sign(options) {
+    const date = options.date || new Date(),
+        timestamp = amzDate(date),
+        dateStamp = timestamp.substr(0, 8),
+        credentials = options.credentials,
+        scope = [dateStamp, options.region, options.service, 'aws4_request'].join('/'),
+        headers = Object.assign({}, options.headers, {
+            host: options.host,
+            'x-amz-date': timestamp,
+            'x-amz-content-sha256': options.payloadHash || hash('')
+        });
+
+    if (credentials.sessionToken) {
+        headers['x-amz-security-token'] = credentials.sessionToken;
+    }
+
+    const names = Object.keys(headers).map(function (name) {
+            return name.toLowerCase();
+        }).sort(),
+        lowerCased = {};
+
+    Object.keys(headers).forEach(function (name) {
+        lowerCased[name.toLowerCase()] = String(headers[name]).trim().replace(/\s+/g, ' ');
+    });
+
+    const signedHeaders = names.join(';'),
+        canonicalRequest = [
+            options.method || 'GET',
+            options.path || '/',
+            canonicalQuery(options.query || {}),
+            names.map(function (name) {
+                return name + ':' + lowerCased[name] + '\n';
+            }).join(''),
+            signedHeaders,
+            headers['x-amz-content-sha256']
+        ].join('\n'),
+        stringToSign = [
+            'AWS4-HMAC-SHA256',
+            timestamp,
+            scope,
+            hash(canonicalRequest)
+        ].join('\n'),
+        signature = hmac(signingKey(credentials.secretAccessKey, dateStamp, options.region, options.service), stringToSign, 'hex');
+
+    headers.Authorization = 'AWS4-HMAC-SHA256 Credential=' + credentials.accessKeyId + '/' + scope +
+        ', SignedHeaders=' + signedHeaders + ', Signature=' + signature;
+    return headers;
+};
+
+exports.uriEncode = uriEncode;
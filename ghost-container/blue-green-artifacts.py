@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# Writes the files the pipeline's CodeDeployToECS action deploys a new image
+# with when the Ghost service uses blue-green deploys (DeploymentType blue-green):
+#
+#   taskdef.json      the latest revision of the ghost task definition family,
+#                     with the ghost container's image replaced by <IMAGE1_NAME>
+#   appspec.yaml      the container and port the ALB sends traffic to, and the
+#                     BeforeInstall hook that migrates the database first
+#   imageDetail.json  the image to put in place of <IMAGE1_NAME>
+#
+# The task definition is read from ECS, so everything but the image stays as the
+# Ghost-Fargate stack last set it. Does nothing when there is no ghost task
+# definition to read (the service hasn't been deployed yet).
+#
+#   ./blue-green-artifacts.py <repo>:<tag> <output dir>
+
+import json
+import os
+import subprocess
+import sys
+
+FAMILY = "ghost"
+MIGRATION_HOOK = "CodeDeployHook_GhostMigration"
+
+# Set by ECS on registration, not accepted when registering a new revision
+READ_ONLY = ["taskDefinitionArn", "revision", "status", "requiresAttributes", "compatibilities",
+             "registeredAt", "registeredBy", "deregisteredAt"]
+
+
+def main():
+    image, output = sys.argv[1], sys.argv[2]
+    try:
+        task_definition = json.loads(subprocess.check_output(
+            ["aws", "ecs", "describe-task-definition", "--task-definition", FAMILY]))["taskDefinition"]
+    except subprocess.CalledProcessError:
+        print("No {} task definition to base a blue-green deploy on, skipping".format(FAMILY))
+        return
+
+    for key in READ_ONLY:
+        task_definition.pop(key, None)
+    names = [container["name"] for container in task_definition["containerDefinitions"]]
+    for container in task_definition["containerDefinitions"]:
+        if container["name"] == "ghost":
+            container["image"] = "<IMAGE1_NAME>"
+
+    with open(os.path.join(output, "taskdef.json"), "w") as f:
+        json.dump(task_definition, f, indent=2)
+
+    with open(os.path.join(output, "imageDetail.json"), "w") as f:
+        json.dump({"ImageURI": image}, f)
+
+    # the micro-cache sidecar takes the ALB's traffic when there is one
+    with open(os.path.join(output, "appspec.yaml"), "w") as f:
+        f.write("\n".join([
+            "version: 0.0",
+            "Resources:",
+            "  - TargetService:",
+            "      Type: AWS::ECS::Service",
+            "      Properties:",
+            "        TaskDefinition: <TASK_DEFINITION>",
+            "        LoadBalancerInfo:",
+            "          ContainerName: {}".format("micro-cache" if "micro-cache" in names else "ghost"),
+            "          ContainerPort: 2368",
+            "Hooks:",
+            "  - BeforeInstall: {}".format(MIGRATION_HOOK),
+            "",
+        ]))
+    print("Wrote taskdef.json, appspec.yaml and imageDetail.json for {}".format(image))
+
+
+if __name__ == "__main__":
+    main()
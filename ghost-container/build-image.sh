@@ -0,0 +1,52 @@
+#!/bin/bash
+# Builds the Ghost image with BuildKit, reusing the layers of the last build
+# pushed to the repository (inline cache), and reports how long it took and how
+# many build steps came from the cache. In CodeBuild both are also published to
+# CloudWatch (namespace Ghost/Build, dimension Project).
+#
+# The builder stage is built and tagged <repo>:builder-<arch> on its own, as an
+# inline cache only covers the stage that is tagged. Push <repo>:builder-<arch>
+# and <repo>:latest-<arch> after the build so the next one can use them.
+#
+# ARCH (default amd64) names the architecture of the build host, which is the
+# one built. NODE_IMAGE overrides the Dockerfile's base image.
+#
+#   ./build-image.sh <repo>:<tag>
+set -euo pipefail
+
+IMAGE_URI=$1
+REPO_URI=${IMAGE_URI%:*}
+ARCH=${ARCH:-amd64}
+LOG=$(mktemp)
+BUILD_ARGS=(--build-arg BUILDKIT_INLINE_CACHE=1)
+if [ -n "${NODE_IMAGE:-}" ]; then
+    BUILD_ARGS+=(--build-arg "NODE_IMAGE=$NODE_IMAGE")
+fi
+
+export DOCKER_BUILDKIT=1
+
+start=$(date +%s)
+docker build --progress=plain --target builder "${BUILD_ARGS[@]}" \
+    --cache-from "$REPO_URI:builder-$ARCH" \
+    -t "$REPO_URI:builder-$ARCH" . 2>&1 | tee "$LOG"
+docker build --progress=plain "${BUILD_ARGS[@]}" \
+    --cache-from "$REPO_URI:builder-$ARCH" --cache-from "$REPO_URI:latest-$ARCH" \
+    -t "$IMAGE_URI" -t "$REPO_URI:latest-$ARCH" . 2>&1 | tee -a "$LOG"
+seconds=$(( $(date +%s) - start ))
+
+# BuildKit's plain progress prints "#<n> [stage i/n] <instruction>" for each step and "#<n> CACHED" for a cache hit
+steps=$(grep -cE '^#[0-9]+ \[.+ [0-9]+/[0-9]+\]' "$LOG" || true)
+cached=$(grep -cE '^#[0-9]+ CACHED' "$LOG" || true)
+hit_ratio=$(( steps > 0 ? cached * 100 / steps : 0 ))
+rm -f "$LOG"
+
+echo "Build took ${seconds}s, ${cached} of ${steps} steps cached (${hit_ratio}%)"
+
+if [ -n "${CODEBUILD_BUILD_ID:-}" ]; then
+    project=${CODEBUILD_BUILD_ID%%:*}
+    aws cloudwatch put-metric-data --namespace Ghost/Build --dimensions "Project=$project" \
+        --metric-name BuildDuration --value "$seconds" --unit Seconds \
+        && aws cloudwatch put-metric-data --namespace Ghost/Build --dimensions "Project=$project" \
+        --metric-name CachedSteps --value "$hit_ratio" --unit Percent \
+        || echo "Could not publish the build metrics"
+fi
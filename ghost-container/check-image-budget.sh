@@ -0,0 +1,30 @@
+#!/bin/bash
+# Reports the size and layer count of a built image (and its largest layers) and
+# fails if either is over budget.
+#
+#   IMAGE_SIZE_BUDGET_MB=300 IMAGE_LAYER_BUDGET=15 ./check-image-budget.sh <image>
+set -euo pipefail
+
+IMAGE=$1
+SIZE_BUDGET_MB=${IMAGE_SIZE_BUDGET_MB:-300}
+LAYER_BUDGET=${IMAGE_LAYER_BUDGET:-15}
+
+size_mb=$(( $(docker image inspect -f '{{.Size}}' "$IMAGE") / 1024 / 1024 ))
+layers=$(docker image inspect -f '{{len .RootFS.Layers}}' "$IMAGE")
+
+echo "Largest layers of $IMAGE:"
+docker history --no-trunc --format '{{.Size}}\t{{.CreatedBy}}' "$IMAGE" \
+    | grep -v '^0B' | sort -hr | head -n 5 | cut -c 1-150
+echo "Image size: ${size_mb}MB (budget ${SIZE_BUDGET_MB}MB)"
+echo "Layers: ${layers} (budget ${LAYER_BUDGET})"
+
+status=0
+if [ "$size_mb" -gt "$SIZE_BUDGET_MB" ]; then
+    echo "FAIL: the image is ${size_mb}MB, over its ${SIZE_BUDGET_MB}MB budget"
+    status=1
+fi
+if [ "$layers" -gt "$LAYER_BUDGET" ]; then
+    echo "FAIL: the image has ${layers} layers, over its budget of ${LAYER_BUDGET}"
+    status=1
+fi
+exit $status
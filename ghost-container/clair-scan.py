@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# Scans a locally built image with Clair (v1 API), caching the results in S3
+# by layer so unchanged layers are not sent to Clair again.
+#
+# Layers are read from `docker save` rather than the registry, so the scan can
+# run while the image is being pushed. Each layer is named after its chain ID
+# (its diff ID and those of the layers under it). The cache in
+# s3://$CLAIR_CACHE_BUCKET/clair-cache/<db version>-<architecture>.json records
+# the layers Clair has indexed and the vulnerabilities found for each image's
+# top layer. It is per architecture because the amd64 and arm64 builds scan at
+# the same time and would overwrite each other's updates to a shared file.
+# Clair's API doesn't expose its vulnerability database version, so it
+# defaults to the day (UTC). Vulnerabilities found since are picked up the next
+# day, or set CLAIR_DB_VERSION to control it.
+#
+# Fails like klar did: when more than CLAIR_THRESHOLD (default 0)
+# vulnerabilities of CLAIR_OUTPUT severity (default Unknown) or higher are found.
+# Prints the scan time and cache hit ratio, and in CodeBuild also publishes
+# them to CloudWatch (namespace Ghost/Build).
+#
+#   CLAIR_URL=http://clair:6060 CLAIR_CACHE_BUCKET=my-bucket ./clair-scan.py <image>
+
+import datetime
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+SEVERITIES = ["Unknown", "Negligible", "Low", "Medium", "High", "Critical", "Defcon1"]
+
+CACHE_PREFIX = "clair-cache/"
+LAYER_PREFIX = "clair-layers/"
+PRESIGN_SECONDS = 3600
+
+
+def log(message):
+    print(message, flush=True)
+
+
+def run(*command):
+    return subprocess.check_output(command).decode("utf-8").strip()
+
+
+def clair(method, path, body=None):
+    request = urllib.request.Request(
+        os.environ["CLAIR_URL"].rstrip("/") + path,
+        data=json.dumps(body).encode("utf-8") if body is not None else None,
+        headers={"Content-Type": "application/json"},
+        method=method)
+    with urllib.request.urlopen(request, timeout=600) as response:
+        return json.loads(response.read().decode("utf-8") or "{}")
+
+
+def chain_ids(diff_ids):
+    """A layer's chain ID identifies it together with everything under it."""
+    chain = []
+    for diff_id in diff_ids:
+        if not chain:
+            chain.append(diff_id)
+        else:
+            chain.append("sha256:" + hashlib.sha256((chain[-1] + " " + diff_id).encode("ascii")).hexdigest())
+    return chain
+
+
+def load_cache(bucket, key):
+    try:
+        return json.loads(run("aws", "s3", "cp", "--quiet", "s3://{}/{}".format(bucket, key), "-"))
+    except (subprocess.CalledProcessError, ValueError):
+        return {"indexed": [], "verdicts": {}}
+
+
+def save_cache(bucket, key, cache):
+    with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+        json.dump(cache, f)
+        f.flush()
+        run("aws", "s3", "cp", "--quiet", f.name, "s3://{}/{}".format(bucket, key))
+
+
+def saved_layers(image, workdir):
+    """Saves the image and returns the paths of its layer tars, bottom first."""
+    archive = os.path.join(workdir, "image.tar")
+    subprocess.check_call(["docker", "save", "-o", archive, image])
+    with tarfile.open(archive) as tar:
+        manifest = json.load(tar.extractfile("manifest.json"))[0]
+        tar.extractall(workdir, members=[m for m in tar.getmembers() if m.name in manifest["Layers"]])
+    os.remove(archive)
+    return [os.path.join(workdir, layer) for layer in manifest["Layers"]]
+
+
+def index_layers(image, names, indexed, bucket):
+    """Sends Clair the layers it hasn't indexed yet, via presigned S3 URLs."""
+    with tempfile.TemporaryDirectory() as workdir:
+        tars = saved_layers(image, workdir)
+        for i, name in enumerate(names):
+            if name in indexed:
+                continue
+            key = LAYER_PREFIX + name.split(":")[1] + ".tar"
+            run("aws", "s3", "cp", "--quiet", tars[i], "s3://{}/{}".format(bucket, key))
+            url = run("aws", "s3", "presign", "s3://{}/{}".format(bucket, key), "--expires-in", str(PRESIGN_SECONDS))
+            layer = {"Name": name, "Path": url, "Format": "Docker"}
+            if i > 0:
+                layer["ParentName"] = names[i - 1]
+            log("Indexing layer {}/{} {}".format(i + 1, len(names), name))
+            clair("POST", "/v1/layers", {"Layer": layer})
+            run("aws", "s3", "rm", "--quiet", "s3://{}/{}".format(bucket, key))
+            indexed.add(name)
+
+
+def vulnerabilities(name):
+    layer = clair("GET", "/v1/layers/{}?features&vulnerabilities".format(name))["Layer"]
+    found = []
+    for feature in layer.get("Features", []):
+        for vulnerability in feature.get("Vulnerabilities", []):
+            found.append({
+                "name": vulnerability["Name"],
+                "severity": vulnerability.get("Severity", "Unknown"),
+                "package": "{} {}".format(feature["Name"], feature.get("Version", "")),
+                "fixedBy": vulnerability.get("FixedBy", ""),
+            })
+    return found
+
+
+def publish(metrics):
+    if not os.environ.get("CODEBUILD_BUILD_ID"):
+        return
+    project = os.environ["CODEBUILD_BUILD_ID"].split(":")[0]
+    for name, value, unit in metrics:
+        try:
+            run("aws", "cloudwatch", "put-metric-data", "--namespace", "Ghost/Build",
+                "--dimensions", "Project=" + project, "--metric-name", name,
+                "--value", str(value), "--unit", unit)
+        except subprocess.CalledProcessError:
+            log("Could not publish {}".format(name))
+
+
+def main():
+    image = sys.argv[1]
+    bucket = os.environ["CLAIR_CACHE_BUCKET"]
+    db_version = os.environ.get("CLAIR_DB_VERSION") or datetime.datetime.utcnow().strftime("%Y-%m-%d")
+    threshold = int(os.environ.get("CLAIR_THRESHOLD", "0"))
+    min_severity = SEVERITIES.index(os.environ.get("CLAIR_OUTPUT", "Unknown"))
+
+    start = time.time()
+    architecture = run("docker", "image", "inspect", "-f", "{{.Architecture}}", image)
+    cache_key = "{}{}-{}.json".format(CACHE_PREFIX, db_version, architecture)
+    names = chain_ids(json.loads(run("docker", "image", "inspect", "-f", "{{json .RootFS.Layers}}", image)))
+    cache = load_cache(bucket, cache_key)
+    indexed = set(cache["indexed"])
+    top = names[-1]
+
+    if top in cache["verdicts"]:
+        hits = len(names)
+        found = cache["verdicts"][top]
+        log("Found the scan result for {} in the cache".format(top))
+    else:
+        hits = sum(1 for name in names if name in indexed)
+        try:
+            index_layers(image, names, indexed, bucket)
+        except urllib.error.HTTPError as err:
+            # e.g. Clair was redeployed with an empty database and lost the cached layers
+            log("Clair rejected a layer ({}), indexing them all again".format(err))
+            indexed.clear()
+            hits = 0
+            index_layers(image, names, indexed, bucket)
+        found = vulnerabilities(top)
+        cache["indexed"] = sorted(indexed)
+        cache["verdicts"][top] = found
+        save_cache(bucket, cache_key, cache)
+
+    seconds = time.time() - start
+    hit_ratio = 100.0 * hits / len(names)
+    failing = [v for v in found
+               if SEVERITIES.index(v["severity"] if v["severity"] in SEVERITIES else "Unknown") >= min_severity]
+
+    for vulnerability in failing:
+        log("{severity}: {name} in {package} (fixed by {fixedBy})".format(**vulnerability))
+    log(json.dumps({
+        "msg": "clair scan",
+        "image": image,
+        "layers": len(names),
+        "cacheHits": hits,
+        "cacheHitRatio": round(hit_ratio, 1),
+        "scanSeconds": round(seconds, 1),
+        "vulnerabilities": len(found),
+        "failing": len(failing),
+        "dbVersion": db_version,
+        "architecture": architecture,
+    }))
+    publish([("ScanDuration", round(seconds, 1), "Seconds"), ("ScanCacheHits", round(hit_ratio, 1), "Percent")])
+
+    if len(failing) > threshold:
+        log("FAIL: {} vulnerabilities of {} or higher (threshold {})".format(
+            len(failing), SEVERITIES[min_severity], threshold))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 var knex = require('knex'),
+    Promise = require('bluebird'),
+    _ = require('lodash'),
     config = require('../../config'),
     common = require('../../lib/common'),
+    rdsToken = require('aws-auth').rdsToken,
     knexInstance;
 
 // @TODO:
@@ -25,19 +28,62 @@ function configure(dbConfig) {
             }));
         };
 
-        //Add support for MySQL IAM auth on RDS
-        dbConfig.connection.authSwitchHandler = function (data, cb) { // modifies the authentication handler
-          if (data.pluginName === 'mysql_clear_password') { // authentication token is sent in clear text but connection uses SSL encryption
-            cb(null, Buffer.from(dbConfig.connection.password + '\0'));
-          }
+        // Add support for MySQL IAM auth on RDS - tokens are cached and refreshed in the background
+        if (rdsToken.isEnabled(dbConfig.connection)) {
+            dbConfig.connection.authSwitchHandler = rdsToken.authSwitchHandler(dbConfig.connection);
         }
     }
 
     return dbConfig;
 }
 
+/**
+ * Pre-open the pool's minimum connections.
+ * The dialect holds every query until this settles, so the ALB health check
+ * can't pass before the pool is warm.
+ */
+function warmPool(instance) {
+    var pool = instance.client.pool,
+        min = pool ? pool.min : 0;
+
+    return Promise.all(_.times(min, function () {
+        return pool.acquire().promise;
+    })).then(function (connections) {
+        _.each(connections, function (connection) {
+            pool.release(connection);
+        });
+    }).catch(function (err) {
+        common.logging.error(new common.errors.InternalServerError({
+            code: 'DB_POOL_WARMUP',
+            err: err
+        }));
+    });
+}
+
+/**
+ * Periodically log the pool counters and acquire wait times.
+ */
+function logPoolStats(instance, interval) {
+    setInterval(function () {
+        var stats = instance.client.poolStats.snapshot(instance.client.pool);
+
+        common.logging.info('DB pool: ' + _.map(stats, function (value, key) {
+            return key + '=' + value;
+        }).join(' '));
+    }, interval).unref();
+}
+
 if (!knexInstance && config.get('database') && config.get('database').client) {
-    knexInstance = knex(configure(config.get('database')));
+    var dbConfig = configure(config.get('database')),
+        poolStatsInterval;
+
+    knexInstance = knex(dbConfig);
+    knexInstance.client.poolWarmup = warmPool(knexInstance);
+    poolStatsInterval = parseInt(_.get(dbConfig, 'pool.statsIntervalMillis'), 10);
+
+    if (poolStatsInterval > 0) {
+        logPoolStats(knexInstance, poolStatsInterval);
+    }
 }
 
 module.exports = knexInstance;
\ No newline at end of file
@@ -0,0 +1,216 @@
+'use strict';
+
+/**
+ * A Ghost storage adapter that keeps uploaded images in S3.
+ * Copied into content.orig/adapters/storage by the Dockerfile and enabled with
+ * `storage__active=s3`.
+ *
+ * Images are stored under `<prefix>/<content hash>/<file name>`, so an upload
+ * never overwrites another and uploading the same file twice stores it once.
+ * As a key's content never changes the objects are sent with a year long
+ * `Cache-Control: immutable`. The URLs handed to Ghost point at `assetHost`
+ * (S3 itself or the CloudFront distribution), so images are never served by
+ * the Ghost task.
+ *
+ * Options (`storage__s3__*`): bucket, region (defaults to AWSREGION), prefix
+ * (defaults to images), assetHost and endpoint (e.g. http://minio:9000 for a
+ * local S3 stand-in, which is addressed path-style).
+ */
+const fs = require('fs'),
+    path = require('path'),
+    crypto = require('crypto'),
+    http = require('http'),
+    https = require('https'),
+    url = require('url'),
+    Promise = require('bluebird'),
+    StorageBase = require('ghost-storage-base'),
+    awsAuth = require('aws-auth');
+
+const CACHE_CONTROL = 'public, max-age=31536000, immutable',
+    // characters of the SHA256 of the content used in the key
+    HASH_LENGTH = 16,
+    REQUEST_TIMEOUT = 30000;
+
+const readFile = Promise.promisify(fs.readFile);
+
+function sha256(data) {
+    return crypto.createHash('sha256').update(data).digest('hex');
+}
+
+class S3Storage extends StorageBase {
+    constructor(options) {
+        super();
+
+        options = options || {};
+        this.bucket = options.bucket;
+        this.region = options.region || process.env.AWSREGION || 'us-east-1';
+        this.prefix = (options.prefix || 'images').replace(/^\/+|\/+$/g, '');
+
+        if (options.endpoint) {
+            this.endpoint = url.parse(options.endpoint);
+            this.assetHost = options.assetHost || options.endpoint.replace(/\/+$/, '') + '/' + this.bucket;
+        } else {
+            this.endpoint = url.parse('https://' + this.bucket + '.s3.' + this.region + '.amazonaws.com');
+            this.assetHost = options.assetHost || this.endpoint.href.replace(/\/+$/, '');
+        }
+        this.assetHost = this.assetHost.replace(/\/+$/, '');
+
+        if (!this.bucket) {
+            throw new Error('The s3 storage adapter needs a bucket (storage__s3__bucket)');
+        }
+    }
+
+    /**
+     * The key for an image: its content hash and Ghost's sanitized file name.
+     */
+    keyFor(image, data) {
+        const ext = path.extname(image.name),
+            name = path.basename(image.name, ext).replace(/[^\w@.]/gi, '-');
+
+        return [this.prefix, sha256(data).substr(0, HASH_LENGTH), name + ext.toLowerCase()].join('/');
+    }
+
+    urlFor(key) {
+        return this.assetHost + '/' + key;
+    }
+
+    /**
+     * The key for a URL returned by save, or a key relative to the prefix.
+     */
+    keyFromPath(filePath) {
+        if (filePath.indexOf(this.assetHost + '/') === 0) {
+            return filePath.substr(this.assetHost.length + 1);
+        }
+        return [this.prefix, filePath.replace(/^\/+/, '')].join('/');
+    }
+
+    /**
+     * Sends a signed request for an object. Resolves with the response's status
+     * code, headers and body.
+     */
+    request(method, key, headers, body) {
+        const self = this,
+            objectPath = (this.endpoint.pathname || '/').replace(/\/+$/, '') +
+                (this.endpoint.hostname.indexOf(this.bucket + '.') === 0 ? '' : '/' + awsAuth.sigv4.uriEncode(this.bucket)) +
+                '/' + key.split('/').map(awsAuth.sigv4.uriEncode).join('/');
+
+        return awsAuth.credentials.getCredentials().then(function (creds) {
+            const signed = awsAuth.sigv4.sign({
+                method: method,
+                host: self.endpoint.host,
+                path: objectPath,
+                headers: headers,
+                payloadHash: sha256(body || ''),
+                service: 's3',
+                region: self.region,
+                credentials: creds
+            });
+
+            return new Promise(function (resolve, reject) {
+                const transport = self.endpoint.protocol === 'http:' ? http : https,
+                    req = transport.request({
+                        method: method,
+                        protocol: self.endpoint.protocol,
+                        hostname: self.endpoint.hostname,
+                        port: self.endpoint.port,
+                        path: objectPath,
+                        headers: signed
+                    }, function (res) {
+                        const chunks = [];
+
+                        res.on('data', function (chunk) {
+                            chunks.push(chunk);
+                        });
+                        res.on('end', function () {
+                            resolve({statusCode: res.statusCode, headers: res.headers, body: Buffer.concat(chunks)});
+                        });
+                    });
+
+                req.on('error', reject);
+                req.setTimeout(REQUEST_TIMEOUT, function () {
+                    req.abort();
+                    reject(new Error('S3 ' + method + ' ' + key + ' timed out'));
+                });
+                req.end(body);
+            });
+        });
+    }
+
+    /**
+     * Rejects unless the response has one of the expected status codes.
+     */
+    expect(method, key, statusCodes) {
+        return function (res) {
+            if (statusCodes.indexOf(res.statusCode) === -1) {
+                throw new Error('S3 ' + method + ' ' + key + ' returned ' + res.statusCode + ': ' + res.body.toString('utf8'));
+            }
+            return res;
+        };
+    }
+
+    objectExists(key) {
+        return this.request('HEAD', key)
+            .then(this.expect('HEAD', key, [200, 404]))
+            .then(function (res) {
+                return res.statusCode === 200;
+            });
+    }
+
+    exists(fileName, targetDir) {
+        return this.objectExists(targetDir ? [targetDir.replace(/^\/+|\/+$/g, ''), fileName].join('/') : this.keyFromPath(fileName));
+    }
+
+    /**
+     * Uploads the image unless an object with the same content and name is
+     * already there. Resolves with its URL. Ghost's targetDir (a YYYY/MM
+     * folder) is not used, the content hash keeps keys unique.
+     */
+    save(image) {
+        const self = this;
+
+        return readFile(image.path).then(function (data) {
+            const key = self.keyFor(image, data);
+
+            return self.objectExists(key).then(function (exists) {
+                if (exists) {
+                    return;
+                }
+                return self.request('PUT', key, {
+                    'Content-Type': image.type || 'application/octet-stream',
+                    'Content-Length': data.length,
+                    'Cache-Control': CACHE_CONTROL
+                }, data).then(self.expect('PUT', key, [200]));
+            }).then(function () {
+                return self.urlFor(key);
+            });
+        });
+    }
+
+    /**
+     * Images are served straight from S3 (or CloudFront), never by Ghost.
+     */
+    serve() {
+        return function serveS3(req, res, next) {
+            next();
+        };
+    }
+
+    delete(fileName, targetDir) {
+        const key = targetDir ? [targetDir.replace(/^\/+|\/+$/g, ''), fileName].join('/') : this.keyFromPath(fileName);
+
+        return this.request('DELETE', key)
+            .then(this.expect('DELETE', key, [200, 204]));
+    }
+
+    read(options) {
+        const key = this.keyFromPath((options || {}).path || '');
+
+        return this.request('GET', key)
+            .then(this.expect('GET', key, [200]))
+            .then(function (res) {
+                return res.body;
+            });
+    }
+}
+
+module.exports = S3Storage;
@@ -0,0 +1,19 @@
+#!/bin/bash
+# Pushes a manifest list (multi-architecture image) <repo>:<tag> of the
+# <repo>:<tag>-<arch> images and prints its digest. For <repo>:latest those are
+# the latest-<arch> tags each build pushes for its cache.
+#
+#   ./create-manifest.sh <repo>:<tag> amd64 arm64
+set -euo pipefail
+
+IMAGE_URI=$1
+shift
+IMAGES=()
+for arch in "$@"; do
+    IMAGES+=("$IMAGE_URI-$arch")
+done
+
+# --amend replaces the list a previous build left under the same tag
+docker manifest create --amend "$IMAGE_URI" "${IMAGES[@]}" >&2
+# the digest of the pushed list is the last line
+docker manifest push --purge "$IMAGE_URI" | tail -n 1
@@ -4,6 +4,7 @@ const knex = require('knex'),
     Promise = require('bluebird'),
     omit = require('lodash/omit'),
     debug = require('debug')('knex-migrator:database'),
+    rdsToken = require('aws-auth').rdsToken,
     errors = require('./errors');
 
 /**
@@ -21,11 +22,9 @@ exports.connect = function connect(options) {
         options.connection.timezone = options.connection.timezone || 'UTC';
         options.connection.charset = options.connection.charset || 'utf8mb4';
 
-        //Add support for MySQL IAM auth on RDS
-        options.connection.authSwitchHandler = function (data, cb) { // modifies the authentication handler
-          if (data.pluginName === 'mysql_clear_password') { // authentication token is sent in clear text but connection uses SSL encryption
-            cb(null, Buffer.from(options.connection.password + '\0'));
-          }
+        // Add support for MySQL IAM auth on RDS - tokens are cached and refreshed in the background
+        if (rdsToken.isEnabled(options.connection)) {
+            options.connection.authSwitchHandler = rdsToken.authSwitchHandler(options.connection);
         }
     }
 
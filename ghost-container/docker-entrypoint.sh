@@ -1,34 +1,80 @@
 #!/bin/bash
 set -e
 
+# Boot phase timings, in ms since the host booted (/proc/uptime works on busybox
+# and across the su-exec below). They are passed to Ghost in BOOT_PHASES and
+# logged by server-hooks.js as one line once Ghost is listening.
+now_ms() {
+        local uptime
+        read -r uptime _ < /proc/uptime
+        echo $(( 10#${uptime/./} * 10 ))
+}
+
+# phase <name> <start ms>
+phase() {
+        BOOT_PHASES="${BOOT_PHASES:+$BOOT_PHASES,}\"$1\":$(( $(now_ms) - $2 ))"
+        export BOOT_PHASES
+}
+
+# The content directory is already seeded from this image's content.orig
+# (e.g. a reused volume, or the copy pre-seeded into the image)
+content_is_seeded() {
+        [ "$GHOST_FAST_BOOT" = 'true' ] \
+                && [ -f "$GHOST_CONTENT/.content.orig.md5" ] \
+                && cmp -s "$GHOST_CONTENT/.content.orig.md5" "$GHOST_INSTALL/content.orig.md5"
+}
+
+# is the container starting Ghost (directly or clustered), rather than e.g. knex-migrator
+is_ghost() {
+        [[ "$*" == node*current/index.js* ]] || [[ "$*" == node*ghost-cluster.js* ]]
+}
+
 # allow the container to be started with `--user`
-if [[ "$*" == node*current/index.js* ]] && [ "$(id -u)" = '0' ]; then
-        chown -R node "$GHOST_CONTENT"
+if is_ghost "$@" && [ "$(id -u)" = '0' ]; then
+        start=$(now_ms)
+        if ! content_is_seeded; then
+                chown -R node "$GHOST_CONTENT"
+        fi
+        phase chown "$start"
+        # the micro-cache sidecar's files belong to nginx, so its purge helper stays root
+        if [ -n "$MICRO_CACHE_DIR" ]; then
+                node "$GHOST_INSTALL/micro-cache-purge.js" &
+        fi
         exec su-exec node "$BASH_SOURCE" "$@"
 fi
 
-if [[ "$*" == node*current/index.js* ]]; then
-        baseDir="$GHOST_INSTALL/content.orig"
-        for src in "$baseDir"/*/ "$baseDir"/themes/*; do
-                src="${src%/}"
-                target="$GHOST_CONTENT/${src#$baseDir/}"
-                mkdir -p "$(dirname "$target")"
-                if [ ! -e "$target" ]; then
-                        tar -cC "$(dirname "$src")" "$(basename "$src")" | tar -xC "$(dirname "$target")"
-                fi
-        done
-
-        # Determine what region we are in and save that as AWSREGION
-        # export AWSREGION=$(curl -s 169.254.169.254/latest/meta-data/placement/availability-zone | sed 's/.$//')
-
-        # Set the database__connection__password environmnet variable to the temporary auth token
-        export database__connection__password=$(aws rds generate-db-auth-token \
-        --hostname $database__connection__host \
-        --port 3306 \
-        --username $database__connection__user \
-        --region $AWSREGION)
-
-        knex-migrator-migrate --init --mgpath "$GHOST_INSTALL/current"
+if is_ghost "$@"; then
+        start=$(now_ms)
+        if content_is_seeded; then
+                BOOT_FAST=true
+        else
+                baseDir="$GHOST_INSTALL/content.orig"
+                for src in "$baseDir"/*/ "$baseDir"/themes/* "$baseDir"/adapters/storage/*; do
+                        src="${src%/}"
+                        target="$GHOST_CONTENT/${src#$baseDir/}"
+                        mkdir -p "$(dirname "$target")"
+                        if [ ! -e "$target" ]; then
+                                tar -cC "$(dirname "$src")" "$(basename "$src")" | tar -xC "$(dirname "$target")"
+                        fi
+                done
+                cp "$GHOST_INSTALL/content.orig.md5" "$GHOST_CONTENT/.content.orig.md5"
+        fi
+        phase seed "$start"
+        export BOOT_FAST="${BOOT_FAST:-false}"
+
+        # The RDS IAM auth token is generated, cached and refreshed in-process by the
+        # aws-auth module whenever knex opens a new connection
+
+        # On Fargate the schema is migrated once per deploy by a one-shot migration task.
+        # Ghost itself still checks the schema version is current (knex-migrator isDatabaseOK)
+        # on boot and refuses to start against an outdated database.
+        start=$(now_ms)
+        if [ "$GHOST_MIGRATE_ON_BOOT" = 'true' ]; then
+                knex-migrator-migrate --init --mgpath "$GHOST_INSTALL/current"
+        fi
+        phase migrate "$start"
+
+        export BOOT_EXEC_AT=$(now_ms)
 fi
 
-exec "$@"
\ No newline at end of file
+exec "$@"
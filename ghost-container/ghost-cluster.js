@@ -0,0 +1,152 @@
+'use strict';
+
+/**
+ * Starts Ghost, as GHOST_WORKERS clustered processes sharing port 2368 when
+ * that is more than one. The default is the task's vCPU count from the ECS task
+ * metadata endpoint (or the number of CPUs outside ECS).
+ *
+ * Every worker is a whole Ghost with its own knex pool, preloaded with
+ * server-hooks.js and micro-cache-webhook.js. Only the first worker runs the
+ * post scheduler, the others get the no-op adapter in ghost-scheduling-noop.
+ * A worker that dies is replaced (keeping the scheduler if it had it). On
+ * SIGTERM the master passes the signal on to the workers and exits once they
+ * have drained.
+ *
+ * Workers are also preloaded with worker-sync.js, and the master passes each
+ * settings or theme change a worker reports on to the others, so they don't
+ * keep serving their old settings.
+ */
+const cluster = require('cluster'),
+    http = require('http'),
+    os = require('os'),
+    path = require('path');
+
+const GHOST = path.join(__dirname, 'current/index.js'),
+    SERVER_HOOKS = path.join(__dirname, 'server-hooks.js'),
+    WORKER_SYNC = path.join(__dirname, 'worker-sync.js'),
+    MICRO_CACHE_WEBHOOK = path.join(__dirname, 'micro-cache-webhook.js'),
+    WORKER_SYNC_MESSAGE = 'ghost-worker-sync',
+    METADATA_TIMEOUT = 1000;
+
+function log(message) {
+    console.log(JSON.stringify({msg: message, time: new Date().toISOString(), name: 'ghost-cluster'}));
+}
+
+/**
+ * Resolves with the task's vCPUs from the ECS task metadata endpoint, or null.
+ */
+function taskCpus() {
+    const endpoint = process.env.ECS_CONTAINER_METADATA_URI_V4 || process.env.ECS_CONTAINER_METADATA_URI;
+
+    if (!endpoint) {
+        return Promise.resolve(null);
+    }
+    return new Promise(function (resolve) {
+        const req = http.get(endpoint + '/task', function (res) {
+            let body = '';
+
+            res.setEncoding('utf8');
+            res.on('data', function (chunk) {
+                body += chunk;
+            });
+            res.on('end', function () {
+                try {
+                    resolve(JSON.parse(body).Limits.CPU || null);
+                } catch (err) {
+                    resolve(null);
+                }
+            });
+        });
+
+        req.on('error', function () {
+            resolve(null);
+        });
+        req.setTimeout(METADATA_TIMEOUT, function () {
+            req.abort();
+        });
+    });
+}
+
+function workerCount() {
+    const configured = parseInt(process.env.GHOST_WORKERS, 10);
+
+    if (configured > 0) {
+        return Promise.resolve(configured);
+    }
+    return taskCpus().then(function (cpus) {
+        return Math.max(1, Math.floor(cpus || os.cpus().length));
+    });
+}
+
+function runCluster(count) {
+    let shuttingDown = false;
+
+    cluster.setupMaster({exec: GHOST, execArgv: process.execArgv.concat(['-r', SERVER_HOOKS, '-r', WORKER_SYNC, '-r', MICRO_CACHE_WEBHOOK])});
+
+    function fork(id, scheduler) {
+        const env = {GHOST_WORKER_ID: id};
+
+        if (!scheduler) {
+            env.scheduling__active = 'ghost-scheduling-noop';
+        }
+        const worker = cluster.fork(env);
+        worker.ghostId = id;
+        worker.scheduler = scheduler;
+        return worker;
+    }
+
+    // see worker-sync.js
+    cluster.on('message', function (from, message) {
+        if (!message || message.type !== WORKER_SYNC_MESSAGE) {
+            return;
+        }
+        Object.keys(cluster.workers).forEach(function (id) {
+            const worker = cluster.workers[id];
+
+            if (worker !== from && worker.isConnected()) {
+                worker.send(message);
+            }
+        });
+    });
+
+    cluster.on('exit', function (worker, code, signal) {
+        if (shuttingDown) {
+            if (!Object.keys(cluster.workers).length) {
+                log('All workers have exited');
+                process.exit(0);
+            }
+            return;
+        }
+        log('Worker ' + worker.ghostId + ' exited (' + (signal || code) + '), starting a new one');
+        fork(worker.ghostId, worker.scheduler);
+    });
+
+    ['SIGTERM', 'SIGINT'].forEach(function (signal) {
+        process.on(signal, function () {
+            if (shuttingDown) {
+                return;
+            }
+            shuttingDown = true;
+            log('Received ' + signal + ', stopping ' + Object.keys(cluster.workers).length + ' workers');
+            Object.keys(cluster.workers).forEach(function (id) {
+                cluster.workers[id].process.kill(signal);
+            });
+        });
+    });
+
+    log('Starting ' + count + ' Ghost workers');
+    for (let id = 1; id <= count; id += 1) {
+        fork(id, id === 1);
+    }
+}
+
+workerCount().then(function (count) {
+    if (count === 1) {
+        // No need for a master process
+        require(SERVER_HOOKS);
+        require(MICRO_CACHE_WEBHOOK);
+        require(GHOST);
+        return;
+    }
+    runCluster(count);
+});
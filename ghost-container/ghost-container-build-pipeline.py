@@ -1,11 +1,13 @@
 # Template to create CodePipeline for Ghost
 # By Jason Umiker (jason.umiker@gmail.com)
 
-from troposphere import Parameter, Ref, Template, GetAtt, Join
+import json
+
+from troposphere import Parameter, Ref, Template, GetAtt, Join, Sub, Output, If, Equals
 from troposphere.codepipeline import (
     Pipeline, Stages, Actions, ActionTypeId, OutputArtifacts, InputArtifacts,
     ArtifactStore)
-from troposphere import iam, s3, events
+from troposphere import iam, s3, events, awslambda, cloudwatch
 
 t = Template()
 
@@ -20,11 +22,25 @@ CodeCommitRepo = t.add_parameter(Parameter(
 
 CodeBuildProject = t.add_parameter(Parameter(
     "CodeBuildProject",
-    Description="The name of the CodeBuild Project to use for the Build Phase",
+    Description="The name of the CodeBuild Project that builds the amd64 image in the Build Phase",
     Default='ghost-clair-build',
     Type="String"
 ))
 
+CodeBuildProjectArm64 = t.add_parameter(Parameter(
+    "CodeBuildProjectArm64",
+    Description="The name of the CodeBuild Project that builds the arm64 image in the Build Phase",
+    Default='ghost-clair-build-arm64',
+    Type="String"
+))
+
+ManifestProject = t.add_parameter(Parameter(
+    "ManifestProject",
+    Description="The name of the CodeBuild Project that combines the images into a multi-architecture one",
+    Default='ghost-manifest',
+    Type="String"
+))
+
 ECSClusterName = t.add_parameter(Parameter(
     "ECSClusterName",
     Description="The name of the ECS Cluster to pass to the deployment stack",
@@ -38,6 +54,17 @@ DependencyStackName = t.add_parameter(Parameter(
     Type="String"
 ))
 
+DeploymentType = t.add_parameter(Parameter(
+    "DeploymentType",
+    Description="How the Deploy stage deploys a new image: rolling updates the Ghost-Fargate stack, "
+                "blue-green has CodeDeploy switch the Ghost service to it (the stack's DeploymentType must match)",
+    Default='rolling',
+    AllowedValues=['rolling', 'blue-green'],
+    Type="String"
+))
+
+t.add_condition("UseBlueGreen", Equals(Ref(DeploymentType), "blue-green"))
+
 # Create the required Resources
 
 # Create the S3 Bucket to store Artifacts
@@ -77,7 +104,9 @@ CodePipelineServicePolicy = t.add_resource(iam.PolicyType(
                     "codebuild:BatchGetBuilds"
                 ],
                 "Resource": [
-                    Join("", ["arn:aws:codebuild:", Ref('AWS::Region'), ":", Ref('AWS::AccountId'), ":project/", Ref(CodeBuildProject)])
+                    Join("", ["arn:aws:codebuild:", Ref('AWS::Region'), ":", Ref('AWS::AccountId'), ":project/", Ref(CodeBuildProject)]),
+                    Join("", ["arn:aws:codebuild:", Ref('AWS::Region'), ":", Ref('AWS::AccountId'), ":project/", Ref(CodeBuildProjectArm64)]),
+                    Join("", ["arn:aws:codebuild:", Ref('AWS::Region'), ":", Ref('AWS::AccountId'), ":project/", Ref(ManifestProject)])
                 ]
             },
             {
@@ -127,6 +156,27 @@ CodePipelineServicePolicy = t.add_resource(iam.PolicyType(
                     "cloudformation:ValidateTemplate",
                 ],
                 "Resource": "*"
+            },
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "lambda:InvokeFunction",
+                    "lambda:ListFunctions"
+                ],
+                "Resource": "*"
+            },
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "codedeploy:CreateDeployment",
+                    "codedeploy:GetApplication",
+                    "codedeploy:GetApplicationRevision",
+                    "codedeploy:GetDeployment",
+                    "codedeploy:GetDeploymentConfig",
+                    "codedeploy:RegisterApplicationRevision",
+                    "ecs:RegisterTaskDefinition"
+                ],
+                "Resource": "*"
             }
         ]
     },
@@ -163,6 +213,24 @@ CloudFormationServicePolicy = t.add_resource(iam.PolicyType(
                 ],
                 "Resource": "*"
             },
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "lambda:InvokeFunction"
+                ],
+                "Resource": "*"
+            },
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "application-autoscaling:*",
+                    "cloudwatch:DescribeAlarms",
+                    "cloudwatch:PutMetricAlarm",
+                    "cloudwatch:DeleteAlarms",
+                    "iam:CreateServiceLinkedRole"
+                ],
+                "Resource": "*"
+            },
         ]
     },
     Roles = [Ref(CloudFormationServiceRole)],
@@ -179,6 +247,146 @@ CloudWatchEventsRole = t.add_resource(iam.Role(
         }]},
 ))
 
+# The Ghost-Fargate parameters the Deploy stage sets, other than GhostImage
+deploy_parameters = {
+    "Cluster": "${ECSClusterName}",
+    "DependencyStackName": "${DependencyStackName}"
+}
+
+# Create the Lambda that skips deploys that would change nothing
+# It compares the built image (pinned by digest) with the one the Ghost service
+# is running. For rolling deploys it also compares the template and parameters
+# with the Ghost-Fargate stack's. When all match it stops the
+# pipeline execution after its own action, so an unchanged image (e.g. from a
+# README-only commit) isn't redeployed.
+DeployCheckRole = t.add_resource(iam.Role(
+    "DeployCheckRole",
+    AssumeRolePolicyDocument={
+        'Statement': [{
+            'Effect': 'Allow',
+            'Principal': {'Service': ['lambda.amazonaws.com']},
+            'Action': ["sts:AssumeRole"]
+        }]},
+))
+
+# The pipeline can't be referenced here as it depends on this policy
+DeployCheckPolicy = t.add_resource(iam.PolicyType(
+    "DeployCheckPolicy",
+    PolicyName="deploy-check",
+    PolicyDocument={'Version': '2012-10-17',
+                    'Statement': [{'Action': ['logs:CreateLogGroup',
+                                              'logs:CreateLogStream',
+                                              'logs:PutLogEvents',
+                                              'codepipeline:GetJobDetails',
+                                              'codepipeline:PutJobSuccessResult',
+                                              'codepipeline:PutJobFailureResult',
+                                              'cloudformation:DescribeStacks',
+                                              'cloudformation:GetTemplate',
+                                              'ecs:DescribeServices',
+                                              'ecs:DescribeTaskDefinition'
+                                              ],
+                                   'Resource': ['*'],
+                                   'Effect': 'Allow'},
+                                  {'Action': ['codepipeline:StopPipelineExecution'],
+                                   'Resource': [Join("", ["arn:aws:codepipeline:", Ref('AWS::Region'), ":", Ref('AWS::AccountId'), ":*"])],
+                                   'Effect': 'Allow'},
+                                  ]},
+    Roles=[Ref(DeployCheckRole)],
+))
+
+deploy_check_code = [
+    "import io",
+    "import json",
+    "import zipfile",
+    "import boto3",
+    "",
+    "codepipeline = boto3.client('codepipeline')",
+    "cloudformation = boto3.client('cloudformation')",
+    "ecs = boto3.client('ecs')",
+    "",
+    "SETTLED = ['CREATE_COMPLETE', 'UPDATE_COMPLETE']",
+    "",
+    "def read_artifact(job):",
+    "    location = job['data']['inputArtifacts'][0]['location']['s3Location']",
+    "    credentials = job['data']['artifactCredentials']",
+    "    s3 = boto3.client('s3', aws_access_key_id=credentials['accessKeyId'],",
+    "                      aws_secret_access_key=credentials['secretAccessKey'],",
+    "                      aws_session_token=credentials['sessionToken'])",
+    "    body = s3.get_object(Bucket=location['bucketName'], Key=location['objectKey'])['Body'].read()",
+    "    return zipfile.ZipFile(io.BytesIO(body))",
+    "",
+    "def running_image(cluster, service):",
+    "    task_definition = ecs.describe_services(cluster=cluster, services=[service])['services'][0]['taskDefinition']",
+    "    containers = ecs.describe_task_definition(taskDefinition=task_definition)['taskDefinition']['containerDefinitions']",
+    "    return [c['image'] for c in containers if c['name'] == 'ghost'][0]",
+    "",
+    "def changes(job):",
+    "    settings = json.loads(job['data']['actionConfiguration']['configuration']['UserParameters'])",
+    "    artifact = read_artifact(job)",
+    "    image = json.loads(artifact.read('images.json').decode('utf-8'))['imageUri']",
+    "    try:",
+    "        stack = cloudformation.describe_stacks(StackName=settings['StackName'])['Stacks'][0]",
+    "    except Exception:",
+    "        return ['there is no ' + settings['StackName'] + ' stack yet']",
+    "",
+    "    found = []",
+    "    outputs = {o['OutputKey']: o['OutputValue'] for o in stack.get('Outputs', [])}",
+    "    running = running_image(settings['Parameters']['Cluster'], outputs['GhostFargateServiceName'])",
+    "    if running != image:",
+    "        found.append('the service runs ' + running + ', not ' + image)",
+    "    if settings['DeploymentType'] == 'blue-green':",
+    "        return found",
+    "",
+    "    if stack['StackStatus'] not in SETTLED:",
+    "        found.append('the stack is ' + stack['StackStatus'])",
+    "    template = json.loads(artifact.read(settings['TemplatePath']).decode('utf-8'))",
+    "    deployed = cloudformation.get_template(StackName=settings['StackName'])['TemplateBody']",
+    "    if not isinstance(deployed, dict):",
+    "        deployed = json.loads(deployed)",
+    "    if json.dumps(deployed, sort_keys=True) != json.dumps(template, sort_keys=True):",
+    "        found.append('the template changed')",
+    "    # parameters the pipeline doesn't set are deployed with their defaults",
+    "    wanted = {name: str(p['Default']) for name, p in template.get('Parameters', {}).items() if 'Default' in p}",
+    "    wanted.update(settings['Parameters'], GhostImage=image)",
+    "    current = {p['ParameterKey']: p['ParameterValue'] for p in stack.get('Parameters', [])}",
+    "    for name in sorted(wanted):",
+    "        if current.get(name) != wanted[name]:",
+    "            found.append(name + ' ' + str(current.get(name)) + ' -> ' + wanted[name])",
+    "    return found",
+    "",
+    "def handler(event, context):",
+    "    job = event['CodePipeline.job']",
+    "    try:",
+    "        found = changes(job)",
+    "    except Exception as error:",
+    "        # only an optimization, deploy when in doubt",
+    "        found = ['could not compare: ' + str(error)]",
+    "    summary = ('Deploying: ' + '; '.join(found)) if found else 'Nothing to deploy, stopping'",
+    "    print(summary)",
+    "",
+    "    if not found:",
+    "        # stop and wait lets this action finish, then no other action starts",
+    "        pipeline = codepipeline.get_job_details(jobId=job['id'])['jobDetails']['data']['pipelineContext']",
+    "        codepipeline.stop_pipeline_execution(",
+    "            pipelineName=pipeline['pipelineName'],",
+    "            pipelineExecutionId=pipeline['pipelineExecutionId'],",
+    "            abandon=False,",
+    "            reason='No changes to deploy: the image, template and parameters match the running service')",
+    "    codepipeline.put_job_success_result(jobId=job['id'], executionDetails={'summary': summary[:2048]})",
+]
+
+DeployCheckFunction = t.add_resource(awslambda.Function(
+    "DeployCheckFunction",
+    Code=awslambda.Code(
+        ZipFile=Join("\n", deploy_check_code)
+    ),
+    Handler="index.handler",
+    Role=GetAtt("DeployCheckRole", "Arn"),
+    Runtime="python3.6",
+    MemorySize="256",
+    Timeout="60"
+))
+
 # Create the CodePipeline to link the Repo to the Build to ECS
 pipeline = t.add_resource(Pipeline(
     "GhostPipeline",
@@ -211,9 +419,29 @@ pipeline = t.add_resource(Pipeline(
         ),
         Stages(
             Name="Build",
+            # The amd64 and arm64 images are built at the same time, then combined
             Actions=[
                 Actions(
-                    Name="Build",
+                    Name=name,
+                    InputArtifacts=[
+                        InputArtifacts(
+                            Name="SourceOutput"
+                        )
+                    ],
+                    ActionTypeId=ActionTypeId(
+                        Category="Build",
+                        Owner="AWS",
+                        Version="1",
+                        Provider="CodeBuild"
+                    ),
+                    Configuration={
+                        "ProjectName": Ref(project),
+                    },
+                    RunOrder="1"
+                ) for name, project in (("Build", CodeBuildProject), ("BuildArm64", CodeBuildProjectArm64))
+            ] + [
+                Actions(
+                    Name="Manifest",
                     InputArtifacts=[
                         InputArtifacts(
                             Name="SourceOutput"
@@ -231,41 +459,114 @@ pipeline = t.add_resource(Pipeline(
                         )
                     ],
                     Configuration={
-                        "ProjectName": Ref(CodeBuildProject),
+                        "ProjectName": Ref(ManifestProject),
                     },
-                    RunOrder="1"
+                    RunOrder="2"
                 )
             ]
         ),
         Stages(
             Name="Deploy",
             Actions=[
+                # Stops the execution here when the build changed nothing that is deployed
                 Actions(
-                    Name="Deploy",
+                    Name="CheckForChanges",
                     InputArtifacts=[
                         InputArtifacts(
                             Name="BuildOutput"
                         )
                     ],
                     ActionTypeId=ActionTypeId(
-                        Category="Deploy",
+                        Category="Invoke",
                         Owner="AWS",
                         Version="1",
-                        Provider="CloudFormation"
+                        Provider="Lambda"
                     ),
                     Configuration={
-                        "ActionMode": "REPLACE_ON_FAILURE",
-                        "Capabilities": "CAPABILITY_IAM",
-                        "RoleArn": GetAtt('CloudFormationServiceRole', 'Arn'),
-
-                        "ParameterOverrides": Join("", ["{","\"Cluster\"",":","\"",Ref(ECSClusterName),"\"",",",
-                                                        "\"DependencyStackName\"",":","\"",Ref(DependencyStackName),"\"",",",
-                                                        "\"GhostImage\"",":",
-                                                        "{\"Fn::GetParam\" : [\"BuildOutput\",\"images.json\",\"imageUri\"]}","}"]),
-                        "TemplatePath": "BuildOutput::ghost-deploy-fargate.template",
-                        "StackName": "Ghost-Fargate"
+                        "FunctionName": Ref(DeployCheckFunction),
+                        "UserParameters": Sub(json.dumps({
+                            "StackName": "Ghost-Fargate",
+                            "TemplatePath": "ghost-deploy-fargate.template",
+                            "DeploymentType": "${DeploymentType}",
+                            "Parameters": deploy_parameters
+                        }))
                     },
                     RunOrder="1"
+                ),
+                If(
+                    "UseBlueGreen",
+                    # The taskdef.json, appspec.yaml and imageDetail.json from ghost-container/blue-green-artifacts.py
+                    Actions(
+                        Name="Deploy",
+                        InputArtifacts=[
+                            InputArtifacts(
+                                Name="BuildOutput"
+                            )
+                        ],
+                        ActionTypeId=ActionTypeId(
+                            Category="Deploy",
+                            Owner="AWS",
+                            Version="1",
+                            Provider="CodeDeployToECS"
+                        ),
+                        Configuration={
+                            "ApplicationName": "ghost",
+                            "DeploymentGroupName": "ghost",
+                            "TaskDefinitionTemplateArtifact": "BuildOutput",
+                            "TaskDefinitionTemplatePath": "taskdef.json",
+                            "AppSpecTemplateArtifact": "BuildOutput",
+                            "AppSpecTemplatePath": "appspec.yaml",
+                            "Image1ArtifactName": "BuildOutput",
+                            "Image1ContainerName": "IMAGE1_NAME"
+                        },
+                        RunOrder="2"
+                    ),
+                    Actions(
+                        Name="CreateChangeSet",
+                        InputArtifacts=[
+                            InputArtifacts(
+                                Name="BuildOutput"
+                            )
+                        ],
+                        ActionTypeId=ActionTypeId(
+                            Category="Deploy",
+                            Owner="AWS",
+                            Version="1",
+                            Provider="CloudFormation"
+                        ),
+                        Configuration={
+                            "ActionMode": "CHANGE_SET_REPLACE",
+                            "ChangeSetName": "ghost-deploy",
+                            "Capabilities": "CAPABILITY_IAM",
+                            "RoleArn": GetAtt('CloudFormationServiceRole', 'Arn'),
+                            "ParameterOverrides": Sub(json.dumps(dict(
+                                deploy_parameters,
+                                GhostImage={"Fn::GetParam": ["BuildOutput", "images.json", "imageUri"]}))),
+                            "TemplatePath": "BuildOutput::ghost-deploy-fargate.template",
+                            "StackName": "Ghost-Fargate"
+                        },
+                        RunOrder="2"
+                    )
+                ),
+                # Updates (or creates) the stack. A failed update rolls back rather than deleting it
+                If(
+                    "UseBlueGreen",
+                    Ref("AWS::NoValue"),
+                    Actions(
+                        Name="ExecuteChangeSet",
+                        ActionTypeId=ActionTypeId(
+                            Category="Deploy",
+                            Owner="AWS",
+                            Version="1",
+                            Provider="CloudFormation"
+                        ),
+                        Configuration={
+                            "ActionMode": "CHANGE_SET_EXECUTE",
+                            "ChangeSetName": "ghost-deploy",
+                            "StackName": "Ghost-Fargate"
+                        },
+                        RunOrder="3"
+                    )
                 )
             ]
         )
@@ -274,7 +575,7 @@ pipeline = t.add_resource(Pipeline(
         Type="S3",
         Location=Ref(CodePipelineBucket)
     ),
-    DependsOn=CloudFormationServicePolicy
+    DependsOn=[CloudFormationServicePolicy, DeployCheckPolicy]
 ))
 
 # Create the Inline policy for the CodePipline Role
@@ -332,4 +633,191 @@ cw_event_rule = t.add_resource(events.Rule(
     Targets=[codecommit_event_target]
 ))
 
+# Per-stage timing metrics
+# EventBridge sends every pipeline, stage and action execution state change to
+# a Lambda, which looks up when the execution started and publishes its duration
+# as a metric (namespace Ghost/Pipeline). It also logs each event as one JSON line
+# so they can be exported for benchmarks/pipeline-report.py.
+PipelineMetricsRole = t.add_resource(iam.Role(
+    "PipelineMetricsRole",
+    AssumeRolePolicyDocument={
+        'Statement': [{
+            'Effect': 'Allow',
+            'Principal': {'Service': ['lambda.amazonaws.com']},
+            'Action': ["sts:AssumeRole"]
+        }]},
+))
+
+PipelineMetricsPolicy = t.add_resource(iam.PolicyType(
+    "PipelineMetricsPolicy",
+    PolicyName="pipeline-metrics",
+    PolicyDocument={'Version': '2012-10-17',
+                    'Statement': [{'Action': ['logs:CreateLogGroup',
+                                              'logs:CreateLogStream',
+                                              'logs:PutLogEvents',
+                                              'cloudwatch:PutMetricData'
+                                              ],
+                                   'Resource': ['*'],
+                                   'Effect': 'Allow'},
+                                  {'Action': ['codepipeline:ListPipelineExecutions',
+                                              'codepipeline:ListActionExecutions'
+                                              ],
+                                   'Resource': [Join("", ["arn:aws:codepipeline:", Ref('AWS::Region'), ":", Ref('AWS::AccountId'), ":", Ref(pipeline)])],
+                                   'Effect': 'Allow'},
+                                  ]},
+    Roles=[Ref(PipelineMetricsRole)],
+))
+
+pipeline_metrics_code = [
+    "import json",
+    "from datetime import datetime, timezone",
+    "import boto3",
+    "",
+    "codepipeline = boto3.client('codepipeline')",
+    "cloudwatch = boto3.client('cloudwatch')",
+    "",
+    "FINISHED = ['SUCCEEDED', 'FAILED', 'CANCELED', 'STOPPED', 'SUPERSEDED', 'ABANDONED']",
+    "",
+    "def handler(event, context):",
+    "    # one line per event, read back by benchmarks/pipeline-report.py",
+    "    print(json.dumps(event))",
+    "    detail = event['detail']",
+    "    if detail['state'] not in FINISHED:",
+    "        return",
+    "",
+    "    pipeline = detail['pipeline']",
+    "    execution_id = detail['execution-id']",
+    "    finished = datetime.strptime(event['time'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)",
+    "    dimensions = [{'Name': 'Pipeline', 'Value': pipeline}]",
+    "",
+    "    if 'stage' not in detail:",
+    "        name = 'PipelineDuration'",
+    "        started = [e['startTime'] for e in codepipeline.list_pipeline_executions(pipelineName=pipeline)['pipelineExecutionSummaries']",
+    "                   if e['pipelineExecutionId'] == execution_id]",
+    "    else:",
+    "        actions = codepipeline.list_action_executions(",
+    "            pipelineName=pipeline, filter={'pipelineExecutionId': execution_id})['actionExecutionDetails']",
+    "        actions = [a for a in actions if a['stageName'] == detail['stage']]",
+    "        dimensions.append({'Name': 'Stage', 'Value': detail['stage']})",
+    "        if 'action' not in detail:",
+    "            name = 'StageDuration'",
+    "        else:",
+    "            name = 'ActionDuration'",
+    "            actions = [a for a in actions if a['actionName'] == detail['action']]",
+    "            dimensions.append({'Name': 'Action', 'Value': detail['action']})",
+    "        started = [min(a['startTime'] for a in actions)] if actions else []",
+    "",
+    "    if not started:",
+    "        print('Could not find when ' + name + ' of ' + execution_id + ' started')",
+    "        return",
+    "    seconds = max(0.0, (finished - started[0]).total_seconds())",
+    "    dimensions.append({'Name': 'State', 'Value': detail['state']})",
+    "    print(json.dumps({'msg': 'pipeline timing', 'metric': name, 'seconds': seconds,",
+    "                      'executionId': execution_id, 'dimensions': dimensions}))",
+    "    cloudwatch.put_metric_data(Namespace='Ghost/Pipeline', MetricData=[",
+    "        {'MetricName': name, 'Dimensions': dimensions, 'Value': seconds, 'Unit': 'Seconds'}])",
+]
+
+PipelineMetricsFunction = t.add_resource(awslambda.Function(
+    "PipelineMetricsFunction",
+    Code=awslambda.Code(
+        ZipFile=Join("\n", pipeline_metrics_code)
+    ),
+    Handler="index.handler",
+    Role=GetAtt("PipelineMetricsRole", "Arn"),
+    Runtime="python3.6",
+    MemorySize="128",
+    Timeout="30",
+    DependsOn=PipelineMetricsPolicy
+))
+
+PipelineMetricsRule = t.add_resource(events.Rule(
+    "PipelineMetricsRule",
+    EventPattern={
+        "source": [
+            "aws.codepipeline"
+        ],
+        "detail-type": [
+            "CodePipeline Pipeline Execution State Change",
+            "CodePipeline Stage Execution State Change",
+            "CodePipeline Action Execution State Change"
+        ],
+        "detail": {
+            "pipeline": [
+                Ref(pipeline)
+            ]
+        }
+    },
+    Description="Ghost Pipeline execution state changes to timing metrics",
+    State="ENABLED",
+    Targets=[events.Target(
+        Arn=GetAtt(PipelineMetricsFunction, "Arn"),
+        Id='PipelineMetrics'
+    )]
+))
+
+t.add_resource(awslambda.Permission(
+    "PipelineMetricsPermission",
+    Action="lambda:InvokeFunction",
+    FunctionName=Ref(PipelineMetricsFunction),
+    Principal="events.amazonaws.com",
+    SourceArn=GetAtt(PipelineMetricsRule, "Arn")
+))
+
+
+# The dashboard has a graph of the pipeline's end-to-end time and one per
+# stage, with each of its actions, generated from the stages above
+def duration_widget(title, metrics, x, y):
+    return {
+        "type": "metric",
+        "x": x, "y": y, "width": 12, "height": 6,
+        "properties": {
+            "title": title,
+            "region": "${AWS::Region}",
+            "view": "timeSeries",
+            "period": 86400,
+            "yAxis": {"left": {"label": "Seconds", "showUnits": False}},
+            "metrics": metrics
+        }
+    }
+
+
+def percentiles(metric, dimensions, label):
+    return [["Ghost/Pipeline", metric] + dimensions + [{"stat": stat, "label": label + " " + stat}]
+            for stat in ("p50", "p90")]
+
+
+def action_names(stage):
+    names = []
+    for action in stage.Actions:
+        # an If picks between alternative actions (the Deploy stage)
+        choices = action.data["Fn::If"][1:] if isinstance(action, If) else [action]
+        names += [choice.Name for choice in choices if isinstance(choice, Actions) and choice.Name not in names]
+    return names
+
+
+succeeded = ["State", "SUCCEEDED"]
+widgets = [duration_widget(
+    "Commit to production (succeeded executions)",
+    percentiles("PipelineDuration", ["Pipeline", "${GhostPipeline}"] + succeeded, "Pipeline"),
+    0, 0)]
+for i, stage in enumerate(pipeline.Stages):
+    metrics = percentiles("StageDuration", ["Pipeline", "${GhostPipeline}", "Stage", stage.Name] + succeeded, stage.Name)
+    for action in action_names(stage):
+        metrics += [["Ghost/Pipeline", "ActionDuration", "Pipeline", "${GhostPipeline}", "Stage", stage.Name,
+                     "Action", action] + succeeded + [{"stat": "p50", "label": action + " action p50"}]]
+    widgets.append(duration_widget(stage.Name + " stage", metrics, 12 * ((i + 1) % 2), 6 * ((i + 1) // 2)))
+
+PipelineDashboard = t.add_resource(cloudwatch.Dashboard(
+    "PipelineDashboard",
+    DashboardName=Sub("${GhostPipeline}-timings"),
+    DashboardBody=Sub(json.dumps({"widgets": widgets}))
+))
+
+t.add_output(Output(
+    "PipelineDashboard",
+    Description="CloudWatch dashboard of the pipeline's stage timings",
+    Value=Ref(PipelineDashboard)
+))
+
 print(t.to_json())
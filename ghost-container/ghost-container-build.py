@@ -18,6 +18,20 @@ clair_url = t.add_parameter(Parameter(
     Type="String"
 ))
 
+image_size_budget = t.add_parameter(Parameter(
+    "ImageSizeBudgetMB",
+    Description="The build fails if the Ghost image is bigger than this (MB)",
+    Default="300",
+    Type="Number"
+))
+
+image_layer_budget = t.add_parameter(Parameter(
+    "ImageLayerBudget",
+    Description="The build fails if the Ghost image has more layers than this",
+    Default="15",
+    Type="Number"
+))
+
 build_vpc = t.add_parameter(Parameter(
     'BuildVPC',
     Type='AWS::EC2::VPC::Id',
@@ -47,7 +61,23 @@ Repository = t.add_resource(
 # Create the S3 Bucket for Output
 S3Bucket = t.add_resource(
     s3.Bucket(
-        "GhostClairBuildOutput"
+        "GhostClairBuildOutput",
+        # clair-scan.py's result cache (one file per vulnerability DB version and architecture)
+        # and the layers it hands to Clair
+        LifecycleConfiguration=s3.LifecycleConfiguration(Rules=[
+            s3.LifecycleRule(
+                Id="ExpireClairCache",
+                Prefix="clair-cache/",
+                Status="Enabled",
+                ExpirationInDays=7
+            ),
+            s3.LifecycleRule(
+                Id="ExpireClairLayers",
+                Prefix="clair-layers/",
+                Status="Enabled",
+                ExpirationInDays=1
+            )
+        ])
     )
 )
 
@@ -154,51 +184,113 @@ CodeBuildServiceRolePolicy = t.add_resource(iam.PolicyType(
                                 "ec2:CreateNetworkInterfacePermission"
                             ],
                             "Resource": "*"
+                        },
+                        {
+                            "Sid": "S3DeleteObjectPolicy",
+                            "Effect": "Allow",
+                            "Action": [
+                                "s3:DeleteObject"
+                            ],
+                            "Resource": [
+                                Join("", ["arn:aws:s3:::", Ref(S3Bucket), "/clair-layers/*"])
+                            ]
+                        },
+                        {
+                            "Sid": "BlueGreenTaskDefinitionPolicy",
+                            "Effect": "Allow",
+                            "Action": [
+                                "ecs:DescribeTaskDefinition"
+                            ],
+                            "Resource": "*"
+                        },
+                        {
+                            "Sid": "BuildMetricsPolicy",
+                            "Effect": "Allow",
+                            "Action": [
+                                "cloudwatch:PutMetricData"
+                            ],
+                            "Resource": "*"
                         }
                     ]},
     Roles=[Ref(ServiceRole)],
 ))
 
 # Create CodeBuild Projects
-# Image Build
-ImageArtifacts = codebuild.Artifacts(
-    Type='S3',
-    Name='artifacts',
-    Location=Ref(S3Bucket)
-)
+# One project per architecture, each built natively on its own kind of host
+# (see buildspec.yml), and one to combine their images (buildspec-manifest.yml)
+def image_environment(compute_type, image, environment_type, extra_variables):
+    return codebuild.Environment(
+        ComputeType=compute_type,
+        Image=image,
+        Type=environment_type,
+        EnvironmentVariables=[{'Name': 'AWS_ACCOUNT_ID', 'Value': Ref(AWS_ACCOUNT_ID)},
+                              {'Name': 'IMAGE_REPO_NAME', 'Value': Ref(Repository)},
+                              {'Name': 'IMAGE_TAG', 'Value': 'latest'},
+                              {'Name': 'CLAIR_URL', 'Value': Ref(clair_url)},
+                              {'Name': 'CLAIR_CACHE_BUCKET', 'Value': Ref(S3Bucket)},
+                              {'Name': 'IMAGE_SIZE_BUDGET_MB', 'Value': Ref(image_size_budget)},
+                              {'Name': 'IMAGE_LAYER_BUDGET', 'Value': Ref(image_layer_budget)}] + extra_variables,
+        PrivilegedMode=True
+    )
 
-ImageEnvironment = codebuild.Environment(
-    ComputeType="BUILD_GENERAL1_SMALL",
-    Image="aws/codebuild/docker:17.09.0",
-    Type="LINUX_CONTAINER",
-    EnvironmentVariables=[{'Name': 'AWS_ACCOUNT_ID', 'Value': Ref(AWS_ACCOUNT_ID)},
-                          {'Name': 'IMAGE_REPO_NAME', 'Value': Ref(Repository)},
-                          {'Name': 'IMAGE_TAG', 'Value': 'latest'},
-                          {'Name': 'CLAIR_URL', 'Value': Ref(clair_url)}],
-    PrivilegedMode=True
-)
 
-ImageSource = codebuild.Source(
-    Location="https://github.com/jasonumiker/ghost-ecs-fargate-pipeline",
-    Type="GITHUB",
-    BuildSpec="ghost-container/buildspec.yml"
-)
+def image_project(title, name, environment, buildspec, artifacts):
+    return codebuild.Project(
+        title,
+        Artifacts=artifacts,
+        Environment=environment,
+        # Keep Docker's layers (and the source) on the build host between builds
+        Cache=codebuild.ProjectCache(
+            Type="LOCAL",
+            Modes=["LOCAL_DOCKER_LAYER_CACHE", "LOCAL_SOURCE_CACHE"]
+        ),
+        Name=name,
+        ServiceRole=Ref(ServiceRole),
+        Source=codebuild.Source(
+            Location="https://github.com/jasonumiker/ghost-ecs-fargate-pipeline",
+            Type="GITHUB",
+            BuildSpec=buildspec
+        ),
+        VpcConfig=codebuild.VpcConfig(
+            VpcId=Ref(build_vpc),
+            Subnets=[Ref(build_subnet), Ref(build_subnet2)],
+            SecurityGroupIds=[Ref(build_security_group)]
+        ),
+        DependsOn=CodeBuildServiceRolePolicy
+    )
+
 
-ImageProject = codebuild.Project(
+# Docker 20 for BuildKit and its inline cache
+ImageProject = t.add_resource(image_project(
     "ImageBuildProject",
-    Artifacts=ImageArtifacts,
-    Environment=ImageEnvironment,
-    Name="ghost-clair-build",
-    ServiceRole=Ref(ServiceRole),
-    Source=ImageSource,
-    VpcConfig=codebuild.VpcConfig(
-        VpcId=Ref(build_vpc),
-        Subnets=[Ref(build_subnet), Ref(build_subnet2)],
-        SecurityGroupIds=[Ref(build_security_group)]
-    ),
-    DependsOn=CodeBuildServiceRolePolicy
-)
-t.add_resource(ImageProject)
+    "ghost-clair-build",
+    image_environment("BUILD_GENERAL1_SMALL", "aws/codebuild/standard:5.0", "LINUX_CONTAINER",
+                      [{'Name': 'ARCH', 'Value': 'amd64'}]),
+    "ghost-container/buildspec.yml",
+    codebuild.Artifacts(Type='NO_ARTIFACTS')
+))
+
+Arm64ImageProject = t.add_resource(image_project(
+    "Arm64ImageBuildProject",
+    "ghost-clair-build-arm64",
+    image_environment("BUILD_GENERAL1_LARGE", "aws/codebuild/amazonlinux2-aarch64-standard:2.0", "ARM_CONTAINER",
+                      [{'Name': 'ARCH', 'Value': 'arm64'}]),
+    "ghost-container/buildspec.yml",
+    codebuild.Artifacts(Type='NO_ARTIFACTS')
+))
+
+ManifestProject = t.add_resource(image_project(
+    "ManifestProject",
+    "ghost-manifest",
+    image_environment("BUILD_GENERAL1_SMALL", "aws/codebuild/standard:5.0", "LINUX_CONTAINER",
+                      [{'Name': 'ARCHES', 'Value': 'amd64 arm64'}]),
+    "ghost-container/buildspec-manifest.yml",
+    codebuild.Artifacts(
+        Type='S3',
+        Name='artifacts',
+        Location=Ref(S3Bucket)
+    )
+))
 
 # Output ghost repository URL
 t.add_output(Output(
@@ -34,6 +34,12 @@ var _transaction = require('./transaction');
 
 var _transaction2 = _interopRequireDefault(_transaction);
 
+var _awsAuth = require('aws-auth');
+
+var _queryStats = require('./query-stats');
+
+var _queryStats2 = _interopRequireDefault(_queryStats);
+
 function _interopRequireWildcard(obj) { if (obj && obj.__esModule) { return obj; } else { var newObj = {}; if (obj != null) { for (var key in obj) { if (Object.prototype.hasOwnProperty.call(obj, key)) newObj[key] = obj[key]; } } newObj.default = obj; return newObj; } }
 
 function _interopRequireDefault(obj) { return obj && obj.__esModule ? obj : { default: obj }; }
@@ -44,10 +50,128 @@ var configOptions = ['isServer', 'stream', 'host', 'port', 'localAddress', 'sock
 // objects, which extend the base 'lib/query/builder' and
 // 'lib/query/compiler', respectively.
 
+// Pool options that may arrive as strings from `database__pool__*` environment variables
+var poolIntegerOptions = ['min', 'max', 'acquireTimeoutMillis', 'createTimeoutMillis', 'idleTimeoutMillis', 'reapIntervalMillis'];
+
+// Options handled here rather than by the pool itself
+var poolClientOptions = ['statsIntervalMillis', 'maxConnectionAgeMillis', 'pingIntervalMillis'];
+
+// Errors that mean the server behind the endpoint went away (or was demoted to a
+// read-only standby), as happens during an RDS Multi-AZ failover. When one is seen
+// every pooled connection is suspect, not just the one that raised it.
+var failoverErrorCodes = ['PROTOCOL_CONNECTION_LOST', 'PROTOCOL_SEQUENCE_TIMEOUT', 'ECONNRESET', 'ECONNREFUSED', 'ETIMEDOUT', 'EHOSTUNREACH', 'EPIPE', 'ER_SERVER_SHUTDOWN', 'ER_OPTION_PREVENTS_STATEMENT'];
+
+function isFailoverError(err) {
+  return !!err && failoverErrorCodes.indexOf(err.code) !== -1;
+}
+
+// Query methods that only read, and can be served by a read replica
+var readMethods = ['select', 'pluck', 'first'];
+
+// knex's makeTxClient builds a transaction's client with
+// Object.create(client.constructor.prototype) and copies only a few fields
+// (config among them), so none of the state set up in the constructor below is
+// on it. Each client's config is its own copy, which maps back to the client.
+var clientsByConfig = new WeakMap();
+
+// The client that owns the pool, replicas and query stats `client` uses
+function poolClient(client) {
+  return client.transacting && clientsByConfig.get(client.config) || client;
+}
+
+function normalizeReplicaConfig(config) {
+  var replicas = config.replicas || {};
+  var hosts = replicas.hosts || [];
+  var primary = config.connection && config.connection.host;
+  if (typeof hosts === 'string') hosts = hosts.split(',');
+  var window = parseInt(replicas.readYourWritesWindow, 10);
+  return {
+    // With no replicas the stack exports the primary endpoint, which isn't worth a second pool
+    hosts: hosts.map(function (host) {
+      return host.trim();
+    }).filter(function (host) {
+      return host && host !== primary;
+    }),
+    readYourWritesWindow: isNaN(window) ? 2000 : window,
+    lastWriteAt: 0,
+    clients: null,
+    next: 0
+  };
+}
+
+// Returns a copy of the config with the pool options parsed and the client's own
+// options split out. The config passed in is Ghost's `database` config, which
+// the rest of Ghost still reads, so it is left as it is.
+function normalizePoolConfig(config) {
+  var clientOptions = {};
+  if (!config.pool) return { config: config, clientOptions: clientOptions };
+  var pool = (0, _assign3.default)({}, config.pool);
+  var normalized = (0, _assign3.default)({}, config, { pool: pool });
+  poolIntegerOptions.concat(poolClientOptions).forEach(function (key) {
+    if (pool[key] !== undefined && pool[key] !== '') {
+      pool[key] = parseInt(pool[key], 10);
+    }
+  });
+  poolClientOptions.forEach(function (key) {
+    clientOptions[key] = pool[key];
+    delete pool[key];
+  });
+  // knex applies its own acquire timeout on top of the pool's
+  if (pool.acquireTimeoutMillis) {
+    normalized.acquireConnectionTimeout = pool.acquireTimeoutMillis;
+  }
+  return { config: normalized, clientOptions: clientOptions };
+}
+
+// Acquire wait times since the last snapshot, reported alongside the pool counters
+function PoolStats() {
+  this.reset();
+}
+PoolStats.prototype.reset = function reset() {
+  this.acquires = 0;
+  this.acquireWaitMs = 0;
+  this.maxAcquireWaitMs = 0;
+};
+PoolStats.prototype.recordAcquire = function recordAcquire(waitMs) {
+  this.acquires += 1;
+  this.acquireWaitMs += waitMs;
+  this.maxAcquireWaitMs = Math.max(this.maxAcquireWaitMs, waitMs);
+};
+PoolStats.prototype.snapshot = function snapshot(pool) {
+  var stats = {
+    used: pool ? pool.numUsed() : 0,
+    free: pool ? pool.numFree() : 0,
+    pendingAcquires: pool ? pool.numPendingAcquires() : 0,
+    pendingCreates: pool ? pool.numPendingCreates() : 0,
+    acquires: this.acquires,
+    avgAcquireWaitMs: this.acquires ? Math.round(this.acquireWaitMs / this.acquires * 10) / 10 : 0,
+    maxAcquireWaitMs: this.maxAcquireWaitMs
+  };
+  this.reset();
+  return stats;
+};
+
 // MySQL2 Client
 // -------
 function Client_MySQL2(config) {
+  var normalized = config ? normalizePoolConfig(config) : { config: config, clientOptions: {} };
+  var poolOptions = normalized.clientOptions;
+  config = (0, _assign3.default)({}, normalized.config);
+  clientsByConfig.set(config, this);
+  this.poolClientOptions = poolOptions;
+  this.poolStats = new PoolStats();
+  // Looked up through poolClient() by transaction clients, so a failover seen
+  // inside a transaction flushes the one real pool.
+  this.poolHealth = {
+    generation: 0,
+    maxConnectionAgeMillis: poolOptions.maxConnectionAgeMillis || 0,
+    pingIntervalMillis: poolOptions.pingIntervalMillis || 0
+  };
+  this.replication = normalizeReplicaConfig(config || {});
+  this.queryStats = new _queryStats2.default(config && config.queryStats);
+  this.queryStats.start();
   _mysql2.default.call(this, config);
+  this.startIdlePing();
 }
 (0, _inherits2.default)(Client_MySQL2, _mysql2.default);
 
@@ -62,24 +186,182 @@ function Client_MySQL2(config) {
   _driver: function _driver() {
     return require('mysql2');
   },
-  validateConnection: function validateConnection() {
+
+  // Called by the pool on every acquire, so it must stay cheap: no round trip,
+  // just what we already know about the connection.
+  validateConnection: function validateConnection(connection) {
+    if (connection.__knex__disposed || connection._fatalError || connection._closing) return false;
+    if (connection.stream && connection.stream.destroyed) return false;
+    // Opened before the last failover - it may still point at the old primary
+    if (connection.__knex__generation !== this.poolHealth.generation) return false;
+    var maxAge = this.poolHealth.maxConnectionAgeMillis;
+    if (maxAge && Date.now() - connection.__knex__createdAt > maxAge) return false;
     return true;
   },
 
 
+  // Invalidate every connection currently in the pool. Free ones are evicted on
+  // their next acquire, busy ones when they are released, and new connections
+  // resolve the endpoint again so they reach the promoted instance.
+  flushPool: function flushPool(err) {
+    var health = this.poolHealth;
+    var now = Date.now();
+    // One failover surfaces as many errors at once; flush once per burst
+    if (health.flushedAt && now - health.flushedAt < 1000) return;
+    health.flushedAt = now;
+    health.generation += 1;
+    helpers.warn('Flushing the MySQL connection pool after ' + (err && err.code) + ' (generation ' + health.generation + ')');
+  },
+
+
+  // Ping connections that have been sitting idle so a dead socket is found in the
+  // background rather than by the next request that draws it.
+  startIdlePing: function startIdlePing() {
+    var client = this;
+    var interval = this.poolHealth.pingIntervalMillis;
+    if (!interval) return;
+    this.pingTimer = setInterval(function () {
+      var free = client.pool && client.pool.free || [];
+      var now = Date.now();
+      free.forEach(function (freeResource) {
+        var connection = freeResource.resource;
+        if (!connection || connection.__knex__disposed || connection.__knex__pinging) return;
+        if (now - freeResource.timestamp < interval) return;
+        connection.__knex__pinging = true;
+        connection.ping(function (err) {
+          connection.__knex__pinging = false;
+          if (!err) return;
+          connection.__knex__disposed = err;
+          if (isFailoverError(err)) client.flushPool(err);
+        });
+      });
+    }, interval);
+    this.pingTimer.unref();
+  },
+  destroy: function destroy(callback) {
+    var client = this;
+    var replicas = this.replication.clients || [];
+    clearInterval(this.pingTimer);
+    this.queryStats.stop();
+    this.replication.clients = null;
+    return _bluebird2.default.all(replicas.map(function (replica) {
+      return replica.destroy();
+    })).then(function () {
+      return _mysql2.default.prototype.destroy.call(client, callback);
+    });
+  },
+
+
+  // Reads outside a transaction go to a replica; everything else stays on the
+  // primary. After any write, reads stay on the primary for readYourWritesWindow
+  // so a redirect after saving a post doesn't render the replica's stale copy.
+  runner: function runner(builder) {
+    return _mysql2.default.prototype.runner.call(this.readClientFor(builder), builder);
+  },
+  readClientFor: function readClientFor(builder) {
+    // Everything in a transaction runs on its connection to the primary
+    if (this.transacting) return this;
+    var replication = this.replication;
+    if (!replication.hosts.length) return this;
+    if (readMethods.indexOf(builder._method) === -1) return this;
+    if (builder._single && builder._single.lock) return this;
+    if (Date.now() - replication.lastWriteAt < replication.readYourWritesWindow) return this;
+    var replicas = this.replicaClients();
+    replication.next = (replication.next + 1) % replicas.length;
+    return replicas[replication.next];
+  },
+
+
+  // One client (and pool) per replica endpoint, created on the first routed read.
+  replicaClients: function replicaClients() {
+    var client = this;
+    var replication = this.replication;
+    if (replication.clients) return replication.clients;
+    replication.clients = replication.hosts.map(function (host) {
+      var connection = (0, _assign3.default)({}, client.config.connection, { host: host });
+      // The IAM token is signed for a specific host
+      if (_awsAuth.rdsToken.isEnabled(connection)) {
+        connection.authSwitchHandler = _awsAuth.rdsToken.authSwitchHandler(connection);
+      }
+      var replica = new Client_MySQL2((0, _assign3.default)({}, client.config, {
+        connection: connection,
+        pool: (0, _assign3.default)({}, client.config.pool, client.poolClientOptions),
+        replicas: null,
+        queryStats: { enabled: false }
+      }));
+      // Replica queries are counted with the primary's
+      replica.queryStats = client.queryStats;
+      ['query', 'query-response', 'query-error'].forEach(function (event) {
+        replica.on(event, function () {
+          client.emit.apply(client, [event].concat(Array.prototype.slice.call(arguments)));
+        });
+      });
+      return replica;
+    });
+    return replication.clients;
+  },
+  _query: function _query(connection, obj) {
+    var client = poolClient(this);
+    var replication = client.replication;
+    var isWrite = replication.hosts.length > 0 && (this.transacting || readMethods.indexOf(obj && obj.method) === -1);
+    if (isWrite) replication.lastWriteAt = Date.now();
+    var query = _mysql2.default.prototype._query.call(this, connection, obj);
+    // Every client should find its stats through poolClient(), but a query is never
+    // failed for the sake of timing it
+    return (client.queryStats ? client.queryStats.track(obj, query) : query).tap(function () {
+      // The window runs from when the write finished, not when it started
+      if (isWrite) replication.lastWriteAt = Date.now();
+    }).catch(function (err) {
+      if (isFailoverError(err)) {
+        connection.__knex__disposed = err;
+        client.flushPool(err);
+      }
+      throw err;
+    });
+  },
+
+
+  // Waits for the pool to be pre-warmed (if it is being) and records how
+  // long each caller waited for a connection.
+  acquireConnection: function acquireConnection() {
+    var client = this;
+    var start = Date.now();
+    return _bluebird2.default.resolve(this.poolWarmup).then(function () {
+      return _mysql2.default.prototype.acquireConnection.call(client);
+    }).tap(function () {
+      client.poolStats.recordAcquire(Date.now() - start);
+    });
+  },
+
+
   // Get a raw connection, called by the `pool` whenever a new
   // connection needs to be added to the pool.
+  // With RDS IAM auth every new connection asks the token provider for a
+  // cached, still-valid token instead of using a password fixed at boot.
   acquireRawConnection: function acquireRawConnection() {
-    var connection = this.driver.createConnection((0, _pick3.default)(this.connectionSettings, configOptions));
-    return new _bluebird2.default(function (resolver, rejecter) {
-      connection.connect(function (err) {
-        if (err) {
-          return rejecter(err);
-        }
-        connection.on('error', function (err) {
-          connection.__knex__disposed = err;
+    var client = this;
+    var driver = this.driver;
+    var settings = (0, _pick3.default)(this.connectionSettings, configOptions);
+    // `database__connection__ssl=false` arrives as a string, e.g. for a local MySQL
+    if (settings.ssl === false || settings.ssl === 'false') delete settings.ssl;
+    var tokenProvider = _awsAuth.rdsToken.forConnection(this.connectionSettings);
+    var password = tokenProvider ? tokenProvider.getToken() : settings.password;
+    return _bluebird2.default.resolve(password).then(function (password) {
+      settings.password = password;
+      var connection = driver.createConnection(settings);
+      return new _bluebird2.default(function (resolver, rejecter) {
+        connection.connect(function (err) {
+          if (err) {
+            return rejecter(err);
+          }
+          connection.__knex__createdAt = Date.now();
+          connection.__knex__generation = client.poolHealth.generation;
+          connection.on('error', function (err) {
+            connection.__knex__disposed = err;
+            if (isFailoverError(err)) client.flushPool(err);
+          });
+          resolver(connection);
         });
-        resolver(connection);
       });
     });
   },
@@ -0,0 +1,41 @@
+'use strict';
+
+/**
+ * Empties the micro-cache sidecar's cache directory when Ghost's site.changed
+ * webhook fires. nginx (open source) can't purge its cache itself, but it treats
+ * a deleted cache file as a miss, so clearing the shared volume is enough.
+ *
+ * Started as root by docker-entrypoint.sh when MICRO_CACHE_DIR is set (the files
+ * are owned by nginx's user) and only listens on localhost; nginx proxies
+ * /__micro-cache/purge to it for requests from inside the task.
+ */
+const http = require('http'),
+    childProcess = require('child_process');
+
+const CACHE_DIR = process.env.MICRO_CACHE_DIR,
+    PORT = parseInt(process.env.MICRO_CACHE_PURGE_PORT, 10) || 2370;
+
+function purge(callback) {
+    // The directory itself belongs to the volume, so only remove what is in it
+    childProcess.execFile('find', [CACHE_DIR, '-mindepth', '1', '-delete'], callback);
+}
+
+http.createServer(function (req, res) {
+    if (req.method !== 'POST' || req.url !== '/purge') {
+        res.writeHead(404);
+        return res.end();
+    }
+
+    // Drain the webhook payload, we don't need it
+    req.resume();
+    purge(function (err) {
+        if (err) {
+            console.error('micro-cache purge failed: ' + err.message);
+            res.writeHead(500, {'Content-Type': 'application/json'});
+            return res.end(JSON.stringify({purged: false}));
+        }
+        console.log('micro-cache purged');
+        res.writeHead(200, {'Content-Type': 'application/json'});
+        res.end(JSON.stringify({purged: true}));
+    });
+}).listen(PORT, '127.0.0.1');
@@ -0,0 +1,70 @@
+'use strict';
+
+/**
+ * Preloaded into Ghost by ghost-cluster.js to wire Ghost's site.changed webhook
+ * to the micro-cache sidecar's purge endpoint.
+ *
+ * Once Ghost is listening, the first worker makes sure the webhook exists when
+ * MICRO_CACHE_DIR is set (the sidecar is enabled), and removes it when it isn't,
+ * so Ghost doesn't keep posting to a path nobody answers. The target is the
+ * task's own nginx on localhost, so the one webhook row in the shared database
+ * works for every task: whichever task saves a change empties its own cache.
+ */
+const http = require('http'),
+    path = require('path');
+
+const EVENT = 'site.changed',
+    TARGET_URL = 'http://127.0.0.1:2368/__micro-cache/purge',
+    INTERNAL = {context: {internal: true}};
+
+let synced = false;
+
+function log(message) {
+    console.log(JSON.stringify({msg: message, time: new Date().toISOString(), name: 'micro-cache-webhook'}));
+}
+
+function syncWebhook() {
+    const enabled = !!process.env.MICRO_CACHE_DIR;
+    let models;
+
+    if (synced) {
+        return;
+    }
+    synced = true;
+    try {
+        // already loaded by Ghost, so this is its own instance
+        models = require(path.join(__dirname, 'current/core/server/models'));
+    } catch (err) {
+        log('Ghost\'s models were not found, the ' + EVENT + ' webhook was not checked');
+        return;
+    }
+    if (!models.Webhook) {
+        log('This Ghost has no webhooks, the micro-cache is only emptied by its TTL');
+        return;
+    }
+
+    models.Webhook.findOne({event: EVENT, target_url: TARGET_URL}, INTERNAL).then(function (webhook) {
+        if (enabled && !webhook) {
+            return models.Webhook.add({event: EVENT, target_url: TARGET_URL}, INTERNAL).then(function () {
+                log('Added the ' + EVENT + ' webhook for the micro-cache');
+            });
+        }
+        if (!enabled && webhook) {
+            return models.Webhook.destroy(Object.assign({id: webhook.id}, INTERNAL)).then(function () {
+                log('Removed the ' + EVENT + ' webhook of the disabled micro-cache');
+            });
+        }
+    }).catch(function (err) {
+        log('Checking the ' + EVENT + ' webhook failed: ' + err.message);
+    });
+}
+
+// Only one process per task needs to check, and Ghost's models are ready by the time it listens
+if (!process.env.GHOST_WORKER_ID || process.env.GHOST_WORKER_ID === '1') {
+    const listen = http.Server.prototype.listen;
+
+    http.Server.prototype.listen = function () {
+        this.once('listening', syncWebhook);
+        return listen.apply(this, arguments);
+    };
+}
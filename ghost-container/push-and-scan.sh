@@ -0,0 +1,36 @@
+#!/bin/bash
+# Pushes the image (and the build cache tags of ARCH, see build-image.sh) while
+# Clair scans it. The scan reads the layers from the local image (see
+# clair-scan.py), so it doesn't need to wait for the push. Fails if either the push or the scan fails.
+#
+#   ./push-and-scan.sh <repo>:<tag>
+set -euo pipefail
+
+IMAGE_URI=$1
+REPO_URI=${IMAGE_URI%:*}
+ARCH=${ARCH:-amd64}
+PUSH_LOG=$(mktemp)
+
+(
+    docker push "$IMAGE_URI"
+    echo Pushing the build cache for the next build...
+    docker push "$REPO_URI:latest-$ARCH"
+    docker push "$REPO_URI:builder-$ARCH"
+) > "$PUSH_LOG" 2>&1 &
+push=$!
+
+echo Running Clair scan on the image while it is pushed...
+scan_status=0
+python3 clair-scan.py "$IMAGE_URI" || scan_status=$?
+
+push_status=0
+wait "$push" || push_status=$?
+echo Push output:
+cat "$PUSH_LOG"
+rm -f "$PUSH_LOG"
+
+if [ "$push_status" -ne 0 ]; then
+    echo "The push failed (exit $push_status)"
+    exit "$push_status"
+fi
+exit "$scan_status"
@@ -0,0 +1,294 @@
+'use strict';
+
+/**
+ * Per-query latency and row-count stats for the mysql2 knex dialect.
+ * Copied next to the dialect's index.js by the Dockerfile.
+ *
+ * Queries are grouped by method and a fingerprint of their SQL (literals and
+ * IN lists collapsed). Every `intervalMillis` the top `topN` groups by total time
+ * and a per-method rollup are written to stdout as CloudWatch Embedded Metric
+ * Format lines, which the awslogs driver ships to the Ghost log group.
+ * Queries slower than `slowQueryMillis` are logged as they finish.
+ */
+const crypto = require('crypto');
+
+const DEFAULTS = {
+    enabled: true,
+    intervalMillis: 60000,
+    slowQueryMillis: 500,
+    topN: 10,
+    namespace: 'Ghost/Database'
+};
+
+// Latency histogram buckets grow by 10% from 0.1ms, so percentiles are within 10%
+const BUCKET_BASE = 0.1,
+    BUCKET_GROWTH = Math.log(1.1);
+
+function toInt(value, fallback) {
+    const parsed = parseInt(value, 10);
+    return isNaN(parsed) ? fallback : parsed;
+}
+
+/**
+ * Reduces a query to its shape so calls that differ only in their values are
+ * grouped together.
+ */
+function fingerprint(sql) {
+    return String(sql)
+        .replace(/'(?:[^'\\]|\\.)*'/g, '?')
+        .replace(/"(?:[^"\\]|\\.)*"/g, '?')
+        .replace(/\b\d+(?:\.\d+)?\b/g, '?')
+        .replace(/\s+/g, ' ')
+        .replace(/\(\s*\?(?:\s*,\s*\?)*\s*\)/g, '(?+)')
+        .trim()
+        .toLowerCase();
+}
+
+function Histogram() {
+    this.buckets = {};
+    this.count = 0;
+}
+
+Histogram.prototype.record = function record(ms) {
+    const bucket = ms <= BUCKET_BASE ? 0 : Math.ceil(Math.log(ms / BUCKET_BASE) / BUCKET_GROWTH);
+
+    this.buckets[bucket] = (this.buckets[bucket] || 0) + 1;
+    this.count += 1;
+};
+
+/**
+ * Returns the upper bound of the bucket holding the given percentile.
+ */
+Histogram.prototype.percentile = function percentile(p) {
+    const rank = Math.ceil(this.count * p / 100),
+        buckets = Object.keys(this.buckets).map(Number).sort(function (a, b) {
+            return a - b;
+        });
+    let seen = 0;
+
+    for (let i = 0; i < buckets.length; i += 1) {
+        seen += this.buckets[buckets[i]];
+        if (seen >= rank) {
+            return Math.round(BUCKET_BASE * Math.exp(buckets[i] * BUCKET_GROWTH) * 100) / 100;
+        }
+    }
+    return 0;
+};
+
+function QueryGroup(method, sql) {
+    this.method = method;
+    this.sql = sql;
+    this.id = crypto.createHash('sha1').update(method + ' ' + sql).digest('hex').slice(0, 12);
+    this.histogram = new Histogram();
+    this.totalMs = 0;
+    this.maxMs = 0;
+    this.rowsReturned = 0;
+    this.rowsAffected = 0;
+    this.errors = 0;
+    this.slow = 0;
+}
+
+QueryGroup.prototype.record = function record(sample, slowQueryMillis) {
+    this.histogram.record(sample.durationMs);
+    this.totalMs += sample.durationMs;
+    this.maxMs = Math.max(this.maxMs, sample.durationMs);
+    this.rowsReturned += sample.rowsReturned || 0;
+    this.rowsAffected += sample.rowsAffected || 0;
+    if (sample.error) {
+        this.errors += 1;
+    }
+    if (sample.durationMs >= slowQueryMillis) {
+        this.slow += 1;
+    }
+};
+
+QueryGroup.prototype.metrics = function metrics() {
+    const max = Math.round(this.maxMs * 100) / 100;
+
+    return {
+        QueryCount: this.histogram.count,
+        QueryTimeTotal: Math.round(this.totalMs * 100) / 100,
+        QueryTimeP50: Math.min(this.histogram.percentile(50), max),
+        QueryTimeP95: Math.min(this.histogram.percentile(95), max),
+        QueryTimeP99: Math.min(this.histogram.percentile(99), max),
+        QueryTimeMax: max,
+        RowsReturned: this.rowsReturned,
+        RowsAffected: this.rowsAffected,
+        QueryErrors: this.errors,
+        SlowQueries: this.slow
+    };
+};
+
+/**
+ * Rows a mysql2 response returned (for reads) or changed (for writes).
+ */
+function countRows(response) {
+    const rows = response && response[0];
+
+    if (Array.isArray(rows)) {
+        return {rowsReturned: rows.length, rowsAffected: 0};
+    }
+    return {rowsReturned: 0, rowsAffected: rows && rows.affectedRows || 0};
+}
+
+function QueryStats(options) {
+    options = Object.assign({}, DEFAULTS, options);
+
+    this.enabled = options.enabled !== false && options.enabled !== 'false';
+    this.intervalMillis = toInt(options.intervalMillis, DEFAULTS.intervalMillis);
+    this.slowQueryMillis = toInt(options.slowQueryMillis, DEFAULTS.slowQueryMillis);
+    this.topN = toInt(options.topN, DEFAULTS.topN);
+    this.namespace = options.namespace;
+    this.write = options.write || function (line) {
+        process.stdout.write(line + '\n');
+    };
+
+    this.groups = {};
+    this.timer = null;
+}
+
+/**
+ * Times a query promise and records it once it settles. Returns the promise.
+ */
+QueryStats.prototype.track = function track(obj, promise) {
+    if (!this.enabled) {
+        return promise;
+    }
+
+    const self = this,
+        start = process.hrtime();
+
+    function finish(error, response) {
+        const diff = process.hrtime(start),
+            rows = countRows(response);
+
+        self.record({
+            sql: obj.sql,
+            method: obj.method || 'raw',
+            durationMs: diff[0] * 1e3 + diff[1] / 1e6,
+            rowsReturned: rows.rowsReturned,
+            rowsAffected: rows.rowsAffected,
+            error: error
+        });
+    }
+
+    return promise.then(function (result) {
+        finish(null, result && result.response);
+        return result;
+    }, function (err) {
+        finish(err);
+        throw err;
+    });
+};
+
+QueryStats.prototype.record = function record(sample) {
+    const sql = fingerprint(sample.sql),
+        key = sample.method + ' ' + sql;
+
+    if (!this.groups[key]) {
+        this.groups[key] = new QueryGroup(sample.method, sql);
+    }
+    this.groups[key].record(sample, this.slowQueryMillis);
+
+    if (sample.durationMs >= this.slowQueryMillis) {
+        this.write(JSON.stringify({
+            msg: 'slow query',
+            method: sample.method,
+            fingerprint: sql,
+            durationMs: Math.round(sample.durationMs * 100) / 100,
+            rowsReturned: sample.rowsReturned,
+            rowsAffected: sample.rowsAffected,
+            error: sample.error ? sample.error.code || sample.error.message : undefined
+        }));
+    }
+};
+
+function emfLine(namespace, dimensions, values, properties) {
+    const names = Object.keys(values);
+
+    return JSON.stringify(Object.assign({
+        _aws: {
+            Timestamp: Date.now(),
+            CloudWatchMetrics: [{
+                Namespace: namespace,
+                Dimensions: [Object.keys(dimensions)],
+                Metrics: names.map(function (name) {
+                    return {Name: name, Unit: /^QueryTime/.test(name) ? 'Milliseconds' : 'Count'};
+                })
+            }]
+        }
+    }, dimensions, values, properties));
+}
+
+/**
+ * Writes the summary for the interval and starts a new one.
+ * Returns the lines written.
+ */
+QueryStats.prototype.flush = function flush() {
+    const self = this,
+        groups = Object.keys(this.groups).map(function (key) {
+            return self.groups[key];
+        }),
+        methods = {},
+        lines = [];
+
+    this.groups = {};
+
+    groups.forEach(function (group) {
+        if (!methods[group.method]) {
+            methods[group.method] = new QueryGroup(group.method, '');
+        }
+        const rollup = methods[group.method];
+
+        Object.keys(group.histogram.buckets).forEach(function (bucket) {
+            rollup.histogram.buckets[bucket] = (rollup.histogram.buckets[bucket] || 0) + group.histogram.buckets[bucket];
+        });
+        rollup.histogram.count += group.histogram.count;
+        rollup.totalMs += group.totalMs;
+        rollup.maxMs = Math.max(rollup.maxMs, group.maxMs);
+        rollup.rowsReturned += group.rowsReturned;
+        rollup.rowsAffected += group.rowsAffected;
+        rollup.errors += group.errors;
+        rollup.slow += group.slow;
+    });
+
+    Object.keys(methods).forEach(function (method) {
+        lines.push(emfLine(self.namespace, {Method: method}, methods[method].metrics()));
+    });
+
+    // Only the top queries get their own dimension, to keep the metric count bounded
+    groups.sort(function (a, b) {
+        return b.totalMs - a.totalMs;
+    }).slice(0, this.topN).forEach(function (group, rank) {
+        lines.push(emfLine(self.namespace, {Method: group.method, Query: group.id}, group.metrics(), {
+            rank: rank + 1,
+            fingerprint: group.sql
+        }));
+    });
+
+    lines.forEach(function (line) {
+        self.write(line);
+    });
+    return lines;
+};
+
+QueryStats.prototype.start = function start() {
+    const self = this;
+
+    if (!this.enabled || !this.intervalMillis || this.timer) {
+        return;
+    }
+    this.timer = setInterval(function () {
+        self.flush();
+    }, this.intervalMillis);
+    this.timer.unref();
+};
+
+QueryStats.prototype.stop = function stop() {
+    clearInterval(this.timer);
+    this.timer = null;
+};
+
+module.exports = QueryStats;
+module.exports.fingerprint = fingerprint;
+module.exports.Histogram = Histogram;
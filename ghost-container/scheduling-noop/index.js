@@ -0,0 +1,19 @@
+'use strict';
+
+/**
+ * A Ghost scheduling adapter that schedules nothing.
+ *
+ * In clustered mode (ghost-cluster.js) every worker but one is configured with
+ * `scheduling__active=ghost-scheduling-noop`, so scheduled posts are published
+ * once rather than once per worker. Ghost tries npm modules first when loading
+ * the active scheduling adapter, so this is copied into its node_modules.
+ */
+function SchedulingNoop() {
+    this.requiredFns = ['schedule', 'unschedule', 'run'];
+}
+
+SchedulingNoop.prototype.schedule = function schedule() {};
+SchedulingNoop.prototype.unschedule = function unschedule() {};
+SchedulingNoop.prototype.run = function run() {};
+
+module.exports = SchedulingNoop;
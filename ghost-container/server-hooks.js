@@ -0,0 +1,401 @@
+'use strict';
+
+/**
+ * Preloaded into Ghost with `node -r` (see the Dockerfile's CMD) to give it a
+ * graceful shutdown.
+ *
+ * Ghost exits as soon as it gets SIGTERM, dropping whatever requests are in
+ * flight. Instead, on SIGTERM (or SIGINT) we:
+ *  1. stop accepting new connections and close idle keep-alive ones,
+ *  2. let in-flight requests finish (answering them with `Connection: close`),
+ *  3. close the knex pool,
+ *  4. then run Ghost's own handlers, which log and exit.
+ * If that takes longer than GHOST_STOP_TIMEOUT (the container's StopTimeout, in
+ * seconds) less a 5 second margin, the remaining connections are dropped.
+ *
+ * It answers the health check at /healthz itself: 200 if the knex pool can
+ * hand out a connection, 503 if not or once shutting down. The result is
+ * cached for `server:healthz:cacheMillis` so frequent checks stay cheap.
+ *
+ * Behind CloudFront the ALB's X-Forwarded-Proto is http, the protocol CloudFront
+ * used, so a request's CloudFront-Forwarded-Proto (the viewer's protocol)
+ * replaces it. Ghost then sees https requests as secure and doesn't redirect them.
+ *
+ * It also sets the servers' keep-alive timeouts (`server:keepAliveTimeout` and
+ * `server:headersTimeout` in Ghost's config) above the ALB's idle timeout, so
+ * the ALB never reuses a connection Ghost is closing, and logs how long the
+ * container took to boot once Ghost is listening.
+ */
+const http = require('http'),
+    fs = require('fs'),
+    path = require('path');
+
+const SIGNALS = ['SIGTERM', 'SIGINT'],
+    STOP_MARGIN = 5000,
+    DEFAULT_TIMEOUT = 25000,
+    DEFAULT_KEEP_ALIVE_TIMEOUT = 65000,
+    HEALTHZ_PATH = '/healthz',
+    DEFAULT_HEALTHZ_CACHE = 5000,
+    DEFAULT_HEALTHZ_TIMEOUT = 2000,
+    // how much longer than the ALB's idle timeout a keep-alive connection is kept open
+    KEEP_ALIVE_MARGIN = 5000;
+
+const servers = [],
+    deferredHandlers = [];
+
+let shuttingDown = false,
+    health = {checkedAt: 0, result: null, pending: null};
+
+function log(message) {
+    console.log(JSON.stringify({msg: message, time: new Date().toISOString(), name: 'server-hooks'}));
+}
+
+/**
+ * Milliseconds since the host booted, the clock docker-entrypoint.sh times its phases with.
+ */
+function uptimeMs() {
+    return Math.round(parseFloat(fs.readFileSync('/proc/uptime', 'utf8')) * 1000);
+}
+
+/**
+ * Logs the entrypoint's phases, the time node took to start listening and the
+ * total time since the container's first process started, as one line.
+ */
+function logBootTimings() {
+    let phases = {},
+        sinceContainerStartMs;
+
+    try {
+        const now = uptimeMs(),
+            // field 22 of /proc/<pid>/stat is the start time in clock ticks (100 a second)
+            containerStart = parseInt(fs.readFileSync('/proc/1/stat', 'utf8').split(') ')[1].split(' ')[19], 10) * 10;
+
+        phases = JSON.parse('{' + (process.env.BOOT_PHASES || '') + '}');
+        if (process.env.BOOT_EXEC_AT) {
+            phases.node = now - parseInt(process.env.BOOT_EXEC_AT, 10);
+        }
+        sinceContainerStartMs = now - containerStart;
+    } catch (err) {
+        // not on Linux, or not started by docker-entrypoint.sh
+        return;
+    }
+
+    console.log(JSON.stringify({
+        msg: 'boot',
+        name: 'server-hooks',
+        time: new Date().toISOString(),
+        phases: phases,
+        fastBoot: process.env.BOOT_FAST === 'true',
+        sinceContainerStartMs: sinceContainerStartMs
+    }));
+}
+
+/**
+ * Returns a module of Ghost's that Ghost has already loaded, or null.
+ */
+function loadedGhostModule(relativePath) {
+    let modulePath;
+
+    try {
+        modulePath = require.resolve(path.resolve(relativePath));
+    } catch (err) {
+        return null;
+    }
+    return require.cache[modulePath] ? require.cache[modulePath].exports : null;
+}
+
+/**
+ * The keep-alive and headers timeouts from Ghost's config, raised if needed to
+ * outlast the ALB idle timeout (ALB_IDLE_TIMEOUT, in seconds).
+ */
+function keepAliveTimeouts() {
+    const config = loadedGhostModule('current/core/server/config'),
+        albIdleTimeout = parseInt(process.env.ALB_IDLE_TIMEOUT, 10) * 1000 || 0;
+    let keepAliveTimeout = parseInt(config && config.get('server:keepAliveTimeout'), 10) || DEFAULT_KEEP_ALIVE_TIMEOUT;
+
+    keepAliveTimeout = Math.max(keepAliveTimeout, albIdleTimeout + KEEP_ALIVE_MARGIN);
+    return {
+        keepAliveTimeout: keepAliveTimeout,
+        // must be longer than keepAliveTimeout or a reused connection can be cut mid-request
+        headersTimeout: Math.max(parseInt(config && config.get('server:headersTimeout'), 10) || 0, keepAliveTimeout + 1000)
+    };
+}
+
+/**
+ * Applies keepAliveTimeouts() to a server. Node 6 has neither setting and
+ * instead closes idle keep-alive connections after the server's socket
+ * timeout, so that is raised to the keep-alive timeout.
+ */
+function setKeepAlive(server) {
+    const timeouts = keepAliveTimeouts();
+
+    if (server.keepAliveTimeout === undefined) {
+        server.setTimeout(Math.max(server.timeout, timeouts.keepAliveTimeout));
+    } else {
+        server.keepAliveTimeout = timeouts.keepAliveTimeout;
+        server.headersTimeout = timeouts.headersTimeout;
+    }
+}
+
+function healthzSettings() {
+    const config = loadedGhostModule('current/core/server/config'),
+        settings = config && config.get('server:healthz') || {};
+
+    return {
+        cacheMillis: parseInt(settings.cacheMillis, 10) || DEFAULT_HEALTHZ_CACHE,
+        timeoutMillis: parseInt(settings.timeoutMillis, 10) || DEFAULT_HEALTHZ_TIMEOUT
+    };
+}
+
+/**
+ * Resolves with {ok, reason}: whether the knex pool can hand out a connection
+ * within the timeout. Concurrent checks share one acquire.
+ */
+function checkDatabase(timeoutMillis) {
+    const knex = loadedGhostModule('current/core/server/data/db/connection');
+
+    if (!knex || !knex.client) {
+        return Promise.resolve({ok: false, reason: 'database not connected yet'});
+    }
+
+    return new Promise(function (resolve) {
+        const timer = setTimeout(function () {
+            resolve({ok: false, reason: 'no connection within ' + timeoutMillis + 'ms'});
+        }, timeoutMillis);
+
+        Promise.resolve(knex.client.acquireConnection())
+            .then(function (connection) {
+                knex.client.releaseConnection(connection);
+                resolve({ok: true});
+            })
+            .catch(function (err) {
+                resolve({ok: false, reason: err.message});
+            })
+            .then(function () {
+                clearTimeout(timer);
+            });
+    });
+}
+
+function healthz(req, res) {
+    const settings = healthzSettings(),
+        now = Date.now();
+
+    function respond(result) {
+        const ok = result.ok && !shuttingDown;
+
+        res.statusCode = ok ? 200 : 503;
+        res.setHeader('Content-Type', 'application/json');
+        res.setHeader('Cache-Control', 'no-store');
+        res.end(JSON.stringify({
+            status: ok ? 'ok' : 'unavailable',
+            reason: shuttingDown ? 'shutting down' : result.reason,
+            checkedAt: new Date(health.checkedAt).toISOString()
+        }));
+    }
+
+    if (shuttingDown) {
+        return respond({ok: false});
+    }
+    if (health.result && now - health.checkedAt < settings.cacheMillis) {
+        return respond(health.result);
+    }
+    if (!health.pending) {
+        health.pending = checkDatabase(settings.timeoutMillis).then(function (result) {
+            health = {checkedAt: Date.now(), result: result, pending: null};
+            return result;
+        });
+    }
+    health.pending.then(respond);
+}
+
+/**
+ * Answers /healthz and sets the viewer's protocol before the server's own
+ * request handlers (Ghost's app) see the request.
+ */
+function interceptRequests(server) {
+    const handlers = server.listeners('request');
+
+    server.removeAllListeners('request');
+    server.on('request', function (req, res) {
+        if (req.url === HEALTHZ_PATH || req.url.indexOf(HEALTHZ_PATH + '?') === 0) {
+            return healthz(req, res);
+        }
+        if (req.headers['cloudfront-forwarded-proto']) {
+            req.headers['x-forwarded-proto'] = req.headers['cloudfront-forwarded-proto'];
+        }
+        handlers.forEach(function (handler) {
+            handler.call(server, req, res);
+        });
+    });
+}
+
+function shutdownTimeout() {
+    const stopTimeout = parseInt(process.env.GHOST_STOP_TIMEOUT, 10);
+    return stopTimeout ? Math.max(stopTimeout * 1000 - STOP_MARGIN, 1000) : DEFAULT_TIMEOUT;
+}
+
+/**
+ * Keeps track of a server's connections and whether each is mid-request.
+ */
+function track(server) {
+    const sockets = new Set();
+
+    interceptRequests(server);
+
+    server.on('connection', function (socket) {
+        socket.responses = new Set();
+        sockets.add(socket);
+        socket.on('close', function () {
+            sockets.delete(socket);
+        });
+    });
+
+    // ahead of the request handlers, so the request is tracked before it can finish
+    server.prependListener('request', function (req, res) {
+        const socket = req.socket;
+
+        socket.responses.add(res);
+        if (shuttingDown) {
+            res.setHeader('Connection', 'close');
+        }
+        function done() {
+            socket.responses.delete(res);
+            if (shuttingDown && socket.responses.size === 0) {
+                socket.end();
+            }
+        }
+
+        // 'close' without 'finish' is a client that went away mid-request
+        res.on('finish', done);
+        res.on('close', done);
+    });
+
+    setKeepAlive(server);
+    if (!servers.length) {
+        server.once('listening', logBootTimings);
+    }
+    servers.push({server: server, sockets: sockets});
+}
+
+function closeServer(entry) {
+    return new Promise(function (resolve) {
+        entry.server.close(resolve);
+        entry.sockets.forEach(function (socket) {
+            if (!socket.responses.size) {
+                return socket.end();
+            }
+            // Tell keep-alive clients not to send anything else on this connection
+            socket.responses.forEach(function (res) {
+                if (!res.headersSent) {
+                    res.setHeader('Connection', 'close');
+                }
+            });
+        });
+    });
+}
+
+/**
+ * Closes Ghost's knex pool, if Ghost got as far as opening it.
+ */
+function closeDatabase() {
+    const connection = loadedGhostModule('current/core/server/data/db/connection');
+
+    if (!connection) {
+        return Promise.resolve();
+    }
+    return Promise.resolve(connection.destroy());
+}
+
+function shutdown(signal) {
+    if (shuttingDown) {
+        return;
+    }
+    shuttingDown = true;
+
+    const start = Date.now(),
+        timeout = shutdownTimeout(),
+        inFlight = servers.reduce(function (total, entry) {
+            entry.sockets.forEach(function (socket) {
+                total += socket.responses.size;
+            });
+            return total;
+        }, 0);
+
+    log('Received ' + signal + ', draining ' + inFlight + ' in-flight requests (timeout ' + timeout + 'ms)');
+
+    const timer = setTimeout(function () {
+        log('Shutdown timed out, dropping the remaining connections');
+        servers.forEach(function (entry) {
+            entry.sockets.forEach(function (socket) {
+                socket.destroy();
+            });
+        });
+    }, timeout);
+    timer.unref();
+
+    Promise.all(servers.map(closeServer))
+        .then(function () {
+            log('HTTP server closed after ' + (Date.now() - start) + 'ms');
+            return closeDatabase();
+        })
+        .catch(function (err) {
+            log('Error during shutdown: ' + err.message);
+        })
+        .then(function () {
+            clearTimeout(timer);
+            log('Shutdown complete after ' + (Date.now() - start) + 'ms');
+            deferredHandlers.forEach(function (entry) {
+                if (entry.signal === signal) {
+                    entry.handler(signal);
+                }
+            });
+            process.exit(0);
+        });
+}
+
+// Track every HTTP server Ghost starts
+const listen = http.Server.prototype.listen;
+http.Server.prototype.listen = function () {
+    track(this);
+    return listen.apply(this, arguments);
+};
+
+// Hold on to the signal handlers Ghost registers and run them once we have drained
+['on', 'addListener', 'once'].forEach(function (method) {
+    const original = process[method];
+
+    process[method] = function (event, handler) {
+        if (SIGNALS.indexOf(event) !== -1) {
+            deferredHandlers.push({signal: event, handler: handler});
+            return process;
+        }
+        return original.apply(process, arguments);
+    };
+});
+
+const removeAllListeners = process.removeAllListeners;
+process.removeAllListeners = function (event) {
+    if (SIGNALS.indexOf(event) !== -1) {
+        for (let i = deferredHandlers.length - 1; i >= 0; i -= 1) {
+            if (deferredHandlers[i].signal === event) {
+                deferredHandlers.splice(i, 1);
+            }
+        }
+        return process;
+    }
+    return removeAllListeners.apply(process, arguments);
+};
+
+SIGNALS.forEach(function (signal) {
+    process.prependListener(signal, function () {
+        shutdown(signal);
+    });
+});
+
+module.exports = {
+    isShuttingDown: function isShuttingDown() {
+        return shuttingDown;
+    },
+    servers: servers
+};
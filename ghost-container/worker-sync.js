@@ -0,0 +1,128 @@
+'use strict';
+
+/**
+ * Preloaded into every Ghost worker by ghost-cluster.js (after server-hooks.js)
+ * to keep the workers' in-memory caches in step.
+ *
+ * Each worker has its own settings cache and active theme, and Ghost only
+ * updates them in the worker that handled the admin's request. So once Ghost is
+ * listening, every `settings.edited` event a worker sees is sent to the master
+ * with the setting's attributes, and the master passes it on to the other
+ * workers. They emit the same `settings.edited` and `settings.<key>.edited`
+ * events Ghost's Settings model does, which updates their settings cache and
+ * anything else listening. The setting travels with the message rather than
+ * being read again, which could hit a read replica that hasn't caught up.
+ *
+ * A new active theme, or a new upload of the active theme, is also loaded and
+ * activated in the other workers (the theme files are on the disk they share).
+ */
+const http = require('http'),
+    path = require('path');
+
+const MESSAGE = 'ghost-worker-sync';
+
+let subscribed = false,
+    // set while emitting a relayed event, so it isn't sent back to the master
+    relaying = false;
+
+function log(message) {
+    console.log(JSON.stringify({msg: message, time: new Date().toISOString(), name: 'worker-sync'}));
+}
+
+/**
+ * Returns the first of the modules of Ghost's that Ghost has already loaded, or null.
+ */
+function loadedGhostModule() {
+    for (let i = 0; i < arguments.length; i += 1) {
+        let modulePath;
+
+        try {
+            modulePath = require.resolve(path.join(__dirname, 'current', arguments[i]));
+        } catch (err) {
+            continue;
+        }
+        if (require.cache[modulePath]) {
+            return require.cache[modulePath].exports;
+        }
+    }
+    return null;
+}
+
+function send(message) {
+    if (!relaying) {
+        message.type = MESSAGE;
+        process.send(message);
+    }
+}
+
+/**
+ * Loads and activates the active theme again, as Ghost does on boot.
+ */
+function reloadActiveTheme(themes) {
+    if (!themes || typeof themes.init !== 'function') {
+        log('Ghost\'s theme service was not found, the active theme was not reloaded');
+        return;
+    }
+    Promise.resolve(themes.init()).catch(function (err) {
+        log('Reloading the active theme failed: ' + err.message);
+    });
+}
+
+function subscribe() {
+    const common = loadedGhostModule('core/server/lib/common'),
+        models = loadedGhostModule('core/server/models'),
+        settingsCache = loadedGhostModule('core/server/services/settings/cache', 'core/server/settings/cache'),
+        themes = loadedGhostModule('core/server/services/themes', 'core/server/themes');
+
+    if (subscribed) {
+        return;
+    }
+    subscribed = true;
+    if (!common || !common.events || !models || !models.Settings) {
+        log('Ghost\'s events or models were not found, this worker\'s caches are not kept in step');
+        return;
+    }
+
+    common.events.on('settings.edited', function (setting) {
+        send({event: 'settings.edited', setting: setting.toJSON()});
+    });
+    common.events.on('theme.uploaded', function (name) {
+        send({event: 'theme.uploaded', name: name});
+    });
+
+    process.on('message', function (message) {
+        if (!message || message.type !== MESSAGE) {
+            return;
+        }
+        relaying = true;
+        try {
+            if (message.event === 'settings.edited') {
+                const setting = models.Settings.forge(message.setting);
+
+                common.events.emit('settings.edited', setting);
+                common.events.emit('settings.' + message.setting.key + '.edited', setting);
+                if (message.setting.key === 'active_theme') {
+                    reloadActiveTheme(themes);
+                }
+            } else if (message.event === 'theme.uploaded') {
+                if (settingsCache && settingsCache.get('active_theme') === message.name) {
+                    reloadActiveTheme(themes);
+                }
+            }
+        } catch (err) {
+            log('Applying ' + message.event + ' from another worker failed: ' + err.message);
+        } finally {
+            relaying = false;
+        }
+    });
+}
+
+// Ghost's models and events are ready by the time it listens
+if (process.send) {
+    const listen = http.Server.prototype.listen;
+
+    http.Server.prototype.listen = function () {
+        this.once('listening', subscribe);
+        return listen.apply(this, arguments);
+    };
+}
@@ -1,14 +1,58 @@
 # Troposphere to create CloudFormation template of ghost ECS deployment
 # By Jason Umiker (jason.umiker@gmail.com)
 
-from troposphere import Parameter, Ref, Template, Output, GetAtt, ImportValue, Sub
+import os
+
+from troposphere import (
+    AWSObject, Parameter, Ref, Template, Output, GetAtt, ImportValue, Sub, If, Equals, Not, Or, Join, NoValue,
+    cloudformation, codedeploy
+)
+from troposphere.applicationautoscaling import (
+    ScalableTarget, ScalingPolicy, TargetTrackingScalingPolicyConfiguration,
+    PredefinedMetricSpecification
+)
 from troposphere.ecs import (
     Service, TaskDefinition, LoadBalancer,
     ContainerDefinition, NetworkConfiguration,
     AwsvpcConfiguration, PortMapping, Environment,
-    LogConfiguration
+    LogConfiguration, Volume, MountPoint, HealthCheck,
+    CapacityProviderStrategyItem, DeploymentConfiguration,
+    DeploymentCircuitBreaker, DeploymentController
 )
 
+
+class GhostMigration(cloudformation.AWSCustomObject):
+    resource_type = "Custom::GhostMigration"
+    props = {
+        'ServiceToken': (str, True),
+        'Cluster': (str, True),
+        'TaskDefinition': (str, True),
+        'Subnets': (list, True),
+        'SecurityGroups': (list, True)
+    }
+
+
+# troposphere's TaskDefinition predates Fargate's choice of CPU architecture
+class GhostTaskDefinition(TaskDefinition):
+    props = dict(TaskDefinition.props, RuntimePlatform=(dict, False))
+
+
+# troposphere's DeploymentGroup predates ECS blue/green deploys
+class ECSDeploymentGroup(AWSObject):
+    resource_type = "AWS::CodeDeploy::DeploymentGroup"
+    props = {
+        'ApplicationName': (str, True),
+        'DeploymentGroupName': (str, False),
+        'DeploymentConfigName': (str, False),
+        'ServiceRoleArn': (str, True),
+        'DeploymentStyle': (dict, True),
+        'BlueGreenDeploymentConfiguration': (dict, True),
+        'AutoRollbackConfiguration': (dict, False),
+        'ECSServices': (list, True),
+        'LoadBalancerInfo': (dict, True)
+    }
+
+
 t = Template()
 t.add_version('2010-09-09')
 
@@ -32,76 +76,642 @@ dependency_stack_name = t.add_parameter(Parameter(
     Description='The name of the Dependency Stack to retrieve CloudFormation Exports',
 ))
 
+db_pool_min = t.add_parameter(Parameter(
+    'DBPoolMin',
+    Type='Number',
+    Default='2',
+    MinValue='0',
+    Description='The number of DB connections each Ghost task keeps open (and opens before serving traffic).',
+))
+
+db_pool_max = t.add_parameter(Parameter(
+    'DBPoolMax',
+    Type='Number',
+    Default='10',
+    MinValue='1',
+    Description='The maximum number of DB connections per Ghost task.',
+))
+
+db_pool_acquire_timeout = t.add_parameter(Parameter(
+    'DBPoolAcquireTimeout',
+    Type='Number',
+    Default='60000',
+    MinValue='1000',
+    Description='How long (ms) a query waits for a free DB connection before failing.',
+))
+
+db_pool_idle_timeout = t.add_parameter(Parameter(
+    'DBPoolIdleTimeout',
+    Type='Number',
+    Default='30000',
+    MinValue='1000',
+    Description='How long (ms) a DB connection above the minimum can sit idle before it is closed.',
+))
+
+db_pool_stats_interval = t.add_parameter(Parameter(
+    'DBPoolStatsInterval',
+    Type='Number',
+    Default='60000',
+    MinValue='0',
+    Description='How often (ms) to log DB pool stats (0 to disable).',
+))
+
+db_read_your_writes_window = t.add_parameter(Parameter(
+    'DBReadYourWritesWindow',
+    Type='Number',
+    Default='2000',
+    MinValue='0',
+    Description='How long (ms) after a write a Ghost task keeps its reads on the primary instead of the read replicas.',
+))
+
+db_slow_query_millis = t.add_parameter(Parameter(
+    'DBSlowQueryMillis',
+    Type='Number',
+    Default='500',
+    MinValue='0',
+    Description='Queries slower than this (ms) are logged individually.',
+))
+
+micro_cache = t.add_parameter(Parameter(
+    'MicroCache',
+    Type='String',
+    Default='false',
+    AllowedValues=['true', 'false'],
+    Description='Put an nginx micro-cache sidecar in front of Ghost for anonymous GET requests.',
+))
+
+micro_cache_ttl = t.add_parameter(Parameter(
+    'MicroCacheTTL',
+    Type='Number',
+    Default='10',
+    MinValue='1',
+    Description='How long (seconds) the micro-cache serves a page before asking Ghost again. A change purges the cache of the task that saved it, the other tasks show it after this long.',
+))
+
+min_tasks = t.add_parameter(Parameter(
+    'MinTasks',
+    Type='Number',
+    Default='1',
+    MinValue='1',
+    Description='The minimum number of Ghost tasks.',
+))
+
+max_tasks = t.add_parameter(Parameter(
+    'MaxTasks',
+    Type='Number',
+    Default='4',
+    MinValue='1',
+    Description='The maximum number of Ghost tasks.',
+))
+
+cpu_target = t.add_parameter(Parameter(
+    'CPUTarget',
+    Type='Number',
+    Default='60',
+    MinValue='1',
+    MaxValue='100',
+    Description='The average CPU utilization (%) to keep the Ghost tasks at.',
+))
+
+requests_per_target = t.add_parameter(Parameter(
+    'RequestsPerTarget',
+    Type='Number',
+    Default='1000',
+    MinValue='1',
+    Description='The number of ALB requests per minute to keep each Ghost task at (rolling deploys only).',
+))
+
+scale_out_cooldown = t.add_parameter(Parameter(
+    'ScaleOutCooldown',
+    Type='Number',
+    Default='60',
+    MinValue='0',
+    Description='How long (seconds) after a scale-out before scaling out again.',
+))
+
+scale_in_cooldown = t.add_parameter(Parameter(
+    'ScaleInCooldown',
+    Type='Number',
+    Default='300',
+    MinValue='0',
+    Description='How long (seconds) after a scaling activity before scaling in.',
+))
+
+stop_timeout = t.add_parameter(Parameter(
+    'StopTimeout',
+    Type='Number',
+    Default='30',
+    MinValue='6',
+    MaxValue='120',
+    Description='How long (seconds) Ghost gets to drain its requests and close its DB pool after SIGTERM before it is killed.',
+))
+
+ghost_workers = t.add_parameter(Parameter(
+    'GhostWorkers',
+    Type='Number',
+    Default='0',
+    MinValue='0',
+    Description='The number of Ghost processes per task (0 for one per vCPU). Each has its own DB pool.',
+))
+
+cpu_architecture = t.add_parameter(Parameter(
+    'CpuArchitecture',
+    Type='String',
+    Default='X86_64',
+    AllowedValues=['X86_64', 'ARM64'],
+    Description='The CPU architecture of the Ghost tasks. ARM64 runs on Graviton, which Fargate charges about 20% less for. '
+                'The GhostImage must have an image for it (the pipeline builds both).',
+))
+
+deployment_type = t.add_parameter(Parameter(
+    'DeploymentType',
+    Type='String',
+    Default='rolling',
+    AllowedValues=['rolling', 'blue-green'],
+    Description='rolling replaces tasks in place, blue-green has CodeDeploy start a second set and switch the ALB to it '
+                '(needs the dependency stack\'s BlueGreen set to true).',
+))
+
+minimum_healthy_percent = t.add_parameter(Parameter(
+    'MinimumHealthyPercent',
+    Type='Number',
+    Default='100',
+    MinValue='0',
+    MaxValue='100',
+    Description='The share of the desired tasks (%) that must stay running and healthy during a rolling deploy.',
+))
+
+maximum_percent = t.add_parameter(Parameter(
+    'MaximumPercent',
+    Type='Number',
+    Default='200',
+    MinValue='100',
+    MaxValue='200',
+    Description='How many tasks (% of the desired count) a rolling deploy can run at once, old and new.',
+))
+
+blue_green_traffic_shift = t.add_parameter(Parameter(
+    'BlueGreenTrafficShift',
+    Type='String',
+    Default='CodeDeployDefault.ECSAllAtOnce',
+    AllowedValues=['CodeDeployDefault.ECSAllAtOnce',
+                   'CodeDeployDefault.ECSCanary10Percent5Minutes',
+                   'CodeDeployDefault.ECSCanary10Percent15Minutes',
+                   'CodeDeployDefault.ECSLinear10PercentEvery1Minutes',
+                   'CodeDeployDefault.ECSLinear10PercentEvery3Minutes'],
+    Description='How a blue-green deploy moves the traffic to the new tasks.',
+))
+
+blue_green_termination_wait = t.add_parameter(Parameter(
+    'BlueGreenTerminationWait',
+    Type='Number',
+    Default='30',
+    MinValue='0',
+    MaxValue='2880',
+    Description='How long (minutes) a blue-green deploy keeps the old tasks after the switch, so a rollback is instant.',
+))
+
+# The memory (MiB) Fargate allows with each task CPU size
+fargate_task_sizes = {
+    '256': ['512', '1024', '2048'],
+    '512': [str(mib) for mib in range(1024, 4097, 1024)],
+    '1024': [str(mib) for mib in range(2048, 8193, 1024)],
+    '2048': [str(mib) for mib in range(4096, 16385, 1024)],
+    '4096': [str(mib) for mib in range(8192, 30721, 1024)],
+}
+
+task_cpu = t.add_parameter(Parameter(
+    'TaskCpu',
+    Type='String',
+    Default='512',
+    AllowedValues=sorted(fargate_task_sizes, key=int),
+    Description='The CPU units of each Ghost task (1024 is one vCPU).',
+))
+
+task_memory = t.add_parameter(Parameter(
+    'TaskMemory',
+    Type='String',
+    Default='1024',
+    AllowedValues=sorted(set(sum(fargate_task_sizes.values(), [])), key=int),
+    Description='The memory (MiB) of each Ghost task. Must be a valid Fargate combination with TaskCpu.',
+))
+
+fargate_base = t.add_parameter(Parameter(
+    'FargateBase',
+    Type='Number',
+    Default='1',
+    MinValue='0',
+    Description='The number of Ghost tasks that always run on regular (on-demand) Fargate.',
+))
+
+fargate_weight = t.add_parameter(Parameter(
+    'FargateWeight',
+    Type='Number',
+    Default='1',
+    MinValue='0',
+    Description='The relative share of the tasks above FargateBase that run on regular Fargate.',
+))
+
+fargate_spot_weight = t.add_parameter(Parameter(
+    'FargateSpotWeight',
+    Type='Number',
+    Default='0',
+    MinValue='0',
+    Description='The relative share of the tasks above FargateBase that run on Fargate Spot (0 for none).',
+))
+
+# Reject CPU/memory combinations Fargate doesn't offer before anything is created
+for cpu, memory in sorted(fargate_task_sizes.items(), key=lambda size: int(size[0])):
+    t.add_rule('TaskSize' + cpu, {
+        'RuleCondition': Equals(Ref(task_cpu), cpu),
+        'Assertions': [{
+            'Assert': {'Fn::Contains': [memory, Ref(task_memory)]},
+            'AssertDescription': 'With TaskCpu ' + cpu + ' TaskMemory must be one of ' + ', '.join(memory)
+        }]
+    })
+
+# With both weights 0 the capacity provider strategy is invalid and nothing above FargateBase could run
+t.add_rule('CapacityWeights', {
+    'Assertions': [{
+        'Assert': Or(Not(Equals(Ref(fargate_weight), '0')), Not(Equals(Ref(fargate_spot_weight), '0'))),
+        'AssertDescription': 'At least one of FargateWeight and FargateSpotWeight must be greater than 0'
+    }]
+})
+
+# Fargate Spot has no ARM64 capacity, so Spot's share of the tasks could never be placed
+t.add_rule('SpotArchitecture', {
+    'RuleCondition': Equals(Ref(cpu_architecture), 'ARM64'),
+    'Assertions': [{
+        'Assert': Equals(Ref(fargate_spot_weight), '0'),
+        'AssertDescription': 'Fargate Spot does not run ARM64 tasks, so FargateSpotWeight must be 0 with CpuArchitecture ARM64'
+    }]
+})
+
+# Create the Conditions
+
+t.add_condition('UseMicroCache', Equals(Ref(micro_cache), 'true'))
+t.add_condition('UseBlueGreen', Equals(Ref(deployment_type), 'blue-green'))
+t.add_condition('UseRolling', Equals(Ref(deployment_type), 'rolling'))
+
 # Create the Resources
 
-ghost_task_definition = t.add_resource(TaskDefinition(
+# The environment shared by the Ghost service and its one-shot migration task
+ghost_environment = [
+    Environment(
+        Name='url',
+        Value=ImportValue(Sub("${DependencyStackName}-SiteURL")),
+    ),
+    Environment(
+        Name='database__client',
+        Value='mysql2'
+    ),
+    Environment(
+        Name='database__connection__host',
+        Value=ImportValue(Sub("${DependencyStackName}-GhostDBHost")),
+    ),
+    Environment(
+        Name='database__connection__user',
+        Value='ghost'
+    ),
+    Environment(
+        Name='database__connection__database',
+        Value='ghost'
+    ),
+    Environment(
+        Name='AWSREGION',
+        Value=Ref('AWS::Region')
+    ),
+    # Store uploaded images in S3 with the s3 storage adapter
+    Environment(
+        Name='storage__active',
+        Value='s3'
+    ),
+    Environment(
+        Name='storage__s3__bucket',
+        Value=ImportValue(Sub("${DependencyStackName}-ImagesBucket")),
+    ),
+    Environment(
+        Name='storage__s3__assetHost',
+        Value=ImportValue(Sub("${DependencyStackName}-ImagesURL")),
+    )
+]
+
+ghost_subnets = [ImportValue(Sub("${DependencyStackName}-Subnet1")), ImportValue(Sub("${DependencyStackName}-Subnet2"))]
+ghost_security_groups = [ImportValue(Sub("${DependencyStackName}-GhostSG"))]
+
+
+def ghost_log_configuration(stream_prefix):
+    return LogConfiguration(
+        LogDriver='awslogs',
+        Options={'awslogs-group': ImportValue(Sub("${DependencyStackName}-GhostLogGroupName")),
+                 'awslogs-region': Ref('AWS::Region'),
+                 'awslogs-stream-prefix': stream_prefix}
+    )
+
+
+# The sidecar's nginx config is shared with the local benchmark in benchmarks/
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'micro-cache', 'nginx.conf')) as f:
+    micro_cache_config = f.read()
+
+# With the micro-cache enabled nginx takes over port 2368 and Ghost moves to 2369
+ghost_port = If('UseMicroCache', 2369, 2368)
+micro_cache_volume = 'micro-cache'
+micro_cache_dir = '/var/cache/nginx/micro-cache'
+
+micro_cache_container = ContainerDefinition(
+    Name='micro-cache',
+    Image='nginx:1.19-alpine',
+    Essential=True,
+    PortMappings=[PortMapping(ContainerPort=2368)],
+    EntryPoint=['/bin/sh', '-c'],
+    Command=['printf \'%s\' "$NGINX_CONF" > /etc/nginx/conf.d/default.conf && exec nginx -g \'daemon off;\''],
+    Environment=[
+        Environment(
+            Name='NGINX_CONF',
+            Value=Sub(micro_cache_config)
+        )
+    ],
+    MountPoints=[MountPoint(ContainerPath=micro_cache_dir, SourceVolume=micro_cache_volume)],
+    LogConfiguration=ghost_log_configuration('micro-cache')
+)
+
+ghost_task_definition = t.add_resource(GhostTaskDefinition(
     'GhostTaskDefinition',
+    # blue-green deploys register new revisions of it from the build (see ghost-container/blue-green-artifacts.py)
+    Family='ghost',
     RequiresCompatibilities=['FARGATE'],
-    Cpu='512',
-    Memory='1GB',
+    RuntimePlatform={
+        'CpuArchitecture': Ref(cpu_architecture),
+        'OperatingSystemFamily': 'LINUX'
+    },
+    Cpu=Ref(task_cpu),
+    Memory=Ref(task_memory),
     NetworkMode='awsvpc',
     TaskRoleArn=ImportValue(Sub("${DependencyStackName}-TaskRoleArn")),
     ExecutionRoleArn=ImportValue(Sub("${DependencyStackName}-TaskExecutionRoleArn")),
+    Volumes=[Volume(Name=micro_cache_volume)],
     ContainerDefinitions=[
         ContainerDefinition(
             Name='ghost',
             Image=Ref(ghost_image),
             Essential=True,
-            PortMappings=[PortMapping(ContainerPort=2368)],
-            Environment=[
+            PortMappings=[PortMapping(ContainerPort=ghost_port)],
+            StopTimeout=Ref(stop_timeout),
+            # The same cheap check as the ALB's, straight to Ghost (server__port is set with the micro-cache)
+            HealthCheck=HealthCheck(
+                Command=['CMD-SHELL', 'wget -q -O /dev/null "http://127.0.0.1:${server__port:-2368}/healthz" || exit 1'],
+                Interval=30,
+                Timeout=5,
+                Retries=3,
+                StartPeriod=120
+            ),
+            # Ghost's side of the shared cache volume, emptied by the purge helper
+            MountPoints=If('UseMicroCache',
+                           [MountPoint(ContainerPath=micro_cache_dir, SourceVolume=micro_cache_volume)],
+                           Ref('AWS::NoValue')),
+            Environment=ghost_environment + [
+                # Ghost stops waiting for in-flight requests 5 seconds before it would be killed
+                Environment(
+                    Name='GHOST_STOP_TIMEOUT',
+                    Value=Ref(stop_timeout)
+                ),
                 Environment(
-                    Name='url',
-                    Value=ImportValue(Sub("${DependencyStackName}-ALBURL")),
+                    Name='GHOST_WORKERS',
+                    Value=Ref(ghost_workers)
                 ),
+                # Ghost keeps keep-alive connections open longer than the ALB
                 Environment(
-                    Name='database__client',
-                    Value='mysql2'
+                    Name='ALB_IDLE_TIMEOUT',
+                    Value=ImportValue(Sub("${DependencyStackName}-ALBIdleTimeout"))
                 ),
                 Environment(
-                    Name='database__connection__host',
-                    Value=ImportValue(Sub("${DependencyStackName}-GhostDBHost")),
+                    Name='server__port',
+                    Value=If('UseMicroCache', '2369', '2368')
                 ),
+                If('UseMicroCache', Environment(
+                    Name='MICRO_CACHE_DIR',
+                    Value=micro_cache_dir
+                ), Ref('AWS::NoValue')),
+                # The schema is migrated by the GhostMigration task before the service is updated
                 Environment(
-                    Name='database__connection__user',
-                    Value='ghost'
+                    Name='GHOST_MIGRATE_ON_BOOT',
+                    Value='false'
                 ),
                 Environment(
-                    Name='database__connection__database',
-                    Value='ghost'
+                    Name='database__pool__min',
+                    Value=Ref(db_pool_min)
                 ),
                 Environment(
-                    Name='AWSREGION',
-                    Value=Ref('AWS::Region')
+                    Name='database__pool__max',
+                    Value=Ref(db_pool_max)
+                ),
+                Environment(
+                    Name='database__pool__acquireTimeoutMillis',
+                    Value=Ref(db_pool_acquire_timeout)
+                ),
+                Environment(
+                    Name='database__pool__idleTimeoutMillis',
+                    Value=Ref(db_pool_idle_timeout)
+                ),
+                Environment(
+                    Name='database__pool__statsIntervalMillis',
+                    Value=Ref(db_pool_stats_interval)
+                ),
+                # Reads are routed to these (the migration task only talks to the primary)
+                Environment(
+                    Name='database__replicas__hosts',
+                    Value=ImportValue(Sub("${DependencyStackName}-GhostDBReadHosts"))
+                ),
+                Environment(
+                    Name='database__replicas__readYourWritesWindow',
+                    Value=Ref(db_read_your_writes_window)
+                ),
+                Environment(
+                    Name='database__queryStats__slowQueryMillis',
+                    Value=Ref(db_slow_query_millis)
                 )
             ],
-            LogConfiguration=LogConfiguration(
-                LogDriver='awslogs',
-                Options={'awslogs-group': ImportValue(Sub("${DependencyStackName}-GhostLogGroupName")),
-                         'awslogs-region': Ref('AWS::Region'),
-                         'awslogs-stream-prefix': 'ghost'}
-            )
+            LogConfiguration=ghost_log_configuration('ghost')
+        ),
+        If('UseMicroCache', micro_cache_container, Ref('AWS::NoValue'))
+    ]
+))
+
+# Runs knex-migrator once per deploy instead of on every container start
+ghost_migration_task_definition = t.add_resource(GhostTaskDefinition(
+    'GhostMigrationTaskDefinition',
+    RequiresCompatibilities=['FARGATE'],
+    RuntimePlatform={
+        'CpuArchitecture': Ref(cpu_architecture),
+        'OperatingSystemFamily': 'LINUX'
+    },
+    Cpu='256',
+    Memory='512',
+    NetworkMode='awsvpc',
+    TaskRoleArn=ImportValue(Sub("${DependencyStackName}-TaskRoleArn")),
+    ExecutionRoleArn=ImportValue(Sub("${DependencyStackName}-TaskExecutionRoleArn")),
+    ContainerDefinitions=[
+        ContainerDefinition(
+            Name='ghost-migration',
+            Image=Ref(ghost_image),
+            Essential=True,
+            Command=['knex-migrator-migrate', '--init', '--mgpath', '/var/lib/ghost/current'],
+            Environment=ghost_environment,
+            LogConfiguration=ghost_log_configuration('ghost-migration')
         )
     ]
 ))
 
+# A new image means a new migration task definition, which re-runs the migration on stack update
+ghost_migration = t.add_resource(GhostMigration(
+    'GhostMigration',
+    ServiceToken=ImportValue(Sub("${DependencyStackName}-MigrationFunctionArn")),
+    Cluster=Ref(cluster),
+    TaskDefinition=Ref(ghost_migration_task_definition),
+    Subnets=ghost_subnets,
+    SecurityGroups=ghost_security_groups
+))
+
 ghost_service = t.add_resource(Service(
     'GhostService',
     Cluster=Ref(cluster),
-    DesiredCount=1,
+    # No DesiredCount - it is owned by the scalable target below, so a deploy doesn't reset it
     TaskDefinition=Ref(ghost_task_definition),
-    LaunchType='FARGATE',
+    # FargateBase tasks on regular Fargate, the rest split between it and Fargate Spot.
+    # CodeDeploy's blue/green deploys only support a launch type
+    CapacityProviderStrategy=If('UseBlueGreen', NoValue, [
+        CapacityProviderStrategyItem(
+            CapacityProvider='FARGATE',
+            Base=Ref(fargate_base),
+            Weight=Ref(fargate_weight)
+        ),
+        CapacityProviderStrategyItem(
+            CapacityProvider='FARGATE_SPOT',
+            Weight=Ref(fargate_spot_weight)
+        )
+    ]),
+    LaunchType=If('UseBlueGreen', 'FARGATE', NoValue),
+    DeploymentController=DeploymentController(
+        Type=If('UseBlueGreen', 'CODE_DEPLOY', 'ECS')
+    ),
+    # A rolling deploy whose new tasks keep failing to start or pass their health
+    # checks is stopped and rolled back to the last deploy that worked
+    DeploymentConfiguration=DeploymentConfiguration(
+        MinimumHealthyPercent=Ref(minimum_healthy_percent),
+        MaximumPercent=Ref(maximum_percent),
+        DeploymentCircuitBreaker=If('UseBlueGreen', NoValue, DeploymentCircuitBreaker(
+            Enable=True,
+            Rollback=True
+        ))
+    ),
     LoadBalancers=[
         LoadBalancer(
-            ContainerName='ghost',
+            ContainerName=If('UseMicroCache', 'micro-cache', 'ghost'),
             ContainerPort=2368,
             TargetGroupArn=ImportValue(Sub("${DependencyStackName}-GhostTG"))
         )
     ],
     NetworkConfiguration=NetworkConfiguration(
         AwsvpcConfiguration=AwsvpcConfiguration(
-            Subnets=[ImportValue(Sub("${DependencyStackName}-Subnet1")), ImportValue(Sub("${DependencyStackName}-Subnet2"))],
-            SecurityGroups=[ImportValue(Sub("${DependencyStackName}-GhostSG"))],
+            Subnets=ghost_subnets,
+            SecurityGroups=ghost_security_groups,
         )
+    ),
+    DependsOn=ghost_migration
+))
+
+# With DeploymentType blue-green, deploys of a new image go through CodeDeploy
+# (the pipeline's CodeDeployToECS action) rather than this stack. It starts the
+# new tasks behind the second target group, runs the migration hook and lets the
+# test listener reach them, then switches the listener and keeps the old tasks
+# for BlueGreenTerminationWait minutes to roll back to.
+ghost_codedeploy_application = t.add_resource(codedeploy.Application(
+    'GhostCodeDeployApplication',
+    Condition='UseBlueGreen',
+    ApplicationName='ghost',
+    ComputePlatform='ECS'
+))
+
+ghost_deployment_group = t.add_resource(ECSDeploymentGroup(
+    'GhostDeploymentGroup',
+    Condition='UseBlueGreen',
+    ApplicationName=Ref(ghost_codedeploy_application),
+    DeploymentGroupName='ghost',
+    DeploymentConfigName=Ref(blue_green_traffic_shift),
+    ServiceRoleArn=ImportValue(Sub("${DependencyStackName}-CodeDeployRoleArn")),
+    DeploymentStyle={
+        'DeploymentType': 'BLUE_GREEN',
+        'DeploymentOption': 'WITH_TRAFFIC_CONTROL'
+    },
+    BlueGreenDeploymentConfiguration={
+        'DeploymentReadyOption': {'ActionOnTimeout': 'CONTINUE_DEPLOYMENT'},
+        'TerminateBlueInstancesOnDeploymentSuccess': {
+            'Action': 'TERMINATE',
+            'TerminationWaitTimeInMinutes': Ref(blue_green_termination_wait)
+        }
+    },
+    AutoRollbackConfiguration={
+        'Enabled': True,
+        'Events': ['DEPLOYMENT_FAILURE', 'DEPLOYMENT_STOP_ON_REQUEST']
+    },
+    ECSServices=[{
+        'ClusterName': Ref(cluster),
+        'ServiceName': GetAtt(ghost_service, 'Name')
+    }],
+    LoadBalancerInfo={
+        'TargetGroupPairInfoList': [{
+            'TargetGroups': [
+                {'Name': ImportValue(Sub("${DependencyStackName}-ALBTGNAME"))},
+                {'Name': ImportValue(Sub("${DependencyStackName}-ALBTGGREENNAME"))}
+            ],
+            'ProdTrafficRoute': {'ListenerArns': [ImportValue(Sub("${DependencyStackName}-ListenerArn"))]},
+            'TestTrafficRoute': {'ListenerArns': [ImportValue(Sub("${DependencyStackName}-TestListenerArn"))]}
+        }]
+    }
+))
+
+# Scale the service on whichever of CPU and requests per task needs more tasks
+ghost_scalable_target = t.add_resource(ScalableTarget(
+    'GhostScalableTarget',
+    MinCapacity=Ref(min_tasks),
+    MaxCapacity=Ref(max_tasks),
+    ResourceId=Join('/', ['service', Ref(cluster), GetAtt(ghost_service, 'Name')]),
+    RoleARN=Sub("arn:aws:iam::${AWS::AccountId}:role/aws-service-role/ecs.application-autoscaling.amazonaws.com/"
+                "AWSServiceRoleForApplicationAutoScaling_ECSService"),
+    ScalableDimension='ecs:service:DesiredCount',
+    ServiceNamespace='ecs'
+))
+
+t.add_resource(ScalingPolicy(
+    'GhostCPUScalingPolicy',
+    PolicyName='GhostCPUTargetTracking',
+    PolicyType='TargetTrackingScaling',
+    ScalingTargetId=Ref(ghost_scalable_target),
+    TargetTrackingScalingPolicyConfiguration=TargetTrackingScalingPolicyConfiguration(
+        PredefinedMetricSpecification=PredefinedMetricSpecification(
+            PredefinedMetricType='ECSServiceAverageCPUUtilization'
+        ),
+        TargetValue=Ref(cpu_target),
+        ScaleOutCooldown=Ref(scale_out_cooldown),
+        ScaleInCooldown=Ref(scale_in_cooldown)
+    )
+))
+
+# Only with rolling deploys, as a blue/green switch moves the traffic off the target group this watches
+t.add_resource(ScalingPolicy(
+    'GhostRequestCountScalingPolicy',
+    Condition='UseRolling',
+    PolicyName='GhostRequestCountTargetTracking',
+    PolicyType='TargetTrackingScaling',
+    ScalingTargetId=Ref(ghost_scalable_target),
+    TargetTrackingScalingPolicyConfiguration=TargetTrackingScalingPolicyConfiguration(
+        PredefinedMetricSpecification=PredefinedMetricSpecification(
+            PredefinedMetricType='ALBRequestCountPerTarget',
+            ResourceLabel=ImportValue(Sub("${DependencyStackName}-GhostTGResourceLabel"))
+        ),
+        TargetValue=Ref(requests_per_target),
+        ScaleOutCooldown=Ref(scale_out_cooldown),
+        ScaleInCooldown=Ref(scale_in_cooldown)
     )
 ))
 
@@ -114,4 +724,11 @@ t.add_output(Output(
     Description="Ghost Fargate Service Name"
 ))
 
-print(t.to_json())
\ No newline at end of file
+t.add_output(Output(
+    "GhostDeploymentGroup",
+    Condition="UseBlueGreen",
+    Value=Ref(ghost_deployment_group),
+    Description="The CodeDeploy deployment group for blue-green deploys of the Ghost service"
+))
+
+print(t.to_json())
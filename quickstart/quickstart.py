@@ -321,9 +321,11 @@ cloud9_condition = t.add_condition("Cloud9Condition", Equals(Ref(deploy_cloud9),
 
 
 # Create the ECS Cluster
+# Ghost's service spreads its tasks over regular Fargate and Fargate Spot
 ECSCluster = t.add_resource(ecs.Cluster(
     "ECSCluster",
-    ClusterName="Ghost"
+    ClusterName="Ghost",
+    CapacityProviders=["FARGATE", "FARGATE_SPOT"]
 ))
 
 # Create the CodeCommit Repo